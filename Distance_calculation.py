@@ -1,48 +1,502 @@
 import csv
 import numpy as np
-from scipy.spatial.distance import euclidean
-from collections import defaultdict
 
-# Initialize data structures to store player tracking information
-player_positions = defaultdict(list)  # Tracks positions for each player ID
-player_distances = defaultdict(float)  # Accumulated distances for each player ID
-player_velocities = defaultdict(list)  # Tracks velocities for each player ID
-player_accelerations = defaultdict(list)  # Tracks accelerations for each player ID
+# Per track ID arrays of a `KinematicsSession`, grown together
+ACCUMULATORS = ("last_center", "position_count", "distance", "last_velocity", "velocity_count",
+                "acceleration_sum", "acceleration_count")
 
-def update_distances(resultsTracker, pixel_to_meter, fps):
+
+class KinematicsSession:
+    """
+    Distance, velocity and acceleration of every tracked player of one match.
+
+    All per-player state lives in NumPy arrays indexed by track ID and every
+    frame is processed in one vectorised step, so several matches can be
+    analysed in the same process by using one session each.
+
+    Args:
+        pixel_to_meter (float): Conversion factor from pixels to meters.
+        fps (float): Frames per second of the video.
+        capacity (int): Initial number of track IDs and history rows; both grow on demand.
+        calibration (PitchCalibration): Optional pitch homography (see `calibration.py`).
+            When set, positions are the players' foot points projected to pitch metres
+            and `pixel_to_meter` is ignored.
+    """
+
+    def __init__(self, pixel_to_meter, fps, capacity=256, calibration=None):
+        self.calibration = calibration
+        self.pixel_to_meter = 1.0 if calibration is not None else pixel_to_meter
+        self.fps = fps
+        self.time_interval = 1 / fps  # Time interval per frame in seconds
+        self.frame_count = 0
+
+        # Per track ID accumulators
+        position_dtype = np.float64 if calibration is not None else np.int64
+        self.last_center = np.zeros((capacity, 2), dtype=position_dtype)
+        self.position_count = np.zeros(capacity, dtype=np.int64)
+        self.distance = np.zeros(capacity)
+        self.last_velocity = np.zeros(capacity)
+        self.velocity_count = np.zeros(capacity, dtype=np.int64)
+        self.acceleration_sum = np.zeros(capacity)
+        self.acceleration_count = np.zeros(capacity, dtype=np.int64)
+
+        # Position history, one row per tracked box: frame, track ID, centre
+        self._rows = 0
+        self._frames = np.zeros(capacity, dtype=np.int32)
+        self._ids = np.zeros(capacity, dtype=np.int32)
+        self._centers = np.zeros((capacity, 2), dtype=np.float32 if calibration is not None else np.int32)
+
+    @staticmethod
+    def _grow(array, size):
+        if len(array) >= size:
+            return array
+        grown = np.zeros((max(size, 2 * len(array)),) + array.shape[1:], dtype=array.dtype)
+        grown[:len(array)] = array
+        return grown
+
+    def _reserve(self, max_id, rows):
+        if max_id >= len(self.distance):
+            for name in ACCUMULATORS:
+                setattr(self, name, self._grow(getattr(self, name), max_id + 1))
+        if self._rows + rows > len(self._ids):
+            self._frames = self._grow(self._frames, self._rows + rows)
+            self._ids = self._grow(self._ids, self._rows + rows)
+            self._centers = self._grow(self._centers, self._rows + rows)
+
+    def update(self, resultsTracker):
+        """
+        Update distances, velocities and accelerations with one frame's tracker results.
+
+        Args:
+            resultsTracker (np.ndarray): (N, 5) array of tracked objects [x1, y1, x2, y2, track_id].
+        """
+        frame = self.frame_count
+        self.frame_count += 1
+        results = np.asarray(resultsTracker, dtype=float).reshape(-1, 5)
+        if len(results) == 0:
+            return
+        boxes = np.trunc(results).astype(np.int64)
+        ids = boxes[:, 4]
+        if self.calibration is not None:
+            centers = self.calibration.project_boxes(results[:, :4])  # Foot points on the pitch, in metres
+        else:
+            centers = (boxes[:, 0:2] + boxes[:, 2:4]) // 2  # Centres of the bounding boxes
+        self._reserve(int(ids.max()), len(ids))
+
+        # Players seen before move from their previous centre
+        seen = self.position_count[ids] > 0
+        moved = ids[seen]
+        step = centers[seen] - self.last_center[moved]
+        distance = np.hypot(step[:, 0], step[:, 1]) * self.pixel_to_meter  # Convert distance to meters
+        self.distance[moved] += distance
+
+        # Velocity in meters per second, acceleration once two velocities exist
+        velocity = distance / self.time_interval
+        has_previous = self.velocity_count[moved] > 0
+        accelerating = moved[has_previous]
+        self.acceleration_sum[accelerating] += \
+            (velocity[has_previous] - self.last_velocity[accelerating]) / self.time_interval  # a = (v_f - v_i) / t
+        self.acceleration_count[accelerating] += 1
+        self.last_velocity[moved] = velocity
+        self.velocity_count[moved] += 1
+
+        self.last_center[ids] = centers
+        self.position_count[ids] += 1
+
+        rows = slice(self._rows, self._rows + len(ids))
+        self._frames[rows] = frame
+        self._ids[rows] = ids
+        self._centers[rows] = centers
+        self._rows += len(ids)
+
+    def get_state(self):
+        """
+        Returns the per track ID accumulators and the frame count as a
+        {name: np.ndarray} dict, for `checkpoint.py`. Their size grows with
+        the number of IDs, not the match length; the position history is
+        saved separately from `history()`.
+        """
+        state = {name: getattr(self, name) for name in ACCUMULATORS}
+        state["frame_count"] = np.int64(self.frame_count)
+        return state
+
+    def set_state(self, state, history=None):
+        """Restores a `get_state` dict and the (frames, track_ids, centres) position history."""
+        for name in ACCUMULATORS:
+            setattr(self, name, np.array(state[name], dtype=getattr(self, name).dtype))
+        self.frame_count = int(state["frame_count"])
+        self._rows = 0
+        if history is not None:
+            frames, ids, centers = history
+            self._reserve(0, len(ids))
+            self._frames[:len(ids)] = frames
+            self._ids[:len(ids)] = ids
+            self._centers[:len(ids)] = centers
+            self._rows = len(ids)
+
+    def history(self):
+        """Returns the (frames, track_ids, centres) arrays of every tracked box so far."""
+        return self._frames[:self._rows], self._ids[:self._rows], self._centers[:self._rows]
+
+    def track_ids(self):
+        """Returns the sorted IDs of every player seen so far."""
+        return np.flatnonzero(self.position_count)
+
+    def positions(self, track_id):
+        """Returns the (n, 2) history of centres of one player."""
+        return self._centers[:self._rows][self._ids[:self._rows] == track_id]
+
+    def summary_arrays(self):
+        """
+        Per player metrics and trajectories as arrays, sorted by Player ID.
+
+        Returns:
+            dict: 'track_id', 'total_distance', 'avg_speed', 'avg_acceleration' and
+                'frames_tracked' (one entry per player), plus 'offsets' (n_players + 1),
+                'frames' and 'points' (one row per position) where the trajectory of
+                player i is rows offsets[i]:offsets[i + 1].
+        """
+        ids = self.track_ids()
+        frames_tracked = self.position_count[ids]
+        avg_speed = self.distance[ids] / frames_tracked * self.fps  # Speed in m/s
+        counts = self.acceleration_count[ids]
+        avg_acceleration = np.divide(self.acceleration_sum[ids], counts,
+                                     out=np.zeros(len(ids)), where=counts > 0)  # Avg acceleration in m/s²
+
+        # Group the position history by player in one stable sort
+        order = np.argsort(self._ids[:self._rows], kind="stable")
+        return {
+            "track_id": ids,
+            "total_distance": self.distance[ids],
+            "avg_speed": avg_speed,
+            "avg_acceleration": avg_acceleration,
+            "frames_tracked": frames_tracked,
+            "offsets": np.concatenate([[0], np.cumsum(frames_tracked)]),
+            "frames": self._frames[:self._rows][order],
+            "points": self._centers[:self._rows][order],
+        }
+
+    def summary(self):
+        """
+        Per player metrics, sorted by Player ID.
+
+        Returns:
+            list: Rows [track_id, total_distance, avg_speed, avg_acceleration, positional_points].
+        """
+        return PlayerData(self.summary_arrays()).rows()
+
+    def save_to_csv(self, output_csv="player_data.csv", positional_points=True):
+        """
+        Save player distances, calculated speed, average acceleration, and positional points to a CSV file.
+
+        Args:
+            output_csv (str): The path to the output CSV file.
+            positional_points (bool): Include the stringified trajectory column.
+        """
+        PlayerData(self.summary_arrays()).to_csv(output_csv, positional_points)
+
+    def export(self, path="player_data.npz", metrics=None):
+        """
+        Save per player summaries and trajectories to a binary `.npz` file, see `PlayerData`.
+
+        Args:
+            path (str): The path to the output file.
+            metrics (dict): Optional output of `compute_match_metrics` stored alongside.
+        """
+        save_player_data(path, self.summary_arrays(), metrics)
+
+
+SUMMARY_KEYS = ("track_id", "total_distance", "avg_speed", "avg_acceleration", "frames_tracked")
+TRAJECTORY_KEYS = ("offsets", "frames", "points")
+
+
+def save_player_data(path, data, metrics=None):
+    """
+    Save player summaries and trajectories to an uncompressed `.npz` file.
+
+    Every trajectory is a contiguous run of the 'frames' and 'points' arrays delimited by
+    'offsets', so reading one back is a slice rather than a string parse.
+
+    Args:
+        path (str): The path to the output file.
+        data (dict): Output of `KinematicsSession.summary_arrays`.
+        metrics (dict): Optional output of `compute_match_metrics`, stored with a 'metrics_' prefix
+            and aligned to data['track_id'].
+    """
+    arrays = {key: np.asarray(data[key]) for key in SUMMARY_KEYS + TRAJECTORY_KEYS}
+    if metrics is not None and len(metrics["track_id"]):
+        row = np.searchsorted(metrics["track_id"], arrays["track_id"])
+        row = np.minimum(row, len(metrics["track_id"]) - 1)
+        found = metrics["track_id"][row] == arrays["track_id"]
+        for key, values in metrics.items():
+            if key != "track_id":
+                arrays["metrics_" + key] = np.where(found, np.asarray(values, dtype=float)[row], np.nan)
+    np.savez(path, **arrays)
+    print(f"Player data saved to {path}")
+
+
+class PlayerData:
+    """
+    Reader for player summaries and trajectories.
+
+    Args:
+        source (str or dict): Path of a file written by `save_player_data`, or the arrays themselves.
+    """
+
+    def __init__(self, source):
+        if isinstance(source, dict):
+            self.arrays = source
+        else:
+            with np.load(source) as f:
+                self.arrays = {key: f[key] for key in f.files}
+        self.track_ids = self.arrays["track_id"]
+        self._row_of = {int(track_id): row for row, track_id in enumerate(self.track_ids.tolist())}
+
+    def __len__(self):
+        return len(self.track_ids)
+
+    def __getitem__(self, key):
+        return self.arrays[key]
+
+    def _slice(self, track_id):
+        row = self._row_of[int(track_id)]
+        return slice(int(self.arrays["offsets"][row]), int(self.arrays["offsets"][row + 1]))
+
+    def trajectory(self, track_id):
+        """Returns the (n, 2) positions of one player."""
+        return self.arrays["points"][self._slice(track_id)]
+
+    def trajectory_frames(self, track_id):
+        """Returns the (n,) frame indices matching `trajectory(track_id)`."""
+        return self.arrays["frames"][self._slice(track_id)]
+
+    def rows(self, positional_points=True):
+        """Rows [track_id, total_distance, avg_speed, avg_acceleration(, positional_points)]."""
+        columns = [self.arrays[key].tolist() for key in SUMMARY_KEYS[:4]]
+        rows = [list(row) for row in zip(*columns)]
+        if positional_points:
+            points = np.split(self.arrays["points"], self.arrays["offsets"][1:-1])
+            for row, positions in zip(rows, points):
+                row.append([tuple(p) for p in positions.tolist()])
+        return rows
+
+    def to_csv(self, output_csv="player_data.csv", positional_points=False):
+        """
+        Write the human readable summary, optionally with the stringified trajectories.
+
+        Args:
+            output_csv (str): The path to the output CSV file.
+            positional_points (bool): Include the "Positional Points" column.
+        """
+        header = ["Player ID", "Total Distance (m)", "Average Speed (m/s)", "Average Acceleration (m/s²)"]
+        # Write data to CSV
+        with open(output_csv, mode="w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(header + ["Positional Points"] if positional_points else header)
+            for row in self.rows(positional_points):
+                if positional_points:
+                    # Serialize positional points into a string for CSV
+                    row[4] = "; ".join([f"({x}, {y})" for x, y in row[4]])
+                writer.writerow(row)
+
+        print(f"Player data saved to {output_csv}")
+
+
+def _rolling_mean(values, seg_starts, seg_ends, half_window):
+    """
+    Centred rolling mean of `values` that never crosses segment bounds.
+
+    The window sum of every row is a difference of two shifted cumulative sums;
+    only the rows within `half_window` of a segment edge need clipped windows.
+    """
+    n, h = len(values), half_window
+    cumsum = np.zeros((n + 2 * h + 1,) + values.shape[1:])
+    np.cumsum(values, axis=0, out=cumsum[h + 1:n + h + 1])
+    cumsum[n + h + 1:] = cumsum[n + h]
+    smoothed = (cumsum[2 * h + 1:] - cumsum[:n]) / (2 * h + 1)
+
+    # Rows near a segment edge: recompute with the window clipped to the segment
+    lengths = seg_ends - seg_starts
+    near = np.minimum(lengths, 2 * h)
+    edge_segment = np.repeat(np.arange(len(seg_starts)), 2 * near)
+    offset = np.arange(len(edge_segment)) - np.repeat(np.cumsum(2 * near) - 2 * near, 2 * near)
+    rows = np.where(offset < near[edge_segment], seg_starts[edge_segment] + offset,
+                    seg_ends[edge_segment] - 2 * near[edge_segment] + offset)
+    rows = np.unique(rows)
+    segment = np.searchsorted(seg_starts, rows, side="right") - 1
+    lo = np.maximum(rows - h, seg_starts[segment])
+    hi = np.minimum(rows + h + 1, seg_ends[segment])
+    count = (hi - lo).reshape((-1,) + (1,) * (values.ndim - 1))
+    smoothed[rows] = (cumsum[hi + h] - cumsum[lo + h]) / count
+    return smoothed
+
+
+def compute_match_metrics(frames, track_ids, centers, fps, pixel_to_meter=1.0, smoothing=0.4,
+                          max_gap=None, sprint_speed=7.0, sprint_duration=1.0):
+    """
+    Compute per player metrics over a whole tracking log in one vectorised pass.
+
+    Samples are grouped per track and split into segments wherever the track
+    was lost for more than `max_gap` frames. Inside a segment, frames where the
+    track coasted are filled by linear interpolation, so steps are always one
+    frame apart. Positions are smoothed with a centred rolling mean before
+    speeds and accelerations are differentiated, which removes most of the
+    detection jitter that dominates raw frame-to-frame acceleration.
+
+    Args:
+        frames (np.ndarray): (n,) frame index of every sample.
+        track_ids (np.ndarray): (n,) track ID of every sample.
+        centers (np.ndarray): (n, 2) player position of every sample.
+        fps (float): Frames per second of the video.
+        pixel_to_meter (float): Conversion factor from position units to meters.
+        smoothing (float): Width of the rolling mean window in seconds.
+        max_gap (int): Longest gap in frames bridged by interpolation (default: one second).
+        sprint_speed (float): Speed in m/s above which a player is sprinting.
+        sprint_duration (float): Minimum duration in seconds of a sprint.
+
+    Returns:
+        dict: Arrays indexed by player, sorted by track ID: 'track_id', 'frames_tracked',
+            'distance' (m), 'avg_speed' (m/s), 'max_speed' (m/s), 'avg_acceleration'
+            (mean magnitude, m/s²), 'max_acceleration' (m/s²) and 'sprints'.
+    """
+    frames = np.asarray(frames, dtype=np.int64)
+    track_ids = np.asarray(track_ids, dtype=np.int64)
+    centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+    if max_gap is None:
+        max_gap = int(round(fps))
+    if len(frames) == 0:
+        keys = ("track_id", "frames_tracked", "distance", "avg_speed", "max_speed",
+                "avg_acceleration", "max_acceleration", "sprints")
+        return {key: np.zeros(0) for key in keys}
+
+    # Sort by track then frame and split into gap-free segments. Track IDs are
+    # mapped to dense player indices so the sort by player can use radix sort.
+    present = np.bincount(track_ids) > 0
+    players = np.flatnonzero(present)
+    player_index = (np.cumsum(present) - 1)[track_ids]
+    player_index = player_index.astype(np.uint16 if len(players) <= 1 << 16 else np.int64)
+    order = None
+    if (np.diff(frames) < 0).any():
+        order = np.argsort(frames, kind="stable")
+        player_index = player_index[order]
+    by_player = np.argsort(player_index, kind="stable")
+    order = by_player if order is None else order[by_player]
+    frames, centers = frames[order], centers[order]
+    player_index = player_index[by_player].astype(np.int64)
+    step = np.diff(frames)
+    new_track = player_index[1:] != player_index[:-1]
+    if (step[~new_track] == 0).any():
+        raise ValueError("a track has several samples in the same frame")
+    new_segment = np.concatenate([[True], new_track | (step > max_gap)])
+    segment = np.cumsum(new_segment) - 1
+    seg_start = np.flatnonzero(new_segment)
+    seg_first = frames[seg_start]
+    seg_frames = frames[np.append(seg_start[1:], len(frames)) - 1] - seg_first + 1
+    seg_player = player_index[seg_start]
+
+    # Resample every segment onto consecutive frames, interpolating coasted frames
+    seg_base = np.concatenate([[0], np.cumsum(seg_frames)[:-1]])
+    sample_key = seg_base[segment] + frames - seg_first[segment]
+    total = int(seg_frames.sum())
+    grid_segment = np.repeat(np.arange(len(seg_frames)), seg_frames)
+    grid = np.empty((total, 2))
+    grid[sample_key] = centers
+    if total > len(frames):
+        missing = np.ones(total, dtype=bool)
+        missing[sample_key] = False
+        missing = np.flatnonzero(missing)
+        grid[missing, 0] = np.interp(missing, sample_key, centers[:, 0])
+        grid[missing, 1] = np.interp(missing, sample_key, centers[:, 1])
+    grid *= pixel_to_meter
+
+    # Smooth positions inside each segment
+    half_window = max(int(round(smoothing * fps)) // 2, 0)
+    if half_window:
+        grid = _rolling_mean(grid, seg_base, seg_base + seg_frames, half_window)
+
+    # Speeds between consecutive frames of the same segment
+    same = grid_segment[1:] == grid_segment[:-1]
+    steps = np.hypot(*np.diff(grid, axis=0).T)[same]
+    speed = steps * fps
+    speed_player = seg_player[grid_segment[1:][same]]
+    speed_segment = grid_segment[1:][same]
+
+    # Accelerations between consecutive speeds of the same segment
+    same_speed = speed_segment[1:] == speed_segment[:-1]
+    acceleration = np.abs(np.diff(speed))[same_speed] * fps
+    acceleration_player = speed_player[1:][same_speed]
+
+    # Sprints are runs of at least `sprint_duration` above `sprint_speed`
+    fast = speed >= sprint_speed
+    run_start = fast & np.concatenate([[True], ~fast[:-1] | ~same_speed])
+    run_id = np.cumsum(run_start) - 1
+    run_length = np.bincount(run_id[fast], minlength=int(run_start.sum()))
+    long_run = run_length >= max(int(round(sprint_duration * fps)), 1)
+    sprints = np.bincount(speed_player[run_start][long_run], minlength=len(players))
+
+    n_players = len(players)
+    distance = np.bincount(speed_player, weights=steps, minlength=n_players)
+    duration = np.bincount(seg_player, weights=seg_frames - 1, minlength=n_players) / fps
+    n_acceleration = np.bincount(acceleration_player, minlength=n_players)
+    max_speed = np.zeros(n_players)
+    np.maximum.at(max_speed, speed_player, speed)
+    max_acceleration = np.zeros(n_players)
+    np.maximum.at(max_acceleration, acceleration_player, acceleration)
+
+    return {
+        "track_id": players,
+        "frames_tracked": np.bincount(player_index, minlength=n_players),
+        "distance": distance,
+        "avg_speed": np.divide(distance, duration, out=np.zeros(n_players), where=duration > 0),
+        "max_speed": max_speed,
+        "avg_acceleration": np.divide(np.bincount(acceleration_player, weights=acceleration, minlength=n_players),
+                                      n_acceleration, out=np.zeros(n_players), where=n_acceleration > 0),
+        "max_acceleration": max_acceleration,
+        "sprints": sprints,
+    }
+
+
+def save_metrics_csv(metrics, output_csv="player_metrics.csv"):
+    """
+    Save the output of `compute_match_metrics` to a CSV file, one row per player.
+
+    Args:
+        metrics (dict): Per player metric arrays.
+        output_csv (str): The path to the output CSV file.
+    """
+    with open(output_csv, mode="w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["Player ID", "Frames Tracked", "Total Distance (m)", "Average Speed (m/s)", "Max Speed (m/s)",
+                         "Average Acceleration (m/s²)", "Max Acceleration (m/s²)", "Sprints"])
+        for row in zip(*(metrics[key].tolist() for key in ("track_id", "frames_tracked", "distance", "avg_speed",
+                                                             "max_speed", "avg_acceleration", "max_acceleration",
+                                                             "sprints"))):
+            writer.writerow(row)
+
+    print(f"Player metrics saved to {output_csv}")
+
+
+# Session used by the module level functions below
+_session = None
+
+
+def update_distances(resultsTracker, pixel_to_meter, fps, calibration=None):
     """
     Update distances, velocities, and accelerations for each tracked player ID using the current frame's tracker results.
 
+    Kept for scripts written against the module level API; new code should own a `KinematicsSession`.
+
     Args:
         resultsTracker (list): List of tracked object data [x1, y1, x2, y2, track_id].
         pixel_to_meter (float): Conversion factor from pixels to meters.
         fps (float): Frames per second of the video.
+        calibration (PitchCalibration): Optional pitch homography replacing `pixel_to_meter`.
     """
-    global player_positions, player_distances, player_velocities, player_accelerations
-
-    time_interval = 1 / fps  # Time interval per frame in seconds
-
-    for result in resultsTracker:
-        x1, y1, x2, y2, track_id = map(int, result)
-        center = ((x1 + x2) // 2, (y1 + y2) // 2)  # Calculate the center of the bounding box
-        
-        # Append the current center to the player's position history
-        if player_positions[track_id]:
-            prev_center = player_positions[track_id][-1]
-            distance = euclidean(prev_center, center) * pixel_to_meter  # Convert distance to meters
-            player_distances[track_id] += distance
-            
-            # Calculate velocity (in meters per second)
-            current_velocity = distance / time_interval
-            player_velocities[track_id].append(current_velocity)
-
-            # Calculate acceleration if there are at least two velocities
-            if len(player_velocities[track_id]) > 1:
-                prev_velocity = player_velocities[track_id][-2]
-                acceleration = (current_velocity - prev_velocity) / time_interval  # a = (v_f - v_i) / t
-                player_accelerations[track_id].append(acceleration)
-        
-        player_positions[track_id].append(center)
+    global _session
+    if _session is None:
+        _session = KinematicsSession(pixel_to_meter, fps, calibration=calibration)
+    _session.update(resultsTracker)
+
 
 def save_to_csv(fps, pixel_to_meter, output_csv="player_data.csv"):
     """
@@ -53,28 +507,11 @@ def save_to_csv(fps, pixel_to_meter, output_csv="player_data.csv"):
         pixel_to_meter (float): Conversion factor from pixels to meters.
         output_csv (str): The path to the output CSV file.
     """
-    global player_positions, player_distances, player_velocities, player_accelerations
-    
-    player_data = []
-    
-    for track_id, positions in player_positions.items():
-        total_distance = player_distances[track_id]  # Already in meters
-        frames_tracked = len(positions)
-        avg_speed = (total_distance / frames_tracked) * fps if frames_tracked > 0 else 0  # Speed in m/s
-        avg_acceleration = np.mean(player_accelerations[track_id]) if player_accelerations[track_id] else 0  # Avg acceleration in m/s²
-        positional_points = positions  # List of positional points
-        player_data.append([track_id, total_distance, avg_speed, avg_acceleration, positional_points])
-    
-    # Sort the player data by Player ID in ascending order
-    player_data.sort(key=lambda x: x[0])
-    
-    # Write data to CSV
-    with open(output_csv, mode="w", newline="") as file:
-        writer = csv.writer(file)
-        writer.writerow(["Player ID", "Total Distance (m)", "Average Speed (m/s)", "Average Acceleration (m/s²)", "Positional Points"])
-        for row in player_data:
-            # Serialize positional points into a string for CSV
-            row[4] = "; ".join([f"({x}, {y})" for x, y in row[4]])
-            writer.writerow(row)
+    session = _session if _session is not None else KinematicsSession(pixel_to_meter, fps)
+    session.save_to_csv(output_csv)
+
 
-    print(f"Player data saved to {output_csv}")
+def reset():
+    """Forget the state accumulated by `update_distances`."""
+    global _session
+    _session = None
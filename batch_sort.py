@@ -0,0 +1,438 @@
+"""
+Structure-of-arrays backend for the SORT tracker.
+
+`sort.Sort` keeps one filterpy `KalmanFilter` per track and predicts them one by
+one in a Python loop. `BatchedSort` keeps the state of every track in contiguous
+arrays (N x 7 states, N x 7 x 7 covariances plus per-track counters) and runs the
+Kalman predict/update equations for all tracks at once with NumPy. It implements
+the same constant velocity model, association and track life-cycle rules as
+`Sort`, so it returns the same boxes and IDs and can be used as a drop-in
+replacement.
+
+With `dormant_after=K`, tracks unmatched for more than K frames leave the
+active arrays for a dormant tier that is neither predicted nor IOU-matched.
+Their state is only extrapolated, in closed form, for the tracks a leftover
+detection lands near, so the per-frame cost follows the number of players on
+screen instead of `max_age`.
+"""
+import numpy as np
+
+from sort import KalmanBoxTracker, associate_detections_to_trackers, associate_detections_to_trackers_gated, \
+    linear_assignment
+
+# Constant velocity model shared by every track (see KalmanBoxTracker.__init__)
+F = np.array([[1, 0, 0, 0, 1, 0, 0],
+              [0, 1, 0, 0, 0, 1, 0],
+              [0, 0, 1, 0, 0, 0, 1],
+              [0, 0, 0, 1, 0, 0, 0],
+              [0, 0, 0, 0, 1, 0, 0],
+              [0, 0, 0, 0, 0, 1, 0],
+              [0, 0, 0, 0, 0, 0, 1]], dtype=float)
+H = np.array([[1, 0, 0, 0, 0, 0, 0],
+              [0, 1, 0, 0, 0, 0, 0],
+              [0, 0, 1, 0, 0, 0, 0],
+              [0, 0, 0, 1, 0, 0, 0]], dtype=float)
+R = np.diag([1., 1., 10., 10.])
+Q = np.diag([1., 1., 1., 1., 0.01, 0.01, 0.0001])
+P0 = np.diag([10., 10., 10., 10., 10000., 10000., 10000.])
+I7 = np.eye(7)
+# F = I + N; N is nilpotent, so F^k = I + kN and k predicts have a closed form
+N = F - I7
+NQ = N @ Q + Q @ N.T
+NQN = N @ Q @ N.T
+
+# Per-track arrays, in the order they are moved between the active and dormant tiers
+TRACK_FIELDS = ("x", "P", "ids", "time_since_update", "hits", "hit_streak", "age", "score")
+# Further arrays and counters `update` and `coast` depend on, saved with the tracks by `get_state`
+STATE_ARRAYS = ("dormant_since", "dormant_frame", "last_scores", "last_states", "last_covariances", "last_ids")
+STATE_COUNTERS = ("frame_count", "frames_elapsed", "last_matched", "last_unmatched_dets", "last_unmatched_tracks",
+                  "last_lost_tracks")
+
+
+def convert_bboxes_to_z(bboxes):
+    """
+    Vectorised `sort.convert_bbox_to_z`: takes an (N,4+) array of [x1,y1,x2,y2]
+    boxes and returns an (N,4) array of [x,y,s,r] measurements.
+    """
+    bboxes = np.asarray(bboxes, dtype=float)
+    w = bboxes[:, 2] - bboxes[:, 0]
+    h = bboxes[:, 3] - bboxes[:, 1]
+    z = np.empty((len(bboxes), 4))
+    z[:, 0] = bboxes[:, 0] + w / 2.
+    z[:, 1] = bboxes[:, 1] + h / 2.
+    z[:, 2] = w * h
+    z[:, 3] = w / h
+    return z
+
+
+def convert_xs_to_bboxes(x):
+    """
+    Vectorised `sort.convert_x_to_bbox`: takes an (N,4+) array of [x,y,s,r,...]
+    states and returns an (N,4) array of [x1,y1,x2,y2] boxes.
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        w = np.sqrt(x[:, 2] * x[:, 3])
+        h = x[:, 2] / w
+    return np.stack([x[:, 0] - w / 2., x[:, 1] - h / 2.,
+                     x[:, 0] + w / 2., x[:, 1] + h / 2.], axis=1)
+
+
+def extrapolate_states(x, steps):
+    """
+    Applies `steps` (M,) consecutive predict steps to the (M,7) states only.
+
+    The area velocity is zeroed at the step the box would collapse, exactly as
+    the per-frame predict does.
+    """
+    steps = np.asarray(steps, dtype=float)
+    x = x.copy()
+    s, ds = x[:, 2], x[:, 6]
+    # Number of steps the area keeps changing before predict zeroes its velocity
+    with np.errstate(divide='ignore', invalid='ignore'):
+        collapse = np.where(ds < 0, np.maximum(np.ceil(-s / ds) - 1, 0), np.inf)
+    collapse = np.where(s + ds <= 0, 0, collapse)
+    growing = np.minimum(steps, collapse)
+    x[:, :2] += steps[:, None] * x[:, 4:6]
+    x[:, 2] = s + growing * ds
+    x[:, 6] = np.where(growing < steps, 0., ds)
+    return x
+
+
+def extrapolate(x, P, steps):
+    """
+    Applies `steps` (M,) consecutive `BatchedSort.predict` steps to the (M,7)
+    states and (M,7,7) covariances at once and returns the new (x, P).
+    """
+    steps = np.asarray(steps, dtype=float)
+    x = extrapolate_states(x, steps)
+    Fk = I7 + steps[:, None, None] * N
+    s1 = steps * (steps - 1) / 2
+    s2 = (steps - 1) * steps * (2 * steps - 1) / 6
+    P = Fk @ P @ Fk.transpose(0, 2, 1) + steps[:, None, None] * Q \
+        + s1[:, None, None] * NQ + s2[:, None, None] * NQN
+    return x, P
+
+
+class BatchedSort(object):
+    """
+    SORT tracker with all Kalman states held in N x 7 / N x 7 x 7 arrays.
+
+    Row i of every array describes the i-th track, in the same order `Sort`
+    keeps its `trackers` list, so association and ID allocation are unchanged.
+    IDs are drawn from `KalmanBoxTracker.count` exactly like `Sort`.
+
+    With `gated=True` association only considers overlapping detection/track
+    pairs (see `sort.associate_detections_to_trackers_gated`), and needs
+    `iou_threshold > 0`; tracks and IDs are the same as with the dense path.
+
+    With `dormant_after=K` a track that misses more than K frames in a row is
+    moved to the dormant tier. Detections left over after IOU association are
+    matched to dormant tracks whose extrapolated centre lies within
+    `reactivation_radius` box sizes plus the distance the track could have
+    covered at its last speed; a re-matched track is extrapolated to the
+    current frame, corrected and made active again. Dormant tracks still die
+    after `max_age` frames without a match. `dormant_after=None` keeps every
+    track active, like `Sort`.
+
+    `update(dets, steps=k)` accepts detections `k` frames after the previous
+    update, e.g. when the detector only runs on keyframes: the motion model
+    advances `k` frames while ages and `max_age` keep counting updates.
+    `coast(ahead)` returns the last reported tracks moved `ahead` frames along
+    their velocity, for the frames in between.
+    """
+
+    def __init__(self, max_age=1, min_hits=3, iou_threshold=0.3, gated=False,
+                 dormant_after=None, reactivation_radius=1.):
+        """
+        Sets key parameters for SORT
+        """
+        self.max_age = max_age
+        self.min_hits = min_hits
+        if gated and iou_threshold <= 0:
+            raise ValueError("gated association needs iou_threshold > 0")
+        self.iou_threshold = iou_threshold
+        self.dormant_after = dormant_after
+        self.reactivation_radius = reactivation_radius
+        self.associate = associate_detections_to_trackers_gated if gated else associate_detections_to_trackers
+        self.frame_count = 0
+        # Frames covered by the updates so far; differs from frame_count when updates skip frames
+        self.frames_elapsed = 0
+
+        self.x = np.zeros((0, 7))
+        self.P = np.zeros((0, 7, 7))
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.time_since_update = np.zeros(0, dtype=np.int64)
+        self.hits = np.zeros(0, dtype=np.int64)
+        self.hit_streak = np.zeros(0, dtype=np.int64)
+        self.age = np.zeros(0, dtype=np.int64)
+        self.score = np.zeros(0)
+        # Detection score, state and ID of every row returned by the last update
+        self.last_scores = np.zeros(0)
+        self.last_states = np.zeros((0, 7))
+        self.last_covariances = np.zeros((0, 7, 7))
+        self.last_ids = np.zeros(0, dtype=np.int64)
+        # Association outcome of the last update
+        self.last_matched = 0
+        self.last_unmatched_dets = 0
+        self.last_unmatched_tracks = 0
+        self.last_lost_tracks = 0
+
+        # Dormant tier: the same fields, frozen at update `dormant_since` / frame `dormant_frame`
+        self.dormant = {name: getattr(self, name).copy() for name in TRACK_FIELDS}
+        self.dormant_since = np.zeros(0, dtype=np.int64)
+        self.dormant_frame = np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def active_count(self):
+        return len(self.ids)
+
+    @property
+    def dormant_count(self):
+        return len(self.dormant_since)
+
+    def _keep(self, mask):
+        """Drops every track whose entry in `mask` is False, preserving order."""
+        self.x = self.x[mask]
+        self.P = self.P[mask]
+        self.ids = self.ids[mask]
+        self.time_since_update = self.time_since_update[mask]
+        self.hits = self.hits[mask]
+        self.hit_streak = self.hit_streak[mask]
+        self.age = self.age[mask]
+        self.score = self.score[mask]
+
+    def _append(self, fields):
+        """Appends tracks given as a {field: array} dict to the active arrays."""
+        for name in TRACK_FIELDS:
+            setattr(self, name, np.concatenate([getattr(self, name), fields[name]]))
+
+    def sleep(self):
+        """
+        Moves the tracks unmatched for more than `dormant_after` frames to the
+        dormant tier. Called right after `predict`, so their frozen state is the
+        prediction for the current frame.
+        """
+        idle = self.time_since_update > self.dormant_after
+        if not idle.any():
+            return
+        for name in TRACK_FIELDS:
+            self.dormant[name] = np.concatenate([self.dormant[name], getattr(self, name)[idle]])
+        n = int(idle.sum())
+        self.dormant_since = np.concatenate([self.dormant_since, np.full(n, self.frame_count, dtype=np.int64)])
+        self.dormant_frame = np.concatenate([self.dormant_frame, np.full(n, self.frames_elapsed, dtype=np.int64)])
+        self._keep(~idle)
+
+    def _keep_dormant(self, mask):
+        for name in TRACK_FIELDS:
+            self.dormant[name] = self.dormant[name][mask]
+        self.dormant_since = self.dormant_since[mask]
+        self.dormant_frame = self.dormant_frame[mask]
+
+    def reactivate(self, dets):
+        """
+        Matches the (M,5) leftover `dets` against the dormant tracks, moves the
+        matched tracks back to the active arrays, corrected with their detection,
+        and returns the indices of the detections that are still unmatched.
+        """
+        if len(dets) == 0 or self.dormant_count == 0:
+            return np.arange(len(dets))
+        d = self.dormant
+        steps = self.frames_elapsed - self.dormant_frame
+        updates = self.frame_count - self.dormant_since
+        # Centres only; the full state is extrapolated for the winners below
+        centre = d["x"][:, :2] + steps[:, None] * d["x"][:, 4:6]
+        with np.errstate(invalid='ignore'):
+            size = np.sqrt(np.maximum(d["x"][:, 2], 0))
+        radius = self.reactivation_radius * size + np.hypot(d["x"][:, 4], d["x"][:, 5]) * steps
+
+        z = convert_bboxes_to_z(dets)
+        dist = np.hypot(z[:, None, 0] - centre[None, :, 0], z[:, None, 1] - centre[None, :, 1])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cost = dist / radius
+        gate = cost <= 1.
+        if not gate.any():
+            return np.arange(len(dets))
+        cost[~gate] = 1e6
+        assigned = np.asarray(linear_assignment(cost), dtype=np.int64).reshape(-1, 2)
+        assigned = assigned[gate[assigned[:, 0], assigned[:, 1]]]
+        det_rows, trk_rows = assigned[:, 0], assigned[:, 1]
+
+        woken = {name: d[name][trk_rows] for name in TRACK_FIELDS}
+        woken["x"], woken["P"] = extrapolate(woken["x"], woken["P"], steps[trk_rows])
+        woken["time_since_update"] = woken["time_since_update"] + updates[trk_rows]
+        woken["age"] = woken["age"] + updates[trk_rows]
+        woken["hit_streak"] = np.zeros(len(trk_rows), dtype=np.int64)
+        keep = np.ones(self.dormant_count, dtype=bool)
+        keep[trk_rows] = False
+        self._keep_dormant(keep)
+
+        start = len(self)
+        self._append(woken)
+        self.correct(np.arange(start, len(self)), dets[det_rows])
+
+        unmatched = np.ones(len(dets), dtype=bool)
+        unmatched[det_rows] = False
+        return np.flatnonzero(unmatched)
+
+    def predict(self, steps=1):
+        """
+        Advances every track by `steps` frames and returns the (N,4) predicted boxes.
+        """
+        if steps == 1:
+            shrinking = (self.x[:, 6] + self.x[:, 2]) <= 0
+            self.x[shrinking, 6] = 0.
+            self.x = self.x @ F.T
+            self.P = F @ self.P @ F.T + Q
+        else:
+            self.x, self.P = extrapolate(self.x, self.P, np.full(len(self), steps))
+        self.age += 1
+        self.hit_streak[self.time_since_update > 0] = 0
+        self.time_since_update += 1
+        return convert_xs_to_bboxes(self.x)
+
+    def correct(self, rows, bboxes):
+        """
+        Kalman update of the tracks at `rows` with the matching (M,4+) `bboxes`.
+        A fifth column, when present, is kept as the track's detection score.
+        """
+        if len(rows) == 0:
+            return
+        x = self.x[rows]
+        P = self.P[rows]
+        y = convert_bboxes_to_z(bboxes) - x[:, :4]
+        PHT = P[:, :, :4]
+        S = PHT[:, :4, :] + R
+        K = PHT @ np.linalg.inv(S)
+        self.x[rows] = x + (K @ y[:, :, None])[:, :, 0]
+        I_KH = I7 - K @ H
+        self.P[rows] = I_KH @ P @ I_KH.transpose(0, 2, 1) + K @ R @ K.transpose(0, 2, 1)
+        self.time_since_update[rows] = 0
+        self.hits[rows] += 1
+        self.hit_streak[rows] += 1
+        if bboxes.shape[1] > 4:
+            self.score[rows] = bboxes[:, 4]
+
+    def spawn(self, bboxes):
+        """
+        Starts a new track for every row of the (M,4+) `bboxes` array.
+        """
+        n = len(bboxes)
+        if n == 0:
+            return
+        x = np.zeros((n, 7))
+        x[:, :4] = convert_bboxes_to_z(bboxes)
+        ids = KalmanBoxTracker.count + np.arange(n)
+        KalmanBoxTracker.count += n
+        zeros = np.zeros(n, dtype=np.int64)
+        self.x = np.concatenate([self.x, x])
+        self.P = np.concatenate([self.P, np.broadcast_to(P0, (n, 7, 7))])
+        self.ids = np.concatenate([self.ids, ids])
+        self.time_since_update = np.concatenate([self.time_since_update, zeros])
+        self.hits = np.concatenate([self.hits, zeros])
+        self.hit_streak = np.concatenate([self.hit_streak, zeros])
+        self.age = np.concatenate([self.age, zeros])
+        self.score = np.concatenate([self.score, bboxes[:, 4] if bboxes.shape[1] > 4 else np.zeros(n)])
+
+    def update(self, dets=np.empty((0, 5)), steps=1):
+        """
+        Params:
+          dets - a numpy array of detections in the format [[x1,y1,x2,y2,score],[x1,y1,x2,y2,score],...]
+          steps - frames since the previous update
+        Requires: this method must be called once for each frame even with empty detections (use np.empty((0, 5)) for frames without detections).
+        Returns the a similar array, where the last column is the object ID.
+
+        NOTE: The number of objects returned may differ from the number of detections provided.
+        """
+        self.frame_count += 1
+        self.frames_elapsed += steps
+        dets = np.asarray(dets, dtype=float).reshape(-1, 5)
+
+        # get predicted locations from existing trackers.
+        pos = self.predict(steps)
+        valid = ~np.any(np.isnan(pos), axis=1)
+        if not valid.all():
+            self._keep(valid)
+            pos = pos[valid]
+        if self.dormant_after is not None:
+            self.sleep()
+            pos = convert_xs_to_bboxes(self.x)
+        trks = np.concatenate([pos, np.zeros((len(pos), 1))], axis=1)
+        matched, unmatched_dets, unmatched_trks = self.associate(dets, trks, self.iou_threshold)
+
+        # update matched trackers with assigned detections
+        matched = np.asarray(matched, dtype=np.int64).reshape(-1, 2)
+        self.correct(matched[:, 1], dets[matched[:, 0]])
+        self.last_matched = len(matched)
+        self.last_unmatched_dets = len(unmatched_dets)
+        self.last_unmatched_tracks = len(unmatched_trks)
+        # Confirmed tracks missing their first detection in this update
+        self.last_lost_tracks = int(np.count_nonzero((self.time_since_update == 1) &
+                                                     (self.hit_streak >= self.min_hits)))
+
+        unmatched_dets = np.asarray(unmatched_dets, dtype=np.int64)
+        if self.dormant_after is not None:
+            # Leftover detections may belong to players coming back from an occlusion
+            unmatched_dets = unmatched_dets[self.reactivate(dets[unmatched_dets])]
+
+        # create and initialise new trackers for unmatched detections
+        self.spawn(dets[unmatched_dets])
+
+        return self._emit()
+
+    def _emit(self):
+        """
+        Collects the confirmed tracks in `Sort` output order and drops dead ones.
+        """
+        show = (self.time_since_update < 1) & \
+            ((self.hit_streak >= self.min_hits) | (self.frame_count <= self.min_hits))
+        rows = np.flatnonzero(show)[::-1]
+        ret = np.empty((len(rows), 5))
+        ret[:, :4] = convert_xs_to_bboxes(self.x[rows])
+        ret[:, 4] = self.ids[rows] + 1  # +1 as MOT benchmark requires positive
+        self.last_scores = self.score[rows]
+        self.last_states = self.x[rows]
+        self.last_covariances = self.P[rows]
+        self.last_ids = ret[:, 4]
+
+        # remove dead tracklet
+        alive = self.time_since_update <= self.max_age
+        if not alive.all():
+            self._keep(alive)
+        if self.dormant_count:
+            idle = self.dormant["time_since_update"] + (self.frame_count - self.dormant_since)
+            alive = idle <= self.max_age
+            if not alive.all():
+                self._keep_dormant(alive)
+        return ret
+
+    def get_state(self):
+        """
+        Returns every array and counter of the tracker as a {name: np.ndarray}
+        dict, active and dormant tracks included, for `checkpoint.py`. The
+        parameters are not part of the state.
+        """
+        state = {name: getattr(self, name) for name in TRACK_FIELDS + STATE_ARRAYS}
+        state.update({"dormant_" + name: self.dormant[name] for name in TRACK_FIELDS})
+        state.update({name: np.int64(getattr(self, name)) for name in STATE_COUNTERS})
+        return state
+
+    def set_state(self, state):
+        """Restores a `get_state` dict; the next `update` continues exactly where it was saved."""
+        for name in TRACK_FIELDS + STATE_ARRAYS:
+            setattr(self, name, np.array(state[name]))
+        self.dormant = {name: np.array(state["dormant_" + name]) for name in TRACK_FIELDS}
+        for name in STATE_COUNTERS:
+            setattr(self, name, int(state[name]))
+
+    def coast(self, ahead):
+        """
+        Returns the tracks of the last update moved `ahead` frames along their
+        velocity, in the same (N,5) format, without changing any state.
+        """
+        ret = np.empty((len(self.last_ids), 5))
+        ret[:, :4] = convert_xs_to_bboxes(extrapolate_states(self.last_states, np.full(len(self.last_ids), ahead)))
+        ret[:, 4] = self.last_ids
+        return ret
@@ -0,0 +1,342 @@
+"""
+Synthetic-workload benchmark of the tracking, association, kinematics and
+heatmap code.
+
+Detections come from `detectors.SyntheticDetector` (constant velocity plus an
+optional random walk, block occlusions, dropped detections and false
+positives), so no video, model or MOT data is needed. Every case is run for a
+grid of player counts and match lengths and reports:
+
+    p50_ms / p99_ms / mean_ms   per-call latency (per frame for the per-frame stages)
+    throughput                  calls per second over the whole run
+    peak_kib                    tracemalloc peak of a separate, untimed pass
+
+It also times a cold import of every core module in a fresh interpreter
+(`import:<module>` cases) and fails when one of them loads a plotting, video
+or model dependency, which only the code drawing or decoding may import. And
+it fails when `BatchedSort`, dense or gated, reports other tracks or IDs than
+`Sort` on any frame of the synthetic matches, whose false positives, misses
+and occlusions mix frames with more detections than tracks and fewer.
+
+Results are written as JSON. Passing a previous file with `--compare` prints
+the relative change of every case and exits non-zero when one regressed by
+more than `--tolerance`:
+
+    python benchmark.py --output baseline.json
+    python benchmark.py --compare baseline.json --output current.json
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import operator
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from sort import Sort, KalmanBoxTracker, iou_batch, linear_assignment
+from batch_sort import BatchedSort
+import Distance_calculation
+from detectors import SyntheticDetector
+from heatmap import FootballHeatmap
+
+
+def make_detections(players, frames, seed=0):
+    """Returns the list of (N, 5) detection arrays of a synthetic match."""
+    detector = SyntheticDetector(n_players=players, seed=seed, random_walk=0.3, miss_rate=0.05,
+                                 false_positives=0.5, occlusion_rate=0.05, occlusion_length=25)
+    return [detector.detect_frame(t)[0].astype(float) for t in range(frames)]
+
+
+def make_tracks(detections):
+    """Runs `Sort` once and returns its per-frame results, the input of the downstream stages."""
+    KalmanBoxTracker.count = 0
+    tracker = Sort(max_age=30, min_hits=3, iou_threshold=0.3)
+    return [tracker.update(dets) for dets in detections]
+
+
+def bench_sort_update(detections, tracks):
+    KalmanBoxTracker.count = 0
+    tracker = Sort(max_age=30, min_hits=3, iou_threshold=0.3)
+    return [lambda dets=dets: tracker.update(dets) for dets in detections]
+
+
+def bench_batched_sort_update(detections, tracks):
+    KalmanBoxTracker.count = 0
+    tracker = BatchedSort(max_age=30, min_hits=3, iou_threshold=0.3)
+    return [lambda dets=dets: tracker.update(dets) for dets in detections]
+
+
+def bench_iou_batch(detections, tracks):
+    # Detections of each frame against the tracks of the previous one, as in association
+    return [lambda dets=dets, trks=trks: iou_batch(dets, trks)
+            for dets, trks in zip(detections[1:], tracks[:-1])]
+
+
+def bench_linear_assignment(detections, tracks):
+    costs = [-iou_batch(dets, trks) for dets, trks in zip(detections[1:], tracks[:-1])
+             if len(dets) and len(trks)]
+    return [lambda cost=cost: linear_assignment(cost) for cost in costs]
+
+
+def bench_update_distances(detections, tracks):
+    Distance_calculation.reset()
+    return [lambda results=results: Distance_calculation.update_distances(results, 0.05, 25)
+            for results in tracks]
+
+
+def _tracking_frame(tracks):
+    import pandas as pd
+    rows = np.concatenate([t for t in tracks if len(t)]) if any(len(t) for t in tracks) else np.zeros((0, 5))
+    return pd.DataFrame({
+        "player_id": rows[:, 4].astype(int),
+        "x": (rows[:, 0] + rows[:, 2]) / 2,
+        "y": (rows[:, 1] + rows[:, 3]) / 2,
+    })
+
+
+def bench_generate_heatmap(detections, tracks, output_file="benchmark_heatmap.png", repeat=3):
+    data = _tracking_frame(tracks)
+    heatmap = FootballHeatmap()
+    return [lambda: heatmap.generate_heatmap(data, output_file)] * repeat
+
+
+# name -> (factory, per_frame); a factory returns the list of calls to time
+CASES = {
+    "sort_update": (bench_sort_update, True),
+    "batched_sort_update": (bench_batched_sort_update, True),
+    "iou_batch": (bench_iou_batch, True),
+    "linear_assignment": (bench_linear_assignment, True),
+    "update_distances": (bench_update_distances, True),
+    "generate_heatmap": (bench_generate_heatmap, False),
+}
+
+
+# Modules a tracking run or worker imports, and the dependencies they must not load on import
+CORE_MODULES = ("sort", "batch_sort", "Distance_calculation", "tracking_log", "heatmap", "chunked", "cadence",
+                "main")
+HEAVY_MODULES = ("matplotlib", "scipy", "skimage", "filterpy", "pandas", "seaborn", "cv2", "ultralytics", "torch")
+
+_IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps([elapsed, [name for name in {heavy!r} if name in sys.modules]]))
+"""
+
+
+def import_time(module, repeat=5):
+    """Imports `module` in `repeat` fresh interpreters; returns the latencies and the heavy modules it loaded."""
+    code = _IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    latency = np.empty(repeat)
+    for i in range(repeat):
+        output = subprocess.check_output([sys.executable, "-c", code], cwd=cwd)
+        latency[i], loaded = json.loads(output.decode().splitlines()[-1])
+    return latency, loaded
+
+
+def run_imports(modules=CORE_MODULES, repeat=5):
+    """Returns the `import:<module>` results of every core module."""
+    results = []
+    for module in modules:
+        latency, loaded = import_time(module, repeat)
+        results.append({
+            "case": "import:%s" % module, "players": 0, "frames": 0,
+            "calls": repeat,
+            "p50_ms": float(np.percentile(latency, 50) * 1e3),
+            "p99_ms": float(np.percentile(latency, 99) * 1e3),
+            "mean_ms": float(latency.mean() * 1e3),
+            "loads": loaded,
+        })
+        print("%-20s p50=%8.1fms%s" % ("import:" + module, results[-1]["p50_ms"],
+                                       "  loads " + ", ".join(loaded) if loaded else ""))
+    return results
+
+
+# Tracker settings BatchedSort must reproduce Sort with: the SORT defaults, a longer max_age and main.py's
+PARITY_PARAMS = (dict(max_age=1, min_hits=3, iou_threshold=0.3), dict(max_age=30, min_hits=3, iou_threshold=0.3),
+                 dict(max_age=1000, min_hits=8, iou_threshold=0.00125))
+
+
+def _track_all(tracker, detections):
+    KalmanBoxTracker.count = 0
+    return [tracker.update(dets) for dets in detections]
+
+
+def run_parity(players=(10, 22, 50), frames=600, params=PARITY_PARAMS, seed=0):
+    """Returns the `parity` results: the frames on which BatchedSort, dense and gated, differs from Sort."""
+    results = []
+    for n_players in players:
+        detections = make_detections(n_players, frames, seed)
+        for kwargs in params:
+            expected = _track_all(Sort(**kwargs), detections)
+            for gated in (False, True):
+                tracks = _track_all(BatchedSort(gated=gated, **kwargs), detections)
+                differ = sum(a.shape != b.shape or not np.allclose(a, b) for a, b in zip(expected, tracks))
+                results.append(dict(kwargs, case="parity", players=n_players, frames=frames, gated=gated,
+                                    differing_frames=int(differ)))
+                print("%-20s players=%-4d frames=%-6d %s max_age=%d iou_threshold=%g: %d frames differ" % (
+                    "parity", n_players, frames, "gated" if gated else "dense", kwargs["max_age"],
+                    kwargs["iou_threshold"], differ))
+    return results
+
+
+def time_calls(calls):
+    """Runs every call once and returns the per-call latencies in seconds."""
+    latency = np.empty(len(calls))
+    clock = time.perf_counter
+    for i, call in enumerate(calls):
+        start = clock()
+        call()
+        latency[i] = clock() - start
+    return latency
+
+
+def peak_memory(calls):
+    """Runs every call under tracemalloc and returns the peak traced memory in bytes."""
+    tracemalloc.start()
+    try:
+        for call in calls:
+            call()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_case(name, detections, tracks, memory=True):
+    factory, per_frame = CASES[name]
+    latency = time_calls(factory(detections, tracks))
+    result = {
+        "calls": int(len(latency)),
+        "p50_ms": float(np.percentile(latency, 50) * 1e3) if len(latency) else 0.,
+        "p99_ms": float(np.percentile(latency, 99) * 1e3) if len(latency) else 0.,
+        "mean_ms": float(latency.mean() * 1e3) if len(latency) else 0.,
+        "throughput": float(len(latency) / latency.sum()) if latency.sum() > 0 else 0.,
+        "per_frame": per_frame,
+    }
+    if memory:
+        # A fresh set of calls, so the memory pass sees the same state growth as the timed one
+        result["peak_kib"] = peak_memory(factory(detections, tracks)) / 1024.
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(players=(10, 22, 50), frames=(500, 2000), cases=tuple(CASES), memory=True, seed=0):
+    """Runs every case for every (players, frames) pair and returns the JSON-ready report."""
+    results = []
+    for n_players in players:
+        for n_frames in frames:
+            detections = make_detections(n_players, n_frames, seed)
+            tracks = make_tracks(detections)
+            for name in cases:
+                result = run_case(name, detections, tracks, memory)
+                result.update(case=name, players=n_players, frames=n_frames)
+                results.append(result)
+                print("%-20s players=%-4d frames=%-6d p50=%8.3fms p99=%8.3fms %10.1f/s%s" % (
+                    name, n_players, n_frames, result["p50_ms"], result["p99_ms"], result["throughput"],
+                    "  peak=%.0fKiB" % result["peak_kib"] if memory else ""))
+    return {
+        "meta": {
+            "revision": git_revision(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline, current, tolerance=0.1):
+    """
+    Prints the relative change of p50, p99 and peak memory of every case found
+    in both reports and returns the list of regressions beyond `tolerance`.
+    """
+    key = operator.itemgetter("case", "players", "frames")
+    previous = {key(r): r for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        before = previous.get(key(result))
+        if before is None:
+            continue
+        changes = []
+        for metric in ("p50_ms", "p99_ms", "peak_kib"):
+            if metric not in result or not before.get(metric):
+                continue
+            change = result[metric] / before[metric] - 1
+            changes.append("%s %+6.1f%%" % (metric, 100 * change))
+            if change > tolerance:
+                regressions.append((key(result), metric, change))
+        print("%-20s players=%-4d frames=%-6d %s" % (key(result) + ("  ".join(changes),)))
+    return regressions
+
+
+def parse_args():
+    """Parse input arguments."""
+    parser = argparse.ArgumentParser(description='Synthetic benchmark of the tracking pipeline')
+    parser.add_argument("--players", type=int, nargs="+", default=[10, 22, 50])
+    parser.add_argument("--frames", type=int, nargs="+", default=[500, 2000])
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", dest="memory", action="store_false",
+                        help="Skip the tracemalloc pass.")
+    parser.add_argument("--no-imports", dest="imports", action="store_false",
+                        help="Skip the import-time cases.")
+    parser.add_argument("--no-parity", dest="parity", action="store_false",
+                        help="Skip the BatchedSort / Sort parity check.")
+    parser.add_argument("--output", type=str, default="benchmark.json", help="Where to write the results.")
+    parser.add_argument("--compare", type=str, default=None, help="Baseline JSON to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Relative slowdown reported as a regression.")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    # Heatmaps are rendered off-screen
+    import matplotlib
+    matplotlib.use("Agg")
+    report = run_suite(args.players, args.frames, args.cases, args.memory, args.seed)
+    heavy_imports = []
+    if args.imports:
+        imports = run_imports()
+        report["results"].extend(imports)
+        heavy_imports = [(result["case"], result["loads"]) for result in imports if result["loads"]]
+    mismatches = []
+    if args.parity:
+        parity = run_parity(args.players, seed=args.seed)
+        report["parity"] = parity
+        mismatches = [result for result in parity if result["differing_frames"]]
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print("Results saved to %s" % args.output)
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.tolerance)
+        for (case, players, frames), metric, change in regressions:
+            print("REGRESSION %s players=%d frames=%d %s %+.1f%%" % (case, players, frames, metric, 100 * change))
+    for case, loaded in heavy_imports:
+        print("REGRESSION %s loads %s" % (case, ", ".join(loaded)))
+    for result in mismatches:
+        print("REGRESSION parity players=%d %s max_age=%d: %d frames differ from Sort" % (
+            result["players"], "gated" if result["gated"] else "dense", result["max_age"],
+            result["differing_frames"]))
+    if regressions or heavy_imports or mismatches:
+        raise SystemExit(1)
@@ -0,0 +1,291 @@
+"""
+Adaptive detection cadence.
+
+The detector only runs on keyframes; on the frames in between the tracker's
+constant velocity model carries the confirmed tracks forward
+(`BatchedSort.coast`), optionally refined with pyramidal Lucas-Kanade optical
+flow on the decoded frames. Every output frame is flagged as detected or
+predicted.
+
+`DetectionScheduler` picks the gap to the next keyframe after every keyframe:
+
+* motion: the fastest tracks may not drift more than `motion_budget` box
+  sizes between keyframes,
+* uncertainty: the predicted position standard deviation of the typical track
+  may not grow beyond `uncertainty_budget` box sizes,
+* association: when too many detections were left unmatched or confirmed
+  tracks lost (players entering, occlusions, ID trouble) the next frame is
+  a keyframe.
+
+The gap grows by one frame per keyframe while all three hold and never
+exceeds `max_interval`, which bounds the accuracy loss. Running this module
+measures throughput and accuracy against `SyntheticDetector` ground truth:
+
+    python cadence.py --frames 3000 --detect_ms 20 --max_interval 4
+"""
+import argparse
+import os
+import tempfile
+import time
+import warnings
+
+import numpy as np
+
+from batch_sort import Q
+
+
+class DetectionScheduler:
+    """
+    Decides which frames are keyframes.
+
+    Args:
+        max_interval (int): Largest gap between keyframes (1 detects every frame).
+        min_interval (int): Smallest gap between keyframes.
+        adaptive (bool): Adapt the gap to the tracks; False always uses `max_interval`.
+        motion_budget (float): Allowed drift between keyframes of the fast tracks,
+            in box sizes.
+        uncertainty_budget (float): Allowed predicted position standard
+            deviation at the next keyframe, in box sizes.
+        max_unmatched (float): Fraction of unmatched detections and lost
+            confirmed tracks at a keyframe above which the next frame is a
+            keyframe again.
+    """
+
+    def __init__(self, max_interval=4, min_interval=1, adaptive=True, motion_budget=0.5,
+                 uncertainty_budget=0.5, max_unmatched=0.1):
+        self.max_interval = max(1, int(max_interval))
+        self.min_interval = max(1, min(int(min_interval), self.max_interval))
+        self.adaptive = adaptive
+        self.motion_budget = motion_budget
+        self.uncertainty_budget = uncertainty_budget
+        self.max_unmatched = max_unmatched
+        self.interval = self.min_interval if adaptive else self.max_interval
+        self.next_keyframe = 0
+
+    def is_keyframe(self, index):
+        """
+        True when frame `index` is due for detection, which schedules the
+        next keyframe. Must be called once per frame, in frame order. A fixed
+        gap may be scheduled ahead of the tracker; an adaptive one only after
+        the tracker observed the previous keyframe (`PipelineRunner` lockstep).
+        """
+        if index < self.next_keyframe:
+            return False
+        self.next_keyframe = index + self.interval
+        return True
+
+    def observe(self, tracker):
+        """Adapts the keyframe gap after `tracker` was updated with a keyframe."""
+        if self.adaptive:
+            self.interval = self._choose(tracker)
+
+    def _choose(self, tracker):
+        seen = tracker.last_matched + tracker.last_unmatched_dets
+        unmatched = tracker.last_unmatched_dets + tracker.last_lost_tracks
+        states = tracker.last_states
+        if len(states) == 0 or unmatched > self.max_unmatched * max(seen, 1):
+            return self.min_interval
+
+        with np.errstate(invalid='ignore'):
+            size = np.sqrt(np.maximum(states[:, 2], 1.))
+        speed = np.hypot(states[:, 4], states[:, 5])
+        # The 90th percentile track sets the motion limit, outliers aside
+        drift = np.percentile(speed / size, 90)
+        by_motion = self.motion_budget / drift if drift > 0 else np.inf
+
+        # Predicted position variance k frames ahead of every reported track
+        k = np.arange(1, self.max_interval + 1, dtype=float)[:, None]
+        P = tracker.last_covariances
+        variance = sum(P[:, i, i] + 2 * k * P[:, i, i + 4] + k ** 2 * P[:, i + 4, i + 4] + k * Q[i, i]
+                       + (k - 1) * k * (2 * k - 1) / 6 * Q[i + 4, i + 4] for i in (0, 1))
+        within = np.median(np.sqrt(variance) / size, axis=1) <= self.uncertainty_budget
+        by_uncertainty = int(np.argmin(within)) if not within.all() else self.max_interval
+
+        interval = min(self.interval + 1, by_motion, by_uncertainty, self.max_interval)
+        return max(self.min_interval, int(interval))
+
+
+class FlowPropagator:
+    """
+    Moves boxes from one frame to the next with sparse Lucas-Kanade optical flow.
+
+    Each box is sampled with a `grid` x `grid` lattice of points; the box is
+    shifted by the median displacement of its tracked points. Boxes whose
+    points were all lost keep the shift given as fallback.
+    """
+
+    def __init__(self, grid=3, win_size=(15, 15), max_level=2):
+        self.grid = grid
+        self.win_size = win_size
+        self.max_level = max_level
+        self._previous = None
+
+    @staticmethod
+    def _gray(frame):
+        import cv2
+        return frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+    def reset(self, frame):
+        """Starts propagating from `frame`, usually a keyframe."""
+        self._previous = self._gray(frame)
+
+    def propagate(self, frame, boxes, fallback):
+        """
+        Returns the (N,4) `boxes` of the previous frame moved into `frame`,
+        using the (N,2) `fallback` shifts where the flow failed.
+        """
+        import cv2
+        gray = self._gray(frame)
+        previous, self._previous = self._previous, gray
+        if previous is None or len(boxes) == 0:
+            return boxes + np.tile(fallback, 2)
+        steps = (np.arange(self.grid) + 0.5) / self.grid
+        fx, fy = np.meshgrid(steps, steps)
+        w = (boxes[:, 2] - boxes[:, 0])[:, None]
+        h = (boxes[:, 3] - boxes[:, 1])[:, None]
+        points = np.stack([boxes[:, 0:1] + w * fx.ravel(), boxes[:, 1:2] + h * fy.ravel()], axis=2)
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(
+            previous, gray, points.reshape(-1, 1, 2).astype(np.float32), None,
+            winSize=self.win_size, maxLevel=self.max_level)
+        shift = (moved.reshape(points.shape) - points).astype(float)
+        shift[status.reshape(points.shape[:2]) == 0] = np.nan
+        with warnings.catch_warnings():
+            # All-NaN rows (every point lost) fall back below
+            warnings.simplefilter("ignore", RuntimeWarning)
+            median = np.nanmedian(shift, axis=1)
+        median = np.where(np.isnan(median), fallback, median)
+        return boxes + np.tile(median, 2)
+
+
+class CadenceTracker:
+    """
+    Runs a `BatchedSort` on keyframes and coasts it on the other frames.
+
+    Frames handed in with detections are keyframes, so detections should
+    only be passed for frames `scheduler.is_keyframe` accepted. With
+    `max_interval=1` every frame is a keyframe and the output is exactly the
+    tracker's.
+
+    Args:
+        tracker (BatchedSort): Tracker updated on keyframes.
+        scheduler (DetectionScheduler): Keyframe policy.
+        flow (bool): Refine coasted boxes with optical flow; frames must then
+            be passed to `step`.
+    """
+
+    def __init__(self, tracker, scheduler, flow=False):
+        self.tracker = tracker
+        self.scheduler = scheduler
+        self.flow = FlowPropagator() if flow else None
+        self.detected = True
+        self.last_scores = np.zeros(0)
+        self._boxes = np.zeros((0, 5))
+        self._keyframe = None
+        # Keyframe the scheduler chose after the last one, before adapting its gap
+        self._next_keyframe = 0
+
+    def step(self, index, detections=None, frame=None):
+        """
+        Advances to frame `index` and returns the (N,5) tracks; `detected`
+        tells whether they come from a detector update.
+        """
+        if detections is not None:
+            steps = index - self._keyframe if self._keyframe is not None else 1
+            results = self.tracker.update(detections[:, :5], steps=max(1, steps))
+            self._next_keyframe = index + self.scheduler.interval
+            self.scheduler.observe(self.tracker)
+            self._keyframe = index
+            self.detected = True
+            self.last_scores = self.tracker.last_scores
+            if self.flow is not None and frame is not None:
+                self.flow.reset(frame)
+        else:
+            ahead = index - self._keyframe if self._keyframe is not None else 0
+            results = self.tracker.coast(ahead)
+            if self.flow is not None and frame is not None and len(results) == len(self._boxes):
+                # Kalman motion since the previous frame is the fallback for lost points
+                fallback = ((results[:, :2] + results[:, 2:4]) - (self._boxes[:, :2] + self._boxes[:, 2:4])) / 2
+                results[:, :4] = self.flow.propagate(frame, self._boxes[:, :4], fallback)
+            self.detected = False
+            self.last_scores = np.full(len(results), np.nan)
+        self._boxes = results
+        return results
+
+    def get_state(self):
+        """
+        Returns the tracker's state (see `BatchedSort.get_state`) with the
+        keyframe schedule and the last coasted boxes, for `checkpoint.py`.
+        """
+        state = {"tracker." + name: value for name, value in self.tracker.get_state().items()}
+        state.update(keyframe=np.int64(-1 if self._keyframe is None else self._keyframe),
+                     next_keyframe=np.int64(self._next_keyframe), interval=np.int64(self.scheduler.interval),
+                     detected=np.bool_(self.detected),
+                     last_scores=self.last_scores, boxes=self._boxes)
+        if self.flow is not None and self.flow._previous is not None:
+            state["flow_previous"] = self.flow._previous
+        return state
+
+    def set_state(self, state):
+        """
+        Restores a `get_state` dict, with the next keyframe scheduled as it
+        was after the last keyframe, so the resumed run picks the same keyframes.
+        """
+        prefix = "tracker."
+        self.tracker.set_state({name[len(prefix):]: value for name, value in state.items()
+                                if name.startswith(prefix)})
+        keyframe = int(state["keyframe"])
+        self._keyframe = None if keyframe < 0 else keyframe
+        self.scheduler.interval = int(state["interval"])
+        self._next_keyframe = int(state["next_keyframe"])
+        self.scheduler.next_keyframe = self._next_keyframe
+        self.detected = bool(state["detected"])
+        self.last_scores = np.array(state["last_scores"])
+        self._boxes = np.array(state["boxes"])
+        if self.flow is not None and "flow_previous" in state:
+            self.flow._previous = np.array(state["flow_previous"])
+
+
+def parse_args():
+    """Parse input arguments."""
+    parser = argparse.ArgumentParser(description='Detection cadence benchmark on synthetic detections')
+    parser.add_argument("--frames", type=int, default=3000)
+    parser.add_argument("--players", type=int, default=22)
+    parser.add_argument("--max_interval", type=int, default=4)
+    parser.add_argument("--detect_ms", type=float, default=20., help="Emulated detector latency per frame.")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    from batch_sort import BatchedSort
+    from chunked import evaluate_identities
+    from detectors import SyntheticDetector
+    from sort import KalmanBoxTracker
+    from tracking_log import TrackingLog, TrackingLogReader
+
+    args = parse_args()
+    detector = SyntheticDetector(n_players=args.players, seed=args.seed, random_walk=0.2,
+                                 occlusion_rate=0.05)
+    policies = (("every frame", dict(max_interval=1, adaptive=False)),
+                (f"fixed k={args.max_interval}", dict(max_interval=args.max_interval, adaptive=False)),
+                (f"adaptive k<={args.max_interval}", dict(max_interval=args.max_interval)))
+    log_path = os.path.join(tempfile.gettempdir(), "cadence_log")
+    for name, params in policies:
+        KalmanBoxTracker.count = 0
+        tracker = CadenceTracker(BatchedSort(max_age=1000, min_hits=8, iou_threshold=0.00125, gated=True,
+                                             dormant_after=30), DetectionScheduler(**params))
+        log = TrackingLog(log_path)
+        detected = 0
+        start = time.perf_counter()
+        for t in range(args.frames):
+            detections = None
+            if tracker.scheduler.is_keyframe(t):
+                time.sleep(args.detect_ms / 1e3)
+                detections = detector.detect_frame(t)[0]
+            results = tracker.step(t, detections)
+            log.append(t, results, tracker.last_scores, tracker.detected)
+            detected += tracker.detected
+        elapsed = time.perf_counter() - start
+        log.close()
+        scores = evaluate_identities(TrackingLogReader(log_path), detector)
+        print(f"{name:16s} {args.frames / elapsed:7.1f} fps  detected {detected / args.frames:6.1%}  {scores}")
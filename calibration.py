@@ -0,0 +1,223 @@
+"""
+Pitch calibration: image pixels to pitch metres.
+
+A `PitchCalibration` holds the homography from one camera setup's image plane
+to the pitch plane, estimated once from four or more pixel / pitch point
+correspondences (normalised DLT) and stored as JSON next to the videos. Each
+frame every track's foot point (bottom centre of its box) is projected in a
+single batched transform. For fixed cameras a pixel -> pitch lookup table can
+be precomputed, turning the projection into a gather.
+
+Pitch coordinates are metres with the origin at a corner flag, x along the
+touchline (0..field_length) and y along the goal line (0..field_width).
+
+Create a calibration from four corners of the pitch seen in a 640x480 frame:
+
+    python calibration.py --frame_size 640 480 \\
+        --image 12 410  628 405  520 95  118 98 \\
+        --pitch 0 0  105 0  105 68  0 68 --output calibration.json
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+
+def _normalization(points):
+    """Similarity moving `points` to zero mean and sqrt(2) mean distance (Hartley)."""
+    mean = points.mean(axis=0)
+    distance = np.hypot(*(points - mean).T).mean()
+    scale = np.sqrt(2) / distance if distance > 0 else 1.
+    return np.array([[scale, 0, -scale * mean[0]],
+                     [0, scale, -scale * mean[1]],
+                     [0, 0, 1]])
+
+
+def apply_homography(H, points):
+    """Maps (N,2) points through the 3x3 homography `H` and returns (N,2) float64."""
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    mapped = points @ H[:, :2].T + H[:, 2]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return mapped[:, :2] / mapped[:, 2:]
+
+
+def estimate_homography(src, dst):
+    """
+    Estimates the homography mapping the (N,2) `src` points onto `dst`
+    (N >= 4) with the normalised direct linear transform.
+    """
+    src = np.asarray(src, dtype=float).reshape(-1, 2)
+    dst = np.asarray(dst, dtype=float).reshape(-1, 2)
+    if len(src) < 4 or len(src) != len(dst):
+        raise ValueError("A homography needs at least four point correspondences")
+    Ts, Td = _normalization(src), _normalization(dst)
+    s = apply_homography(Ts, src)
+    d = apply_homography(Td, dst)
+    n = len(s)
+    A = np.zeros((2 * n, 9))
+    A[0::2, 0:2] = -s
+    A[0::2, 2] = -1
+    A[0::2, 6:8] = s * d[:, :1]
+    A[0::2, 8] = d[:, 0]
+    A[1::2, 3:5] = -s
+    A[1::2, 5] = -1
+    A[1::2, 6:8] = s * d[:, 1:]
+    A[1::2, 8] = d[:, 1]
+    H = np.linalg.svd(A)[2][-1].reshape(3, 3)
+    H = np.linalg.inv(Td) @ H @ Ts
+    return H / H[2, 2]
+
+
+def foot_points(bboxes):
+    """Returns the (N,2) bottom centres of (N,4+) [x1, y1, x2, y2] boxes, where players touch the pitch."""
+    bboxes = np.atleast_2d(np.asarray(bboxes, dtype=float))
+    return np.stack([(bboxes[:, 0] + bboxes[:, 2]) / 2, bboxes[:, 3]], axis=1)
+
+
+class PitchCalibration:
+    """
+    Image to pitch homography of one camera setup.
+
+    Args:
+        homography (np.ndarray): 3x3 matrix mapping pixels to pitch metres.
+        frame_size (tuple): (width, height) of the frames the homography was
+            estimated on; needed to rescale it or build a lookup table.
+        field_length (float): Pitch length in metres.
+        field_width (float): Pitch width in metres.
+        image_points, pitch_points: The correspondences it was estimated
+            from, kept for `reprojection_error` and in the saved file.
+    """
+
+    def __init__(self, homography, frame_size=None, field_length=105., field_width=68.,
+                 image_points=None, pitch_points=None):
+        self.homography = np.asarray(homography, dtype=float)
+        self.frame_size = tuple(int(v) for v in frame_size) if frame_size is not None else None
+        self.field_length = field_length
+        self.field_width = field_width
+        self.image_points = None if image_points is None else np.asarray(image_points, dtype=float)
+        self.pitch_points = None if pitch_points is None else np.asarray(pitch_points, dtype=float)
+        self.lut = None
+
+    @classmethod
+    def from_points(cls, image_points, pitch_points, frame_size=None, field_length=105., field_width=68.):
+        """Estimates the calibration from matching pixel and pitch points."""
+        return cls(estimate_homography(image_points, pitch_points), frame_size, field_length, field_width,
+                   image_points, pitch_points)
+
+    @classmethod
+    def from_scale(cls, pixel_to_meter, frame_size=None):
+        """Uniform scale with no perspective, the old `pixel_to_meter` model."""
+        return cls(np.diag([pixel_to_meter, pixel_to_meter, 1.]), frame_size)
+
+    def to_pitch(self, points):
+        """Projects (N,2) pixel points to (N,2) pitch metres in one transform."""
+        return apply_homography(self.homography, points)
+
+    def project_boxes(self, bboxes):
+        """Projects the foot points of (N,4+) boxes to (N,2) pitch metres, through the LUT when built."""
+        feet = foot_points(bboxes)
+        if self.lut is None:
+            return self.to_pitch(feet)
+        height, width = self.lut.shape[:2]
+        col = np.clip(np.rint(feet[:, 0]).astype(np.intp), 0, width - 1)
+        row = np.clip(np.rint(feet[:, 1]).astype(np.intp), 0, height - 1)
+        return self.lut[row, col].astype(float)
+
+    def build_lut(self):
+        """Precomputes the (height, width, 2) float32 pitch position of every pixel."""
+        if self.frame_size is None:
+            raise ValueError("A lookup table needs the calibration frame size")
+        width, height = self.frame_size
+        cols, rows = np.meshgrid(np.arange(width, dtype=float), np.arange(height, dtype=float))
+        pitch = self.to_pitch(np.stack([cols.ravel(), rows.ravel()], axis=1))
+        self.lut = pitch.reshape(height, width, 2).astype(np.float32)
+        return self.lut
+
+    def resized(self, frame_size):
+        """Returns the calibration for frames resized to `frame_size` (width, height)."""
+        if self.frame_size is None or tuple(frame_size) == self.frame_size:
+            return self
+        sx = self.frame_size[0] / frame_size[0]
+        sy = self.frame_size[1] / frame_size[1]
+        scale = np.diag([sx, sy, 1.])
+        image_points = None if self.image_points is None else self.image_points / [sx, sy]
+        calibration = PitchCalibration(self.homography @ scale, frame_size, self.field_length,
+                                       self.field_width, image_points, self.pitch_points)
+        if self.lut is not None:
+            calibration.build_lut()
+        return calibration
+
+    def reprojection_error(self):
+        """Mean distance in metres between the projected image points and their pitch points."""
+        if self.image_points is None:
+            return 0.
+        error = self.to_pitch(self.image_points) - self.pitch_points
+        return float(np.hypot(error[:, 0], error[:, 1]).mean())
+
+    def to_dict(self):
+        data = {
+            "homography": self.homography.tolist(),
+            "frame_size": self.frame_size,
+            "field_length": self.field_length,
+            "field_width": self.field_width,
+        }
+        if self.image_points is not None:
+            data["image_points"] = self.image_points.tolist()
+            data["pitch_points"] = self.pitch_points.tolist()
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["homography"], data.get("frame_size"), data.get("field_length", 105.),
+                   data.get("field_width", 68.), data.get("image_points"), data.get("pitch_points"))
+
+    def save(self, path="calibration.json"):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path="calibration.json"):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+
+def load_calibration(path="calibration.json", frame_size=None, lut=False):
+    """
+    Loads the calibration at `path` for frames of `frame_size`, or returns
+    None when there is no calibration file.
+
+    Args:
+        lut (bool): Precompute the pixel -> pitch lookup table (fixed cameras).
+    """
+    if not path or not os.path.exists(path):
+        return None
+    calibration = PitchCalibration.load(path)
+    if frame_size is not None:
+        calibration = calibration.resized(frame_size)
+    if lut:
+        calibration.build_lut()
+    return calibration
+
+
+def parse_args():
+    """Parse input arguments."""
+    parser = argparse.ArgumentParser(description='Estimate and save a pitch calibration')
+    parser.add_argument("--image", type=float, nargs="+", required=True,
+                        help="Pixel points x1 y1 x2 y2 ... (at least four).")
+    parser.add_argument("--pitch", type=float, nargs="+", required=True,
+                        help="Matching pitch points in metres, same order.")
+    parser.add_argument("--frame_size", type=int, nargs=2, required=True,
+                        help="Width and height of the frame the pixel points come from.")
+    parser.add_argument("--field_length", type=float, default=105.)
+    parser.add_argument("--field_width", type=float, default=68.)
+    parser.add_argument("--output", type=str, default="calibration.json")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    calibration = PitchCalibration.from_points(np.reshape(args.image, (-1, 2)), np.reshape(args.pitch, (-1, 2)),
+                                               args.frame_size, args.field_length, args.field_width)
+    calibration.save(args.output)
+    print(f"Calibration saved to {args.output} (reprojection error {calibration.reprojection_error():.3f} m)")
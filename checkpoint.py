@@ -0,0 +1,158 @@
+"""
+Periodic checkpoints of a tracking run, so a crashed run resumes where it stopped.
+
+A checkpoint directory holds:
+
+* `state.npz`: the tracker (active and dormant Kalman states, covariances,
+  hit counters and the keyframe schedule, see `CadenceTracker.get_state`), the
+  next track ID, the kinematics accumulators, the row counts of the tracking
+  log, the overlay sidecar and the position history, and the next frame to
+  process. Plain arrays, written to a temporary file and renamed, so a crash
+  while saving leaves the previous checkpoint intact.
+* `history/`: the kinematics position history as a columnar table (see
+  `columnar.py`); each checkpoint appends only the rows added since the
+  previous one.
+
+The tracking log and the overlay are flushed before the state is written, so
+the row counts of a checkpoint always refer to rows on disk; rows written
+after it are cut off on resume. A checkpoint costs the live tracks, the player
+IDs seen so far and the rows added since the previous checkpoint, not the
+length of the match, so it can run every few seconds of video.
+
+    python main.py --checkpoint_every 10      # every 10 s of video
+    python main.py --resume                   # after a crash
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+
+from columnar import ColumnWriter, open_columns
+from sort import KalmanBoxTracker
+
+STATE_FILE = "state.npz"
+HISTORY_PATH = "history"
+
+
+def _history_columns(kinematics):
+    return {"frame": np.int32, "track_id": np.int32, "center": (kinematics.history()[2].dtype, 2)}
+
+
+class Checkpoint:
+    """
+    A saved checkpoint, see `load_checkpoint`.
+
+    Attributes:
+        next_frame (int): First frame the resumed run processes.
+        log_rows, overlay_rows, history_rows (int): Rows covered by the checkpoint.
+        meta (dict): Run description given to `Checkpointer`, e.g. the video.
+    """
+
+    def __init__(self, path, arrays):
+        self.path = path
+        self.meta = json.loads(str(arrays["meta"]))
+        self.next_frame = int(arrays["next_frame"])
+        self.log_rows = int(arrays["log_rows"])
+        self.overlay_rows = int(arrays["overlay_rows"])
+        self.history_rows = int(arrays["history_rows"])
+        self.track_count = int(arrays["track_count"])
+        self._arrays = arrays
+
+    def _group(self, prefix):
+        return {name[len(prefix):]: value for name, value in self._arrays.items() if name.startswith(prefix)}
+
+    def restore(self, tracker, kinematics):
+        """Restores the `CadenceTracker`, `KalmanBoxTracker.count` and the `KinematicsSession`."""
+        tracker.set_state(self._group("cadence."))
+        KalmanBoxTracker.count = self.track_count
+        columns, _ = open_columns(os.path.join(self.path, HISTORY_PATH))
+        rows = slice(0, self.history_rows)
+        kinematics.set_state(self._group("kinematics."),
+                             (columns["frame"][rows], columns["track_id"][rows], columns["center"][rows]))
+
+
+def load_checkpoint(path="checkpoint"):
+    """Returns the `Checkpoint` saved at `path`, or None when there is none."""
+    state_path = os.path.join(path, STATE_FILE)
+    if not os.path.exists(state_path):
+        return None
+    with np.load(state_path) as f:
+        return Checkpoint(path, {name: f[name] for name in f.files})
+
+
+class Checkpointer:
+    """
+    Saves a checkpoint every `every` frames.
+
+    Args:
+        path (str): Checkpoint directory.
+        every (int): Frames between checkpoints; 0 never saves.
+        meta (dict): JSON-serialisable description of the run, checked on resume.
+        resume (Checkpoint): Checkpoint the run resumed from; its position
+            history is kept and appended to.
+    """
+
+    def __init__(self, path="checkpoint", every=250, meta=None, resume=None):
+        self.path = path
+        self.every = max(0, int(every))
+        self.meta = dict(meta or {})
+        self.saved = resume.next_frame if resume is not None else None
+        self._history_rows = resume.history_rows if resume is not None else 0
+        self._history = None
+        if resume is None:
+            self.remove()
+
+    def due(self, index):
+        """True when a checkpoint is due after frame `index` was processed."""
+        return self.every > 0 and (index + 1) % self.every == 0
+
+    def save(self, next_frame, tracker, kinematics, tracking_log, overlay=None):
+        """
+        Saves the state of a run whose frames before `next_frame` are processed.
+
+        Args:
+            tracker (CadenceTracker): The run's tracker.
+            kinematics (KinematicsSession): The run's kinematics.
+            tracking_log (TrackingLog): Flushed, and its row count saved.
+            overlay (OverlayWriter): Optional sidecar, flushed likewise.
+        """
+        if self._history is None:
+            os.makedirs(self.path, exist_ok=True)
+            self._history = ColumnWriter(os.path.join(self.path, HISTORY_PATH), _history_columns(kinematics),
+                                         append=self._history_rows > 0, rows=self._history_rows)
+        frames, ids, centers = kinematics.history()
+        new = slice(self._history_rows, len(ids))
+        self._history.append(frame=frames[new], track_id=ids[new], center=centers[new])
+        self._history.flush()
+        self._history_rows = len(ids)
+        tracking_log.flush()
+        if overlay is not None:
+            overlay.flush()
+
+        arrays = {"cadence." + name: value for name, value in tracker.get_state().items()}
+        arrays.update({"kinematics." + name: value for name, value in kinematics.get_state().items()})
+        arrays.update(
+            meta=np.array(json.dumps(self.meta)),
+            next_frame=np.int64(next_frame),
+            log_rows=np.int64(len(tracking_log)),
+            overlay_rows=np.int64(len(overlay) if overlay is not None else 0),
+            history_rows=np.int64(self._history_rows),
+            track_count=np.int64(KalmanBoxTracker.count),
+        )
+        tmp = os.path.join(self.path, STATE_FILE + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, os.path.join(self.path, STATE_FILE))
+        self.saved = next_frame
+
+    def close(self):
+        if self._history is not None:
+            self._history.close()
+            self._history = None
+
+    def remove(self):
+        """Deletes the checkpoint, e.g. once the run it covers has finished."""
+        self.close()
+        if os.path.isdir(self.path):
+            shutil.rmtree(self.path)
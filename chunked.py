@@ -0,0 +1,321 @@
+"""
+Chunked, multi-process tracking of one video.
+
+The video is cut into time chunks that overlap by a few seconds. Every chunk
+is decoded, detected and tracked by its own `BatchedSort` in a process pool
+and written to its own tracking log with chunk-local track IDs. The chunks are
+then stitched: in each overlap window the boxes of the two neighbouring chunks
+are matched frame by frame with IOU, and a local track that follows the same
+player as a track of the previous chunk inherits its global ID. The global log
+takes each overlap's first half from the earlier chunk and its second half
+from the later one, so every frame appears once and the later tracker has
+had time to confirm its tracks.
+
+Kinematics need global IDs, so they are replayed from the stitched log
+(`replay_kinematics`) rather than computed in the workers.
+
+Running this module compares a single-chunk run with a chunked run on
+`detectors.SyntheticDetector` data, whose ground truth makes identity switches
+introduced by stitching measurable:
+
+    python chunked.py --frames 6000 --workers 4 --chunk 1500 --overlap 60
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+
+from batch_sort import BatchedSort
+from Distance_calculation import KinematicsSession
+from sort import iou_batch, linear_assignment
+from tracking_log import TrackingLog, TrackingLogReader
+
+
+def plan_chunks(n_frames, chunk_frames, overlap):
+    """
+    Splits [0, n_frames) into (start, stop) ranges of about `chunk_frames`
+    frames, each one starting `overlap` frames before the previous one stops.
+    """
+    chunk_frames = max(int(chunk_frames), 2 * overlap + 1)
+    bounds = []
+    start = 0
+    while True:
+        stop = min(start + chunk_frames, n_frames)
+        bounds.append((start, stop))
+        if stop >= n_frames:
+            return bounds
+        start = stop - overlap
+
+
+def _read_frames(video_path, start, stop, frame_size):
+    """Yields the decoded frames [start, stop) of a video, resized to `frame_size`."""
+    import cv2
+    cap = cv2.VideoCapture(video_path)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    try:
+        for _ in range(start, stop):
+            ok, frame = cap.read()
+            if not ok:
+                return
+            yield cv2.resize(frame, frame_size) if frame_size else frame
+    finally:
+        cap.release()
+
+
+def track_chunk(path, start, stop, detector_factory, tracker_kwargs, video_path=None,
+                frame_size=None, batch_size=8, calibration=None):
+    """
+    Tracks frames [start, stop) into a tracking log at `path` and returns the
+    number of frames processed.
+
+    Frames are decoded from `video_path`, or passed to the detector as integer
+    frame indices when there is no video (synthetic or replayed detections).
+    Rows are logged with global frame numbers and chunk-local track IDs.
+    """
+    detector = detector_factory()
+    tracker = BatchedSort(**tracker_kwargs)
+    log = TrackingLog(path, meta={"start": start, "stop": stop}, calibration=calibration)
+    frames = _read_frames(video_path, start, stop, frame_size) if video_path else iter(range(start, stop))
+
+    frame_index = start
+    batch = []
+    while True:
+        frame = next(frames, None)
+        if frame is not None:
+            batch.append(frame)
+            if len(batch) < batch_size:
+                continue
+        for detections in detector(batch):
+            results = tracker.update(detections[:, :5])
+            log.append(frame_index, results, tracker.last_scores)
+            frame_index += 1
+        batch = []
+        if frame is None:
+            break
+    log.close()
+    return frame_index - start
+
+
+def match_overlap(previous, current, start, stop, min_iou=0.5, min_frames=3):
+    """
+    Matches the tracks of two chunk logs over the overlap frames [start, stop).
+
+    Two tracks are candidates for every frame where their boxes overlap by at
+    least `min_iou`; the assignment maximising the number of such frames is
+    kept when a pair shares at least `min_frames` of them.
+
+    Returns:
+        (M, 2) array of [previous_track_id, current_track_id] pairs.
+    """
+    a, b = previous.frame_range(start, stop), current.frame_range(start, stop)
+    a_frames, b_frames = np.asarray(previous.frame[a]), np.asarray(current.frame[b])
+    a_ids, a_index = np.unique(previous.track_id[a], return_inverse=True)
+    b_ids, b_index = np.unique(current.track_id[b], return_inverse=True)
+    if len(a_ids) == 0 or len(b_ids) == 0:
+        return np.empty((0, 2), dtype=np.int64)
+    a_boxes, b_boxes = np.asarray(previous.bbox[a]), np.asarray(current.bbox[b])
+
+    votes = np.zeros((len(a_ids), len(b_ids)), dtype=np.int64)
+    a_offsets = np.searchsorted(a_frames, np.arange(start, stop + 1))
+    b_offsets = np.searchsorted(b_frames, np.arange(start, stop + 1))
+    for i in range(stop - start):
+        ra = slice(a_offsets[i], a_offsets[i + 1])
+        rb = slice(b_offsets[i], b_offsets[i + 1])
+        if ra.start == ra.stop or rb.start == rb.stop:
+            continue
+        rows, cols = np.nonzero(iou_batch(a_boxes[ra], b_boxes[rb]) >= min_iou)
+        np.add.at(votes, (a_index[ra][rows], b_index[rb][cols]), 1)
+
+    pairs = np.asarray(linear_assignment(-votes), dtype=np.int64).reshape(-1, 2)
+    pairs = pairs[votes[pairs[:, 0], pairs[:, 1]] >= min_frames]
+    return np.stack([a_ids[pairs[:, 0]], b_ids[pairs[:, 1]]], axis=1)
+
+
+def stitch_chunks(paths, bounds, log_path="tracking_log", min_iou=0.5, min_frames=3, meta=None):
+    """
+    Merges per-chunk tracking logs into one log with global track IDs.
+
+    Args:
+        paths (list): Chunk log directories, in time order.
+        bounds (list): The (start, stop) frame range of every chunk.
+        log_path (str): Directory of the global tracking log.
+
+    Returns:
+        The global `TrackingLog`, still open for `main.save_outputs`.
+    """
+    readers = [TrackingLogReader(path) for path in paths]
+    if readers and readers[0].calibrated:
+        meta = dict(meta or {}, calibration=readers[0].meta["calibration"])
+    log = TrackingLog(log_path, meta=meta)
+    next_id = 1
+    previous_map = None
+    for k, (reader, (start, stop)) in enumerate(zip(readers, bounds)):
+        local_ids = np.unique(reader.track_id)
+        global_ids = np.zeros(len(local_ids), dtype=np.int64)
+        if k > 0:
+            overlap_stop = bounds[k - 1][1]
+            pairs = match_overlap(readers[k - 1], reader, start, overlap_stop, min_iou, min_frames)
+            prev_ids, prev_global = previous_map
+            global_ids[np.searchsorted(local_ids, pairs[:, 1])] = \
+                prev_global[np.searchsorted(prev_ids, pairs[:, 0])]
+        fresh = global_ids == 0
+        global_ids[fresh] = next_id + np.arange(int(fresh.sum()))
+        next_id += int(fresh.sum())
+        previous_map = (local_ids, global_ids)
+
+        # Each overlap is split in the middle between the two chunks
+        own_start = start if k == 0 else (start + bounds[k - 1][1]) // 2
+        own_stop = stop if k == len(bounds) - 1 else (bounds[k + 1][0] + stop) // 2
+        rows = reader.frame_range(own_start, own_stop)
+        track_id = global_ids[np.searchsorted(local_ids, reader.track_id[rows])]
+        log.extend(reader.frame[rows], track_id, reader.bbox[rows], reader.conf[rows], reader.detected[rows],
+                   reader.pitch[rows])
+    log.flush()
+    return log
+
+
+def replay_kinematics(reader, n_frames, pixel_to_meter, fps, calibration=None):
+    """Feeds a tracking log frame by frame into a new `KinematicsSession`."""
+    kinematics = KinematicsSession(pixel_to_meter, fps, calibration=calibration)
+    offsets = np.searchsorted(reader.frame, np.arange(n_frames + 1))
+    results = np.empty((len(reader), 5))
+    results[:, :4] = reader.bbox
+    results[:, 4] = reader.track_id
+    for i in range(n_frames):
+        kinematics.update(results[offsets[i]:offsets[i + 1]])
+    return kinematics
+
+
+def track_video_chunked(n_frames, detector_factory, tracker_kwargs, video_path=None, frame_size=None,
+                        chunk_frames=9000, overlap=60, workers=None, log_path="tracking_log",
+                        batch_size=8, min_iou=0.5, min_frames=3, meta=None, calibration=None):
+    """
+    Tracks a whole video in overlapping chunks on a process pool and stitches
+    the result into one tracking log.
+
+    Args:
+        n_frames (int): Number of frames of the video.
+        detector_factory (callable): Picklable callable returning a detector,
+            e.g. `functools.partial(YoloDetector, "yolo11n.pt")`.
+        tracker_kwargs (dict): `BatchedSort` parameters of every chunk.
+        video_path (str): Video to decode; None passes frame indices to the detector.
+        frame_size (tuple): Optional (width, height) frames are resized to.
+        chunk_frames (int): Frames per chunk, overlap included.
+        overlap (int): Frames shared by neighbouring chunks; should be well
+            above `min_hits` so the later tracker confirms its tracks in time.
+        workers (int): Processes; defaults to one per core, 1 runs in this process.
+        calibration (PitchCalibration): Projects the logged boxes to pitch metres.
+
+    Returns:
+        The global `TrackingLog`, still open.
+    """
+    bounds = plan_chunks(n_frames, chunk_frames, overlap)
+    work_dir = tempfile.mkdtemp(prefix="chunks_", dir=os.path.dirname(os.path.abspath(log_path)))
+    paths = [os.path.join(work_dir, f"chunk_{k:04d}") for k in range(len(bounds))]
+    run = partial(track_chunk, detector_factory=detector_factory, tracker_kwargs=tracker_kwargs,
+                  video_path=video_path, frame_size=frame_size, batch_size=batch_size,
+                  calibration=calibration)
+    if workers is None:
+        workers = min(os.cpu_count() or 1, len(bounds))
+    try:
+        if workers <= 1:
+            for path, (start, stop) in zip(paths, bounds):
+                run(path, start, stop)
+        else:
+            with ProcessPoolExecutor(workers) as pool:
+                starts, stops = zip(*bounds)
+                list(pool.map(run, paths, starts, stops))
+        return stitch_chunks(paths, bounds, log_path, min_iou, min_frames, meta)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def evaluate_identities(reader, detector, min_iou=0.5, boundaries=(), window=0):
+    """
+    Scores the track IDs of a log against `SyntheticDetector` ground truth.
+
+    Every logged box is assigned to the true player it overlaps most (at
+    least `min_iou`). An identity switch is counted each time a player's
+    track ID differs from the one of its previous logged box.
+
+    Args:
+        boundaries (list): Frames around which switches are also counted
+            separately, e.g. the chunk overlap centres.
+        window (int): Half width of the window around each boundary.
+
+    Returns:
+        dict with matched (rows), recall (matched rows per visible true
+        player), mean_iou (of the matched rows), tracks (distinct IDs),
+        id_switches and boundary_switches.
+    """
+    frames = np.asarray(reader.frame)
+    boxes = np.asarray(reader.bbox)
+    truth = np.full(len(frames), -1, dtype=np.int64)
+    overlap = np.zeros(len(frames))
+    visible = 0
+    offsets = np.searchsorted(frames, np.arange(frames.max() + 2)) if len(frames) else [0]
+    for t in range(len(offsets) - 1):
+        visible += int(detector.visible(t).sum())
+        rows = slice(offsets[t], offsets[t + 1])
+        if rows.start == rows.stop:
+            continue
+        iou = iou_batch(boxes[rows], detector.ground_truth(t))
+        best = iou.argmax(axis=1)
+        overlap[rows] = iou[np.arange(len(best)), best]
+        truth[rows] = np.where(overlap[rows] >= min_iou, best, -1)
+
+    matched = truth >= 0
+    order = np.lexsort((frames[matched], truth[matched]))
+    player = truth[matched][order]
+    track = np.asarray(reader.track_id)[matched][order]
+    frame = frames[matched][order]
+    switch = (player[1:] == player[:-1]) & (track[1:] != track[:-1])
+    near = np.zeros(len(switch), dtype=bool)
+    for boundary in boundaries:
+        near |= np.abs(frame[1:] - boundary) <= window
+    return {
+        "matched": int(matched.sum()),
+        "recall": round(float(matched.sum() / max(visible, 1)), 4),
+        "mean_iou": round(float(overlap[matched].mean()), 4) if matched.any() else 0.,
+        "tracks": int(len(np.unique(track))),
+        "id_switches": int(switch.sum()),
+        "boundary_switches": int((switch & near).sum()),
+    }
+
+
+def parse_args():
+    """Parse input arguments."""
+    parser = argparse.ArgumentParser(description='Chunked tracking benchmark on synthetic detections')
+    parser.add_argument("--frames", type=int, default=6000)
+    parser.add_argument("--players", type=int, default=22)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk", type=int, default=1500, help="Frames per chunk.")
+    parser.add_argument("--overlap", type=int, default=60, help="Frames shared by neighbouring chunks.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log_path", type=str, default=os.path.join(tempfile.gettempdir(), "chunked_log"))
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    from detectors import SyntheticDetector
+
+    args = parse_args()
+    factory = partial(SyntheticDetector, n_players=args.players, seed=args.seed)
+    tracker_kwargs = dict(max_age=1000, min_hits=8, iou_threshold=0.00125, gated=True, dormant_after=30)
+    bounds = plan_chunks(args.frames, args.chunk, args.overlap)
+    boundaries = [(start + bounds[k - 1][1]) // 2 for k, (start, stop) in enumerate(bounds) if k > 0]
+
+    for name, chunk_frames, workers in (("single", args.frames, 1), ("chunked", args.chunk, args.workers)):
+        t0 = time.perf_counter()
+        log = track_video_chunked(args.frames, factory, tracker_kwargs, chunk_frames=chunk_frames,
+                                  overlap=args.overlap, workers=workers, log_path=args.log_path)
+        log.close()
+        elapsed = time.perf_counter() - t0
+        scores = evaluate_identities(TrackingLogReader(args.log_path), factory(), boundaries=boundaries,
+                                     window=args.overlap)
+        print(f"{name:8s} {elapsed:7.2f}s  {args.frames / elapsed:8.1f} fps  {scores}")
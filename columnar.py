@@ -0,0 +1,156 @@
+"""
+Minimal append-only columnar store.
+
+A table is a directory holding one raw little-endian binary file per column
+(`<name>.bin`) and a `meta.json` describing the dtypes, per-row shapes and row
+count. Writers buffer rows in preallocated chunks and flush full chunks to disk,
+so memory use stays constant however long the table grows. Readers map the
+column files with `np.memmap`, so opening a table is free and several processes
+can share the same pages.
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+
+META_FILE = "meta.json"
+
+
+def _column_specs(columns):
+    """Normalises {name: dtype or (dtype, shape)} into {name: (np.dtype, shape)}."""
+    specs = {}
+    for name, spec in columns.items():
+        if isinstance(spec, tuple):
+            dtype, shape = spec
+            shape = (shape,) if np.isscalar(shape) else tuple(shape)
+        else:
+            dtype, shape = spec, ()
+        specs[name] = (np.dtype(dtype).newbyteorder('<'), shape)
+    return specs
+
+
+class ColumnWriter:
+    """
+    Appends rows to a columnar table on disk.
+
+    Args:
+        path (str): Directory of the table. Created if missing.
+        columns (dict): Column name -> dtype, or (dtype, per-row shape).
+        chunk_rows (int): Rows buffered in memory before a chunk is flushed.
+        meta (dict): Extra JSON-serialisable metadata stored with the table.
+        append (bool): Continue an existing table instead of truncating it.
+        rows (int): With `append`, keep only the first `rows` rows, e.g. the
+            ones covered by a checkpoint, and continue after them.
+    """
+
+    def __init__(self, path, columns, chunk_rows=65536, meta=None, append=False, rows=None):
+        self.path = path
+        self.specs = _column_specs(columns)
+        self.chunk_rows = int(chunk_rows)
+        self.meta = dict(meta or {})
+        os.makedirs(path, exist_ok=True)
+
+        self.rows = 0
+        if append and os.path.exists(os.path.join(path, META_FILE)):
+            self.rows = read_meta(path)["rows"]
+            if rows is not None:
+                self.rows = min(self.rows, int(rows))
+        mode = "r+b" if append and self.rows else "wb"
+        self._files = {}
+        for name, (dtype, shape) in self.specs.items():
+            f = open(os.path.join(path, name + ".bin"), mode)
+            f.truncate(self.rows * dtype.itemsize * int(np.prod(shape)))
+            f.seek(0, os.SEEK_END)
+            self._files[name] = f
+        self._chunk = {name: np.empty((self.chunk_rows,) + shape, dtype=dtype)
+                       for name, (dtype, shape) in self.specs.items()}
+        self._fill = 0
+
+    def __len__(self):
+        return self.rows + self._fill
+
+    def append(self, **values):
+        """
+        Appends a block of rows. Every column must be given with the same
+        number of rows; scalars are broadcast.
+        """
+        n = max((np.shape(v)[0] for name, v in values.items()
+                 if np.ndim(v) > len(self.specs[name][1])), default=1)
+        start = 0
+        while start < n:
+            take = min(n - start, self.chunk_rows - self._fill)
+            for name, chunk in self._chunk.items():
+                value = np.asarray(values[name])
+                if value.ndim > len(self.specs[name][1]):
+                    value = value[start:start + take]
+                chunk[self._fill:self._fill + take] = value
+            self._fill += take
+            start += take
+            if self._fill == self.chunk_rows:
+                self.flush()
+
+    def flush(self):
+        """Writes the buffered rows and the current metadata to disk."""
+        if self._fill:
+            for name, f in self._files.items():
+                self._chunk[name][:self._fill].tofile(f)
+                f.flush()
+            self.rows += self._fill
+            self._fill = 0
+        self._write_meta()
+
+    def _write_meta(self):
+        meta = dict(self.meta)
+        meta["rows"] = self.rows
+        meta["columns"] = {name: {"dtype": dtype.str, "shape": list(shape)}
+                           for name, (dtype, shape) in self.specs.items()}
+        tmp = os.path.join(self.path, META_FILE + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(self.path, META_FILE))
+
+    def close(self):
+        """Flushes pending rows and closes the column files."""
+        self.flush()
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_meta(path):
+    """Returns the metadata dict of the table at `path`."""
+    with open(os.path.join(path, META_FILE)) as f:
+        return json.load(f)
+
+
+def open_columns(path, mode="r"):
+    """
+    Maps every column of the table at `path` into memory without copying.
+
+    Returns:
+        tuple: ({name: array}, meta) where each array has `meta['rows']` rows.
+    """
+    meta = read_meta(path)
+    rows = meta["rows"]
+    columns = {}
+    for name, spec in meta["columns"].items():
+        dtype, shape = np.dtype(spec["dtype"]), (rows,) + tuple(spec["shape"])
+        if rows == 0:
+            columns[name] = np.empty(shape, dtype=dtype)
+        else:
+            columns[name] = np.memmap(os.path.join(path, name + ".bin"), dtype=dtype,
+                                      mode=mode, shape=shape)
+    return columns, meta
+
+
+def remove_table(path):
+    """Deletes the table directory at `path` if it exists."""
+    if os.path.isdir(path):
+        shutil.rmtree(path)
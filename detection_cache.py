@@ -0,0 +1,183 @@
+"""
+Persistent per-frame detection store.
+
+Running the detector over a whole match is by far the most expensive stage, while
+tracker parameters and calibration are what usually get tuned. The cache keeps
+every frame's detections as `[x1, y1, x2, y2, conf, cls]` in a columnar table
+(see `columnar.py`) keyed by the video content hash, the model name and the
+confidence/class filter, so later runs can replay them without decoding the
+video or loading the model.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from columnar import ColumnWriter, open_columns, read_meta, remove_table
+
+DETECTION_COLUMNS = {
+    "frame": np.int32,
+    "bbox": (np.float32, 4),
+    "conf": np.float32,
+    "cls": np.int16,
+}
+
+
+def video_fingerprint(video_path, block_size=1 << 20):
+    """
+    Hashes the content of a video file.
+
+    Args:
+        video_path (str): Path to the video.
+        block_size (int): Read size in bytes.
+
+    Returns:
+        str: Hex digest identifying the video content.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(video_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_key(video_hash, model_name, conf_threshold, classes, input_size=None):
+    """
+    Builds the directory name for one (video, model, filter) combination.
+    `input_size` is the (width, height) frames are resized to before detection,
+    or None when the detector sees the native resolution.
+    """
+    spec = json.dumps([video_hash, os.path.basename(str(model_name)),
+                       round(float(conf_threshold), 6), sorted(int(c) for c in classes),
+                       list(input_size) if input_size else None])
+    return hashlib.blake2b(spec.encode(), digest_size=12).hexdigest()
+
+
+class DetectionStore:
+    """
+    Read-only view of a cached detection run.
+
+    Iterating yields one float32 `(N, 6)` array `[x1, y1, x2, y2, conf, cls]` per
+    video frame, including empty arrays for frames without detections.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        columns, self.meta = open_columns(path)
+        self.frames = columns["frame"]
+        self.bbox = columns["bbox"]
+        self.conf = columns["conf"]
+        self.cls = columns["cls"]
+        self.n_frames = int(self.meta["n_frames"])
+        self.fps = self.meta.get("fps")
+        self.offsets = np.searchsorted(self.frames, np.arange(self.n_frames + 1))
+
+    def __len__(self):
+        return self.n_frames
+
+    def frame(self, index):
+        """Returns the `(N, 6)` detection array of video frame `index`."""
+        lo, hi = self.offsets[index], self.offsets[index + 1]
+        dets = np.empty((hi - lo, 6), dtype=np.float32)
+        dets[:, :4] = self.bbox[lo:hi]
+        dets[:, 4] = self.conf[lo:hi]
+        dets[:, 5] = self.cls[lo:hi]
+        return dets
+
+    def __iter__(self):
+        for index in range(self.n_frames):
+            yield self.frame(index)
+
+
+class DetectionRecorder:
+    """
+    Appends detections frame by frame while the detector runs.
+
+    The run only becomes visible to `DetectionCache.lookup` once `close()` is
+    called with `complete=True`, so interrupted runs are never replayed.
+    """
+
+    def __init__(self, path, meta):
+        self.path = path
+        self._tmp = path + ".partial"
+        remove_table(self._tmp)
+        self._writer = ColumnWriter(self._tmp, DETECTION_COLUMNS, meta=meta)
+        self.n_frames = 0
+
+    def append(self, dets):
+        """
+        Records the detections of the next frame.
+
+        Args:
+            dets (np.ndarray): `(N, 6)` array `[x1, y1, x2, y2, conf, cls]`.
+        """
+        dets = np.asarray(dets, dtype=np.float32).reshape(-1, 6)
+        self._writer.append(frame=self.n_frames, bbox=dets[:, :4],
+                            conf=dets[:, 4], cls=dets[:, 5])
+        self.n_frames += 1
+
+    def close(self, complete=True):
+        """Finalises the run. Incomplete runs are discarded."""
+        self._writer.meta["n_frames"] = self.n_frames
+        self._writer.close()
+        if complete:
+            remove_table(self.path)
+            os.replace(self._tmp, self.path)
+        else:
+            remove_table(self._tmp)
+
+
+class DetectionCache:
+    """
+    Directory of cached detection runs.
+
+    Args:
+        root (str): Directory holding one table per cached run.
+    """
+
+    def __init__(self, root="detection_cache"):
+        self.root = root
+        self._fingerprints = {}
+
+    def _fingerprint(self, video_path):
+        # Hashing is only redone when the file changes on disk
+        stat = os.stat(video_path)
+        index_path = os.path.join(self.root, "fingerprints.json")
+        if not self._fingerprints and os.path.exists(index_path):
+            with open(index_path) as f:
+                self._fingerprints = json.load(f)
+        stamp = f"{os.path.abspath(video_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+        if stamp not in self._fingerprints:
+            self._fingerprints[stamp] = video_fingerprint(video_path)
+            os.makedirs(self.root, exist_ok=True)
+            with open(index_path, "w") as f:
+                json.dump(self._fingerprints, f, indent=1)
+        return self._fingerprints[stamp]
+
+    def path_for(self, video_path, model_name, conf_threshold, classes, input_size=None):
+        """Returns the table directory for a (video, model, filter) combination."""
+        key = cache_key(self._fingerprint(video_path), model_name, conf_threshold, classes, input_size)
+        return os.path.join(self.root, key)
+
+    def lookup(self, video_path, model_name, conf_threshold=0.5, classes=(0,), input_size=None):
+        """Returns a `DetectionStore` for a completed run, or None on a miss."""
+        path = self.path_for(video_path, model_name, conf_threshold, classes, input_size)
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            return None
+        if "n_frames" not in read_meta(path):
+            return None
+        return DetectionStore(path)
+
+    def recorder(self, video_path, model_name, conf_threshold=0.5, classes=(0,), input_size=None, fps=None):
+        """Returns a `DetectionRecorder` that fills the cache entry for this run."""
+        path = self.path_for(video_path, model_name, conf_threshold, classes, input_size)
+        meta = {
+            "video": os.path.basename(video_path),
+            "model": os.path.basename(str(model_name)),
+            "conf_threshold": float(conf_threshold),
+            "classes": sorted(int(c) for c in classes),
+            "input_size": list(input_size) if input_size else None,
+            "fps": fps,
+        }
+        return DetectionRecorder(path, meta)
@@ -0,0 +1,285 @@
+"""
+Pluggable player detectors.
+
+Every detector turns a frame (or a batch of frames) into float32 detection
+arrays `[x1, y1, x2, y2, conf]`, plus a `cls` column when `return_class` is set,
+ready to feed `Sort.update`. Class and confidence filtering are done with
+vectorised masks over the whole result, never box by box.
+
+`YoloDetector` wraps `ultralytics.YOLO`. `SyntheticDetector`,
+`ReplayDetector` and `BlobDetector` need no model weights, so the rest of the
+pipeline can be benchmarked and exercised deterministically.
+"""
+import numpy as np
+
+
+class Detector:
+    """
+    Base class of all detectors.
+
+    Subclasses implement `detect_batch`. Calling the detector with a list of
+    frames is the same as `detect_batch`, so a detector can be passed straight
+    to `pipeline.PipelineRunner`.
+
+    Args:
+        return_class (bool): Append the class id as a sixth column.
+    """
+
+    def __init__(self, return_class=False):
+        self.return_class = return_class
+
+    @property
+    def columns(self):
+        return 6 if self.return_class else 5
+
+    def empty(self):
+        return np.empty((0, self.columns), dtype=np.float32)
+
+    def detect(self, frame):
+        """Returns the `(N, 5)` (or `(N, 6)`) detection array of one frame."""
+        return self.detect_batch([frame])[0]
+
+    def detect_batch(self, frames):
+        """Returns one detection array per frame."""
+        raise NotImplementedError
+
+    def __call__(self, frames):
+        return self.detect_batch(frames)
+
+    def _pack(self, xyxy, conf, cls):
+        out = np.empty((len(conf), self.columns), dtype=np.float32)
+        out[:, :4] = xyxy
+        out[:, 4] = conf
+        if self.return_class:
+            out[:, 5] = cls
+        return out
+
+
+class YoloDetector(Detector):
+    """
+    Detector backed by an ultralytics YOLO model.
+
+    Args:
+        model (str or YOLO): Weights path or an already loaded model.
+        classes (tuple): Class ids to keep (0 is "person").
+        conf_threshold (float): Boxes with `conf <= conf_threshold` are dropped.
+        integer_boxes (bool): Truncate coordinates to whole pixels, as the
+            original per-box loop did with `int()`.
+        return_class (bool): Append the class id as a sixth column.
+    """
+
+    def __init__(self, model="yolo11n.pt", classes=(0,), conf_threshold=0.5,
+                 integer_boxes=True, return_class=False):
+        super().__init__(return_class)
+        if isinstance(model, str):
+            from ultralytics import YOLO
+            model = YOLO(model)
+        self.model = model
+        self.classes = np.asarray(classes, dtype=np.int64)
+        self.conf_threshold = conf_threshold
+        self.integer_boxes = integer_boxes
+
+    def boxes_to_array(self, boxes):
+        """Filters one result's `Boxes` with vectorised masks and packs it."""
+        if len(boxes) == 0:
+            return self.empty()
+        xyxy = boxes.xyxy.cpu().numpy()
+        conf = boxes.conf.cpu().numpy()
+        cls = boxes.cls.cpu().numpy().astype(np.int64)
+        keep = np.isin(cls, self.classes) & (conf > self.conf_threshold)
+        xyxy = xyxy[keep]
+        if self.integer_boxes:
+            xyxy = np.trunc(xyxy)
+        return self._pack(xyxy, conf[keep], cls[keep])
+
+    def detect_batch(self, frames):
+        if len(frames) == 0:
+            return []
+        results = self.model(list(frames), verbose=False)
+        return [self.boxes_to_array(result.boxes) for result in results]
+
+
+class SyntheticDetector(Detector):
+    """
+    Deterministic detector that simulates players moving on a frame.
+
+    Players bounce around the frame at constant velocity, optionally with a
+    random walk added on top. Players can be occluded for whole blocks of
+    frames. Each frame some detections are dropped, false positives are added
+    and boxes are jittered. The output for frame t depends only on (seed, t),
+    so runs are reproducible whatever the batch size or call order. Frames can
+    be images (an internal counter gives the index) or plain integer frame
+    indices.
+
+    Args:
+        n_players (int): Number of simulated players.
+        frame_size (tuple): (width, height) of the simulated frame.
+        box_size (tuple): (width, height) of a player box in pixels.
+        max_speed (float): Maximum speed in pixels per frame.
+        miss_rate (float): Probability a player is not detected in a frame.
+        false_positives (float): Mean number of spurious boxes per frame.
+        jitter (float): Standard deviation of box corner noise in pixels.
+        seed (int): Seed of the simulation.
+        random_walk (float): Standard deviation in pixels of the per-frame
+            random walk step added to the constant velocity motion.
+        occlusion_rate (float): Probability a player is hidden for a block
+            of `occlusion_length` frames.
+        occlusion_length (int): Length in frames of an occlusion block.
+        return_class (bool): Append the class id as a sixth column.
+    """
+
+    _WALK_BLOCK = 1024
+
+    def __init__(self, n_players=22, frame_size=(640, 480), box_size=(20, 40), max_speed=3.,
+                 miss_rate=0.05, false_positives=0.5, jitter=1., seed=0, random_walk=0.,
+                 occlusion_rate=0., occlusion_length=25, return_class=False):
+        super().__init__(return_class)
+        self.n_players = n_players
+        self.frame_size = np.asarray(frame_size, dtype=float)
+        self.box_size = np.asarray(box_size, dtype=float)
+        self.miss_rate = miss_rate
+        self.false_positives = false_positives
+        self.jitter = jitter
+        self.seed = seed
+        self.random_walk = random_walk
+        self.occlusion_rate = occlusion_rate
+        self.occlusion_length = max(1, int(occlusion_length))
+        self._walk = np.zeros((1, n_players, 2))
+        rng = np.random.default_rng(seed)
+        self._span = self.frame_size - self.box_size
+        self._start = rng.uniform(0, 1, (n_players, 2)) * self._span
+        self._velocity = rng.uniform(-max_speed, max_speed, (n_players, 2))
+        self._next = 0
+
+    def ground_truth(self, t):
+        """Returns the `(n_players, 4)` true boxes of frame t; row i is player i."""
+        pos = self._start + self._velocity * t
+        if self.random_walk:
+            pos = pos + self._walk_offset(t)
+        # Reflecting the unbounded position into [0, span] makes players bounce
+        pos = np.mod(pos, 2 * self._span)
+        pos = np.where(pos > self._span, 2 * self._span - pos, pos)
+        return np.concatenate([pos, pos + self.box_size], axis=1)
+
+    def _walk_offset(self, t):
+        """Cumulative random walk displacement at frame t, built in fixed seeded blocks."""
+        while len(self._walk) <= t:
+            block = len(self._walk) // self._WALK_BLOCK
+            steps = np.random.default_rng([self.seed, 1, block]).normal(
+                0, self.random_walk, (self._WALK_BLOCK, self.n_players, 2))
+            self._walk = np.concatenate([self._walk, self._walk[-1] + np.cumsum(steps, axis=0)])
+        return self._walk[t]
+
+    def visible(self, t):
+        """Returns the (n_players,) mask of players not occluded at frame t."""
+        if not self.occlusion_rate:
+            return np.ones(self.n_players, dtype=bool)
+        block = int(t) // self.occlusion_length
+        return np.random.default_rng([self.seed, 2, block]).random(self.n_players) >= self.occlusion_rate
+
+    def detect_frame(self, t):
+        """Returns the detections of frame t together with their player ids (-1 for false positives)."""
+        rng = np.random.default_rng([self.seed, int(t)])
+        boxes = self.ground_truth(t)
+        keep = (rng.random(self.n_players) >= self.miss_rate) & self.visible(t)
+        boxes = boxes[keep] + rng.normal(0, self.jitter, (int(keep.sum()), 4))
+        ids = np.flatnonzero(keep)
+        n_fp = rng.poisson(self.false_positives)
+        if n_fp:
+            corner = rng.uniform(0, 1, (n_fp, 2)) * self._span
+            boxes = np.concatenate([boxes, np.concatenate([corner, corner + self.box_size], axis=1)])
+            ids = np.concatenate([ids, np.full(n_fp, -1)])
+        conf = rng.uniform(0.5, 1., len(boxes))
+        return self._pack(boxes, conf, np.zeros(len(boxes))), ids
+
+    def detect_batch(self, frames):
+        out = []
+        for frame in frames:
+            if isinstance(frame, (int, np.integer)):
+                t = int(frame)
+            else:
+                t = self._next
+            self._next = t + 1
+            out.append(self.detect_frame(t)[0])
+        return out
+
+
+class ReplayDetector(Detector):
+    """
+    Replays stored detections in order, e.g. from a `detection_cache.DetectionStore`.
+
+    The frames passed in are ignored, so they may be None. Integer frames are
+    looked up by index when the source supports `frame(index)`.
+
+    Args:
+        source: Iterable of `(N, 5+)` arrays, one per frame.
+        conf_threshold (float): Optional extra confidence filter.
+        return_class (bool): Append the class id as a sixth column.
+    """
+
+    def __init__(self, source, conf_threshold=None, return_class=False):
+        super().__init__(return_class)
+        self.source = source
+        self.conf_threshold = conf_threshold
+        self._iter = iter(source)
+
+    def _filter(self, dets):
+        dets = np.asarray(dets, dtype=np.float32)
+        if dets.ndim != 2 or len(dets) == 0:
+            return self.empty()
+        if self.conf_threshold is not None:
+            dets = dets[dets[:, 4] > self.conf_threshold]
+        cls = dets[:, 5] if dets.shape[1] > 5 else np.zeros(len(dets))
+        return self._pack(dets[:, :4], dets[:, 4], cls)
+
+    def detect_batch(self, frames):
+        out = []
+        for frame in frames:
+            if isinstance(frame, (int, np.integer)) and hasattr(self.source, "frame"):
+                dets = self.source.frame(int(frame))
+            else:
+                dets = next(self._iter, None)
+                if dets is None:
+                    dets = self.empty()
+            out.append(self._filter(dets))
+        return out
+
+
+class BlobDetector(Detector):
+    """
+    Stub image detector that finds dark blobs, e.g. players drawn on a pitch.
+
+    Like a detection model with a fixed input size, the frame is first
+    downscaled to fit `input_size` and blobs smaller than `min_size` pixels at
+    that resolution are missed, so it loses distant players the same way a
+    downscaled full-frame pass does. Image-based stages such as
+    `tiling.TiledDetector` can be exercised with it.
+
+    Args:
+        input_size (int): Longest side of the detector input.
+        min_size (int): Smallest detectable blob width and height, in input pixels.
+        threshold (int): Grey level below which a pixel belongs to a blob.
+        return_class (bool): Append the class id as a sixth column.
+    """
+
+    def __init__(self, input_size=640, min_size=4, threshold=80, return_class=False):
+        super().__init__(return_class)
+        self.input_size = input_size
+        self.min_size = min_size
+        self.threshold = threshold
+
+    def detect_batch(self, frames):
+        import cv2
+        out = []
+        for frame in frames:
+            gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            scale = min(1., self.input_size / max(gray.shape))
+            if scale < 1.:
+                gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            _, _, stats, _ = cv2.connectedComponentsWithStats((gray < self.threshold).astype(np.uint8))
+            x, y, w, h, area = stats[1:].T
+            keep = (w >= self.min_size) & (h >= self.min_size)
+            xyxy = np.stack([x, y, x + w, y + h], axis=1)[keep] / scale
+            conf = area[keep] / (w[keep] * h[keep])  # Fill ratio of the blob's box
+            out.append(self._pack(xyxy, conf, np.zeros(len(conf))))
+        return out
@@ -0,0 +1,416 @@
+"""
+Shared-memory frame ring and a multi-process decode -> inference -> encode pipeline.
+
+Threads (`pipeline.PipelineRunner`) overlap the stages only as far as the GIL
+allows, and sending every 1080p BGR frame (6 MB) pickled through a
+`multiprocessing.Queue` costs more than it saves. `FrameRing` is a fixed set
+of frame slots in `multiprocessing.shared_memory`, each seen by every process
+as a preallocated `ndarray` view; stages pass slot indices and the small
+detection arrays only:
+
+    decode process  --slot-->  inference process  --slot, dets-->
+    tracking (caller process, in frame order)  --slot-->  encode process
+
+The decoder decodes straight into a free slot (`cap.read(view)`), the
+annotations are drawn into the slot in place and the encoder writes from it.
+Slots are reference counted: whoever holds a slot either hands its reference
+on with the slot index or releases it, and a slot whose count drops to zero
+returns to the free list. The number of slots bounds the frames in flight,
+which is the back-pressure of the pipeline.
+
+Running this module compares the serial loop, the threaded pipeline and this
+one on a generated video with a detector that holds the GIL:
+
+    python frame_ring.py --frames 300 --frame_size 1920 1080 --detect_ms 20
+"""
+import argparse
+import multiprocessing as mp
+import os
+import queue
+import tempfile
+import time
+import traceback
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from instrumentation import Instrumentation
+
+
+class FrameRing:
+    """
+    Fixed slots of frames in shared memory, reference counted.
+
+    A ring is created in the parent process and handed to child processes as
+    a `Process` argument; children attach to the same memory.
+
+    Args:
+        slots (int): Number of frames.
+        shape (tuple): Shape of one frame, e.g. (1080, 1920, 3).
+        dtype: Frame dtype.
+    """
+
+    def __init__(self, slots, shape, dtype=np.uint8):
+        self.slots = int(slots)
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self._shm = shared_memory.SharedMemory(create=True, size=self.slots * self.frame_bytes)
+        self._owner = True
+        self._refs = mp.Array("i", self.slots)
+        self._free = mp.Queue()
+        for slot in range(self.slots):
+            self._free.put(slot)
+        self._attach()
+
+    def _attach(self):
+        self._frames = np.ndarray((self.slots,) + self.shape, dtype=self.dtype, buffer=self._shm.buf)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_shm"] = self._shm.name
+        state["_owner"] = False
+        del state["_frames"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._shm = shared_memory.SharedMemory(name=self._shm)
+        # Only the creating process may unlink the memory (spawned children register it again)
+        resource_tracker.unregister(self._shm._name, "shared_memory")
+        self._attach()
+
+    def view(self, slot):
+        """Returns the `ndarray` view of a slot."""
+        return self._frames[slot]
+
+    def acquire(self, timeout=None):
+        """Takes a free slot with one reference; blocks while every slot is in use (raises `queue.Empty` on timeout)."""
+        slot = self._free.get(timeout=timeout)
+        with self._refs.get_lock():
+            self._refs[slot] = 1
+        return slot
+
+    def retain(self, slot, count=1):
+        """Adds references to a slot, for a stage keeping it while handing it on."""
+        with self._refs.get_lock():
+            self._refs[slot] += count
+
+    def release(self, slot):
+        """Drops one reference; the slot is recycled when none is left."""
+        with self._refs.get_lock():
+            self._refs[slot] -= 1
+            free = self._refs[slot] == 0
+        if free:
+            self._free.put(slot)
+
+    def in_use(self):
+        """Number of slots currently referenced."""
+        with self._refs.get_lock():
+            return sum(1 for count in self._refs[:] if count > 0)
+
+    def close(self):
+        """Detaches this process; the creating process also frees the memory."""
+        self._frames = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+def _stage(target, errors, stop, *args):
+    """Runs a pipeline stage in a child process, reporting its exception to the parent."""
+    try:
+        target(stop, *args)
+    except BaseException:
+        errors.put(traceback.format_exc())
+        stop.set()
+
+
+def _decode(stop, ring, frames_q, source, frame_size, start=0):
+    import cv2
+    cap = None
+    index = start
+    try:
+        cap = cv2.VideoCapture(int(source) if str(source).isdigit() else source)
+        if start:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        while not stop.is_set():
+            try:
+                slot = ring.acquire(timeout=0.1)
+            except queue.Empty:
+                continue
+            started = time.perf_counter()
+            if frame_size:
+                ret, frame = cap.read()
+                if ret:
+                    cv2.resize(frame, frame_size, dst=ring.view(slot))
+            else:
+                # Decodes in place into the shared slot
+                ret, _ = cap.read(ring.view(slot))
+            if not ret:
+                ring.release(slot)
+                break
+            frames_q.put((index, slot, time.perf_counter() - started))
+            index += 1
+    finally:
+        if cap is not None:
+            cap.release()
+        frames_q.put(None)
+
+
+def _infer(stop, ring, frames_q, dets_q, detector_factory, batch_size):
+    detect = detector_factory()
+    done = False
+    while not done and not stop.is_set():
+        item = frames_q.get()
+        if item is None:
+            break
+        batch = [item]
+        # Fill the batch with whatever is already decoded, up to batch_size
+        while len(batch) < batch_size:
+            try:
+                item = frames_q.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                done = True
+                break
+            batch.append(item)
+        start = time.perf_counter()
+        detections = detect([ring.view(slot) for _, slot, _ in batch])
+        elapsed = (time.perf_counter() - start) / len(batch)
+        for (index, slot, decoded), dets in zip(batch, detections):
+            dets_q.put((index, slot, np.asarray(dets), decoded, elapsed))
+    dets_q.put(None)
+
+
+def _encode(stop, ring, out_q, path, fps, size):
+    import cv2
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+    try:
+        while True:
+            slot = out_q.get()
+            if slot is None:
+                break
+            writer.write(ring.view(slot))
+            ring.release(slot)
+    finally:
+        writer.release()
+
+
+class SharedMemoryPipeline:
+    """
+    Runs a video through decode, inference and encode processes sharing a `FrameRing`.
+
+    Tracking stays in the calling process, in frame order, so the outputs
+    are the same as `PipelineRunner`'s.
+
+    Args:
+        detector_factory (callable): Picklable callable building the batched
+            detector in the inference process, e.g.
+            `functools.partial(YoloDetector, "yolo11n.pt", return_class=True)`.
+        source (str): Video file, stream URL or camera index.
+        frame_size (tuple): Optional (width, height) frames are resized to.
+        batch_size (int): Frames per detector call.
+        slots (int): Frames in flight; defaults to room for two batches and
+            the tracking and encoding stages.
+        instrumentation (Instrumentation): Records the decode and detect times
+            measured in the child processes, and the wait of the tracking stage.
+    """
+
+    def __init__(self, detector_factory, source, frame_size=None, batch_size=8, slots=None,
+                 instrumentation=None):
+        self.detector_factory = detector_factory
+        self.source = source
+        self.frame_size = tuple(frame_size) if frame_size else None
+        self.batch_size = max(1, int(batch_size))
+        self.slots = slots or 2 * self.batch_size + 4
+        self.stats = instrumentation if instrumentation is not None else Instrumentation(enabled=False)
+        self.completed = False
+
+    def _frame_shape(self):
+        if self.frame_size:
+            return self.frame_size[1], self.frame_size[0], 3
+        import cv2
+        cap = cv2.VideoCapture(int(self.source) if str(self.source).isdigit() else self.source)
+        shape = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), 3
+        cap.release()
+        return shape
+
+    def run(self, process, output=None, start=0):
+        """
+        Runs until the source ends or `process` asks to stop.
+
+        Args:
+            process (callable): `process(index, frame, detections)` called in
+                frame order; `frame` is the slot's view and may be drawn on.
+                Returns the frame to encode (the view itself, or an array of
+                the same shape), None to encode nothing, or False to stop.
+            output (tuple): Optional (path, fps, (width, height)) of the video
+                written by the encode process.
+            start (int): First frame to decode, e.g. to resume from a checkpoint.
+
+        Returns:
+            int: Number of frames processed.
+        """
+        self.completed = False
+        ring = FrameRing(self.slots, self._frame_shape())
+        stop, errors = mp.Event(), mp.Queue()
+        frames_q, dets_q, out_q = mp.Queue(), mp.Queue(), mp.Queue()
+        stages = [(_decode, ring, frames_q, self.source, self.frame_size, start),
+                  (_infer, ring, frames_q, dets_q, self.detector_factory, self.batch_size)]
+        if output is not None:
+            stages.append((_encode, ring, out_q) + tuple(output))
+        processes = [mp.Process(target=_stage, args=(stage[0], errors, stop) + stage[1:], daemon=True)
+                     for stage in stages]
+        for p in processes:
+            p.start()
+
+        processed = 0
+        try:
+            while True:
+                with self.stats.stage("wait"):
+                    item = self._next(dets_q, stop)
+                if item is None:
+                    self.completed = not stop.is_set()
+                    break
+                index, slot, detections, decoded, detected = item
+                self.stats.record("decode", decoded)
+                self.stats.record("detect", detected)
+                frame = ring.view(slot)
+                result = process(index, frame, detections)
+                processed += 1
+                if output is not None and result is not None and result is not False:
+                    if result is not frame:
+                        np.copyto(frame, result)
+                    # The encoder takes over this stage's reference
+                    out_q.put(slot)
+                else:
+                    ring.release(slot)
+                if result is False:
+                    break
+        finally:
+            if output is not None:
+                out_q.put(None)
+                if not stop.is_set():
+                    processes[-1].join()
+            stop.set()
+            for p in processes:
+                p.join(timeout=5)
+                if p.is_alive():
+                    p.terminate()
+            for q in (frames_q, dets_q, out_q):
+                q.cancel_join_thread()
+            ring.close()
+        if not errors.empty():
+            raise RuntimeError("pipeline stage failed:\n" + errors.get())
+        return processed
+
+    @staticmethod
+    def _next(dets_q, stop):
+        while True:
+            try:
+                return dets_q.get(timeout=0.1)
+            except queue.Empty:
+                if stop.is_set():
+                    return None
+
+
+class BusyDetector:
+    """Benchmark stand-in for a model: holds the GIL for `detect_ms` per frame and returns synthetic boxes."""
+
+    def __init__(self, detect_ms=20., n_players=22):
+        self.detect_ms = detect_ms
+        self.n_players = n_players
+
+    def __call__(self, frames):
+        out = []
+        for frame in frames:
+            end = time.perf_counter() + self.detect_ms / 1e3
+            while time.perf_counter() < end:
+                pass
+            seed = int(frame[0, 0, 0])
+            boxes = np.random.default_rng(seed).uniform(0, 400, (self.n_players, 2))
+            out.append(np.concatenate([boxes, boxes + 30, np.ones((self.n_players, 2))], axis=1))
+        return out
+
+
+def parse_args():
+    """Parse input arguments."""
+    parser = argparse.ArgumentParser(description='Serial, threaded and shared-memory process pipelines')
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--frame_size", type=int, nargs=2, default=[1920, 1080])
+    parser.add_argument("--detect_ms", type=float, default=20., help="GIL-holding detector time per frame.")
+    parser.add_argument("--batch_size", type=int, default=8)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    from functools import partial
+
+    import cv2
+
+    from batch_sort import BatchedSort
+    from pipeline import PipelineRunner
+
+    args = parse_args()
+    width, height = args.frame_size
+    work_dir = tempfile.mkdtemp(prefix="frame_ring_")
+    video = os.path.join(work_dir, "input.mp4")
+    writer = cv2.VideoWriter(video, cv2.VideoWriter_fourcc(*"mp4v"), 25, (width, height))
+    rng = np.random.default_rng(0)
+    noise = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    for t in range(args.frames):
+        writer.write(np.roll(noise, 8 * t, axis=1))
+    writer.release()
+    factory = partial(BusyDetector, args.detect_ms)
+
+    def make_process():
+        tracker = BatchedSort()
+
+        def process(index, frame, detections):
+            tracker.update(detections[:, :5])
+            cv2.rectangle(frame, (10, 10), (100, 100), (0, 0, 255), 2)
+            return frame
+        return process
+
+    def serial(output):
+        cap, detect, process = cv2.VideoCapture(video), factory(), make_process()
+        out = cv2.VideoWriter(output, cv2.VideoWriter_fourcc(*"mp4v"), 25, (width, height))
+        index = 0
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            out.write(process(index, frame, detect([frame])[0]))
+            index += 1
+        cap.release()
+        out.release()
+        return index
+
+    def threaded(output):
+        cap = cv2.VideoCapture(video)
+        out = cv2.VideoWriter(output, cv2.VideoWriter_fourcc(*"mp4v"), 25, (width, height))
+        processed = PipelineRunner(factory(), args.batch_size).run(cap.read, make_process(), out.write)
+        cap.release()
+        out.release()
+        return processed
+
+    def processes(output):
+        return SharedMemoryPipeline(factory, video, batch_size=args.batch_size).run(
+            make_process(), (output, 25, (width, height)))
+
+    frame = noise
+    start = time.perf_counter()
+    for _ in range(20):
+        q = mp.Queue()
+        q.put(frame)
+        q.get()
+    print(f"pickling one {width}x{height} frame through a multiprocessing.Queue: "
+          f"{(time.perf_counter() - start) / 20 * 1e3:.1f} ms")
+    print(f"{os.cpu_count()} CPU cores")
+    for name, run in (("serial", serial), ("threaded", threaded), ("shared memory", processes)):
+        start = time.perf_counter()
+        n = run(os.path.join(work_dir, name.replace(" ", "_") + ".mp4"))
+        elapsed = time.perf_counter() - start
+        print(f"{name:14s} {n} frames in {elapsed:6.2f}s  {n / elapsed:6.1f} fps")
@@ -1,18 +1,72 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.patches import Rectangle, Circle, Arc
-import seaborn as sns
-import pandas as pd
-from scipy.ndimage import gaussian_filter
-from matplotlib.colors import LinearSegmentedColormap
+
+# matplotlib and scipy are imported where they are used: binning and the live
+# accumulator need NumPy alone, so neither the tracking process nor a spawned
+# worker loads the plotting stack until a heatmap is drawn.
+
+
+def _gaussian_filter(grid, sigma):
+    from scipy.ndimage import gaussian_filter
+    return gaussian_filter(grid, sigma=sigma)
+
+
+@lru_cache(maxsize=None)
+def gamma_colormap():
+    """Custom gamma colormap shared by every heatmap"""
+    from matplotlib.colors import LinearSegmentedColormap
+    return LinearSegmentedColormap.from_list(
+        'gamma_cmap',
+        [(0, 'black'), (0.2, 'blue'), (0.4, 'green'), (0.6, 'yellow'), (0.8, 'orange'), (1, 'red')]
+    )
+
+
+# State of the heatmap writer processes, set once by _init_writer
+_writer_state = {}
+
+
+def _init_writer(pitch, lut, alpha):
+    """Precompute the blended pitch and colour table shared by every image"""
+    _writer_state.update(
+        base=(pitch * (1 - alpha) * 255).astype(np.float32),
+        tint=(lut * alpha * 255).astype(np.float32),
+    )
+
+
+def _composite(grid, base, tint):
+    """Colour a (bins_x, bins_y) grid and blend it over the pitch, returning RGB uint8"""
+    peak = grid.max()
+    if peak > 0:
+        index = (grid * ((len(tint) - 1) / peak)).astype(np.intp)
+    else:
+        index = np.zeros(grid.shape, np.intp)
+    # Nearest neighbour upsampling onto the pitch raster, y axis pointing up
+    height, width = base.shape[:2]
+    cols = np.arange(width) * grid.shape[0] // width
+    rows = (height - 1 - np.arange(height)) * grid.shape[1] // height
+    image = tint[index[cols[None, :], rows[:, None]]]
+    image += base
+    return image.astype(np.uint8)
+
+
+def _write_heatmap(output_file, grid):
+    import matplotlib.image as mpimg
+    mpimg.imsave(output_file, _composite(grid, _writer_state['base'], _writer_state['tint']))
+    return output_file
+
 
 class FootballHeatmap:
     def __init__(self, field_length=105, field_width=68):
         self.field_length = field_length
         self.field_width = field_width
-        
+        self._pitch_cache = {}
+
     def draw_field(self, ax):
         """Draw a football field with proper markings"""
+        from matplotlib.patches import Rectangle, Circle, Arc
         # Set background color
         ax.set_facecolor('#1a1a1a')
         
@@ -55,6 +109,7 @@ class FootballHeatmap:
     def generate_heatmap(self, tracking_data, output_file='heatmap.png', 
                         player_id=None, sigma=1):
         """Generate heatmap from tracking data"""
+        import matplotlib.pyplot as plt
         plt.figure(figsize=(15, 10))
         ax = plt.gca()
         
@@ -65,9 +120,8 @@ class FootballHeatmap:
         if player_id is not None:
             tracking_data = tracking_data[tracking_data['player_id'] == player_id]
         
-        # Normalize coordinates to field dimensions
-        x_normalized = tracking_data['x'] * self.field_length / tracking_data['x'].max()
-        y_normalized = tracking_data['y'] * self.field_width / tracking_data['y'].max()
+        # Pitch coordinates, or pixel coordinates normalized to field dimensions
+        x_normalized, y_normalized = self.field_coordinates(tracking_data)
         
         # Create heatmap
         heatmap, xedges, yedges = np.histogram2d(
@@ -78,14 +132,11 @@ class FootballHeatmap:
         )
         
         # Apply Gaussian smoothing
-        heatmap = gaussian_filter(heatmap, sigma=sigma)
-        
-        # Define a custom gamma colormap
-        gamma_cmap = LinearSegmentedColormap.from_list(
-            'gamma_cmap', 
-            [(0, 'black'), (0.2, 'blue'), (0.4, 'green'), (0.6, 'yellow'), (0.8, 'orange'), (1, 'red')]
-        )
+        heatmap = _gaussian_filter(heatmap, sigma=sigma)
         
+        # Use the custom gamma colormap
+        gamma_cmap = gamma_colormap()
+
         # Plot heatmap using the custom gamma colormap
         plt.imshow(
             heatmap.T,
@@ -115,3 +166,302 @@ class FootballHeatmap:
         plt.close()
         
         return output_file
+
+    def pitch_raster(self, pixels_per_meter=10):
+        """Render the field markings once into an RGB array covering exactly the field"""
+        if pixels_per_meter not in self._pitch_cache:
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            dpi = 100
+            fig = Figure(figsize=(self.field_length * pixels_per_meter / dpi,
+                                  self.field_width * pixels_per_meter / dpi), dpi=dpi)
+            canvas = FigureCanvasAgg(fig)
+            ax = fig.add_axes([0, 0, 1, 1])
+            self.draw_field(ax)
+            ax.set_xlim(0, self.field_length)
+            ax.set_ylim(0, self.field_width)
+            ax.axis('off')
+            fig.set_facecolor('#1a1a1a')
+            canvas.draw()
+            self._pitch_cache[pixels_per_meter] = np.asarray(canvas.buffer_rgba())[..., :3] / 255.
+        return self._pitch_cache[pixels_per_meter]
+
+    def field_coordinates(self, tracking_data):
+        """
+        Returns the x and y field positions in metres of every row with one.
+
+        Calibrated data ('pitch_x' / 'pitch_y', see `calibration.py`) is used
+        as is. Otherwise the box centres are normalised by the maximum over all
+        players, so every player map and the team map share the same field
+        coordinates.
+        """
+        try:
+            x = np.asarray(tracking_data['pitch_x'], dtype=float)
+            y = np.asarray(tracking_data['pitch_y'], dtype=float)
+        except KeyError:
+            x = None
+        if x is None or not np.isfinite(x).any():
+            x = np.asarray(tracking_data['x'], dtype=float)
+            y = np.asarray(tracking_data['y'], dtype=float)
+            return x * self.field_length / x.max(), y * self.field_width / y.max()
+        return x, y
+
+    def bin_players(self, tracking_data, bins=50, sigma=1):
+        """
+        Bin every player at once and smooth all grids in one batch.
+
+        Positions come from `field_coordinates`; rows without one are skipped.
+
+        Returns player_ids, (n_players, bins, bins) player grids and the team grid
+        """
+        player_ids, player_index = np.unique(np.asarray(tracking_data['player_id']), return_inverse=True)
+        x_normalized, y_normalized = self.field_coordinates(tracking_data)
+        valid = np.isfinite(x_normalized) & np.isfinite(y_normalized)
+        if not valid.all():
+            player_index, x_normalized, y_normalized = player_index[valid], x_normalized[valid], y_normalized[valid]
+
+        grids, _ = np.histogramdd(
+            (player_index, x_normalized, y_normalized),
+            bins=(len(player_ids), bins, bins),
+            range=[[-0.5, len(player_ids) - 0.5], [0, self.field_length], [0, self.field_width]]
+        )
+        team = _gaussian_filter(grids.sum(axis=0), sigma=sigma)
+        grids = _gaussian_filter(grids, sigma=(0, sigma, sigma))
+        return player_ids, grids, team
+
+    def generate_heatmaps(self, tracking_data, output_pattern='player_{}_heatmap.png',
+                          team_file='team_heatmap.png', sigma=1, bins=50,
+                          pixels_per_meter=10, alpha=0.7, workers=None):
+        """
+        Generate the team heatmap and one heatmap per player in a single pass.
+
+        All players are binned with one histogram, smoothed together and
+        composited onto a pitch rendered once, without creating a matplotlib
+        figure per player. PNGs are written by a process pool
+        (`workers=0` writes them in this process).
+        """
+        player_ids, grids, team = self.bin_players(tracking_data, bins=bins, sigma=sigma)
+        return self.write_heatmaps(player_ids, grids, team, output_pattern, team_file,
+                                   pixels_per_meter=pixels_per_meter, alpha=alpha, workers=workers)
+
+    def write_heatmaps(self, player_ids, grids, team=None, output_pattern='player_{}_heatmap.png',
+                       team_file='team_heatmap.png', pixels_per_meter=10, alpha=0.7, workers=None):
+        """Write already binned (bins_x, bins_y) grids as PNGs over the pitch raster"""
+        pitch = self.pitch_raster(pixels_per_meter)
+        lut = gamma_colormap()(np.linspace(0, 1, 256))[:, :3]
+
+        jobs = [(output_pattern.format(player_id), grid) for player_id, grid in zip(player_ids, grids)]
+        if team_file and team is not None:
+            jobs.insert(0, (team_file, team))
+        if not jobs:
+            return []
+        if workers is None:
+            workers = min(os.cpu_count() or 1, len(jobs))
+        if workers <= 1 or len(jobs) <= 1:
+            _init_writer(pitch, lut, alpha)
+            return [_write_heatmap(output_file, grid) for output_file, grid in jobs]
+        with ProcessPoolExecutor(workers, initializer=_init_writer, initargs=(pitch, lut, alpha)) as pool:
+            return list(pool.map(_write_heatmap, *zip(*jobs), chunksize=max(1, len(jobs) // (4 * workers))))
+
+
+class HeatmapAccumulator:
+    """
+    Streaming team and per-player occupancy grids, updated frame by frame.
+
+    Each frame costs O(detections) and a snapshot can be taken at any time, so
+    heatmaps are available mid-match without keeping the tracking data. Three
+    variants are supported:
+
+    - cumulative (default): every frame since the start counts the same;
+    - `half_life` (frames): older frames fade out exponentially;
+    - `window` (frames): only the last `window` frames count, e.g. the last
+      five minutes. Expired positions are subtracted from the grids using a
+      ring buffer of recent cells.
+
+    Tracker coordinates are mapped onto the field using the fixed frame size,
+    or projected to pitch metres when a `calibration` is given, so grids do
+    not depend on the data seen so far. With `window` or `half_life` the grid
+    of a track ID is dropped, and its row reused, once none of its positions
+    are left in the window or their decayed weight falls below `min_weight`
+    frames. Memory then depends on the grid size, the IDs seen recently and
+    the window, never on the match length; cumulative grids keep every ID.
+    """
+
+    def __init__(self, frame_size, field_length=105, field_width=68, bins=50,
+                 half_life=None, window=None, calibration=None, min_weight=1e-3):
+        if half_life is not None and window is not None:
+            raise ValueError("half_life and window can not be combined")
+        self.frame_size = np.asarray(frame_size, dtype=float)
+        self.calibration = calibration
+        self.field_length = field_length
+        self.field_width = field_width
+        self.bins = bins
+        self.window = window
+        self.min_weight = min_weight
+        self.frame_count = 0
+
+        self._team = np.zeros(bins * bins)
+        self._players = np.zeros((16, bins * bins))
+        # Weight added to each row and not yet expired, in the units of the grids
+        self._mass = np.zeros(16)
+        # Track ID -> row, in order of first appearance; rows of dropped IDs are reused
+        self._row_of = {}
+        self._free = []
+        self._n_rows = 0
+
+        # Exponential decay: frame t is added with weight growth**t and grids are
+        # rescaled by growth**-t when read, so updates never touch the whole grid
+        self._growth = 0.5 ** (-1. / half_life) if half_life else None
+        self._weight = 1.
+
+        # Sliding window: ring buffer of (frame, player row, cell) still counted
+        self._ring = np.zeros((1024, 3), dtype=np.int64)
+        self._head = 0
+        self._size = 0
+
+    def _rows(self, track_ids):
+        track_ids = track_ids.tolist()
+        new = sum(track_id not in self._row_of for track_id in track_ids)
+        if new > len(self._free):
+            self._reclaim(keep=track_ids)
+        rows = np.empty(len(track_ids), dtype=np.int64)
+        for i, track_id in enumerate(track_ids):
+            row = self._row_of.get(track_id)
+            if row is None:
+                if self._free:
+                    row = self._free.pop()
+                else:
+                    row = self._n_rows
+                    self._n_rows += 1
+                self._row_of[track_id] = row
+            rows[i] = row
+        if self._n_rows > len(self._players):
+            grown = np.zeros((2 * self._n_rows, self.bins * self.bins))
+            grown[:len(self._players)] = self._players
+            self._players = grown
+            self._mass = np.append(self._mass, np.zeros(len(grown) - len(self._mass)))
+        return rows
+
+    def _reclaim(self, keep=()):
+        """Drops the IDs whose positions all left the window or decayed below `min_weight`, freeing their rows"""
+        if (self.window is None and self._growth is None) or not self._row_of:
+            return
+        limit = 0.5 if self.window is not None else self.min_weight * self._weight
+        ids = np.fromiter(self._row_of, dtype=np.int64, count=len(self._row_of))
+        rows = np.fromiter(self._row_of.values(), dtype=np.int64, count=len(self._row_of))
+        dead = (self._mass[rows] < limit) & ~np.isin(ids, list(keep))
+        for track_id, row in zip(ids[dead].tolist(), rows[dead].tolist()):
+            del self._row_of[track_id]
+            self._players[row] = 0.
+            self._mass[row] = 0.
+            self._free.append(row)
+
+    def _cells(self, results):
+        if self.calibration is not None:
+            pitch = self.calibration.project_boxes(results[:, :4])
+            col = np.clip((pitch[:, 0] / self.field_length * self.bins).astype(np.int64), 0, self.bins - 1)
+            row = np.clip((pitch[:, 1] / self.field_width * self.bins).astype(np.int64), 0, self.bins - 1)
+            return col * self.bins + row
+        center_x = (results[:, 0] + results[:, 2]) / 2
+        center_y = (results[:, 1] + results[:, 3]) / 2
+        col = np.clip((center_x / self.frame_size[0] * self.bins).astype(np.int64), 0, self.bins - 1)
+        row = np.clip((center_y / self.frame_size[1] * self.bins).astype(np.int64), 0, self.bins - 1)
+        return col * self.bins + row
+
+    def update(self, resultsTracker):
+        """Add one frame of tracker output, an (N, 5) [x1, y1, x2, y2, track_id] array"""
+        frame = self.frame_count
+        self.frame_count += 1
+        if self.window is not None:
+            self._expire(frame - self.window + 1)
+        # Every frame advances the decay, with or without tracks
+        weight = 1.
+        if self._growth is not None:
+            self._weight *= self._growth
+            if self._weight > 1e100:
+                self._team /= self._weight
+                self._players /= self._weight
+                self._mass /= self._weight
+                self._weight = 1.
+            weight = self._weight
+        results = np.asarray(resultsTracker, dtype=float).reshape(-1, 5)
+        if len(results) == 0:
+            return
+        cells = self._cells(results)
+        rows = self._rows(results[:, 4].astype(np.int64))
+
+        np.add.at(self._team, cells, weight)
+        np.add.at(self._players, (rows, cells), weight)
+        np.add.at(self._mass, rows, weight)
+
+        if self.window is not None:
+            self._push(np.stack([np.full(len(cells), frame), rows, cells], axis=1))
+
+    def _push(self, events):
+        n = len(events)
+        if self._size + n > len(self._ring):
+            ordered = self._ordered()
+            self._ring = np.zeros((max(2 * len(self._ring), self._size + n), 3), dtype=np.int64)
+            self._ring[:self._size] = ordered
+            self._head = 0
+        index = (self._head + self._size + np.arange(n)) % len(self._ring)
+        self._ring[index] = events
+        self._size += n
+
+    def _ordered(self):
+        index = (self._head + np.arange(self._size)) % len(self._ring)
+        return self._ring[index]
+
+    def _expire(self, oldest_frame):
+        # Events are stored in frame order, so expired ones sit at the head
+        capacity = len(self._ring)
+        first = self._ring[self._head:min(self._head + self._size, capacity), 0]
+        expired = int(np.searchsorted(first, oldest_frame))
+        if expired == len(first) and len(first) < self._size:
+            second = self._ring[:self._size - len(first), 0]
+            expired += int(np.searchsorted(second, oldest_frame))
+        if not expired:
+            return
+        index = (self._head + np.arange(expired)) % len(self._ring)
+        events = self._ring[index]
+        np.subtract.at(self._team, events[:, 2], 1.)
+        np.subtract.at(self._players, (events[:, 1], events[:, 2]), 1.)
+        np.subtract.at(self._mass, events[:, 1], 1.)
+        self._head = (self._head + expired) % len(self._ring)
+        self._size -= expired
+
+    def _scale(self):
+        return 1. / self._weight if self._growth is not None else 1.
+
+    def player_ids(self):
+        """Track IDs with a grid, in order of first appearance"""
+        self._reclaim()
+        return list(self._row_of)
+
+    def snapshot(self, player_id=None, sigma=0):
+        """Copy of the team grid, or of one player's grid, as a (bins_x, bins_y) array"""
+        if player_id is None:
+            grid = self._team
+        elif player_id in self._row_of:
+            grid = self._players[self._row_of[player_id]]
+        else:
+            grid = np.zeros(self.bins * self.bins)
+        grid = (grid * self._scale()).reshape(self.bins, self.bins)
+        return _gaussian_filter(grid, sigma=sigma) if sigma else grid
+
+    def snapshot_all(self, sigma=1):
+        """Player ids, (n_players, bins_x, bins_y) player grids and the team grid"""
+        self._reclaim()
+        rows = np.fromiter(self._row_of.values(), dtype=np.int64, count=len(self._row_of))
+        grids = (self._players[rows] * self._scale()).reshape(len(rows), self.bins, self.bins)
+        team = self.snapshot(sigma=sigma)
+        if sigma:
+            grids = _gaussian_filter(grids, sigma=(0, sigma, sigma))
+        return np.array(list(self._row_of)), grids, team
+
+    def save(self, output_pattern='live_player_{}_heatmap.png', team_file='live_team_heatmap.png',
+             sigma=1, heatmap=None, **kwargs):
+        """Write the current snapshot with `FootballHeatmap.write_heatmaps`"""
+        heatmap = heatmap or FootballHeatmap(self.field_length, self.field_width)
+        player_ids, grids, team = self.snapshot_all(sigma=sigma)
+        return heatmap.write_heatmaps(player_ids, grids, team, output_pattern, team_file, **kwargs)
@@ -0,0 +1,199 @@
+"""
+Per-stage timing of the processing loop.
+
+Each stage (decode, resize, detect, track, kinematics, draw, write, display...)
+gets a fixed-size ring buffer of its most recent per-frame wall times, so
+memory stays constant over a whole match and percentiles describe the last
+`capacity` frames. Frame completions are timestamped in another ring for a
+rolling frames-per-second figure, and gauges hold instantaneous values such as
+the number of active and dormant tracks.
+
+    stats = Instrumentation(report_every=250)
+    with stats.stage("track"):
+        results = tracker.update(dets)
+    stats.gauge("tracks_active", tracker.active_count)
+    stats.frame_done()
+
+A disabled `Instrumentation` hands out one shared no-op context manager and
+returns immediately from every other call, so instrumented code can stay in
+place at close to zero cost. Snapshots can be printed, written as JSON or as a
+Prometheus text-format file for a node-exporter textfile collector.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+import numpy as np
+
+_DISABLED = nullcontext()
+
+
+class _Ring:
+    """Fixed-size ring buffer of float samples plus a running count and sum."""
+
+    def __init__(self, capacity):
+        self.values = np.zeros(capacity)
+        self.count = 0
+        self.total = 0.
+
+    def push(self, value):
+        self.values[self.count % len(self.values)] = value
+        self.count += 1
+        self.total += value
+
+    def recent(self):
+        """Returns the buffered samples, oldest first."""
+        n = len(self.values)
+        if self.count <= n:
+            return self.values[:self.count].copy()
+        start = self.count % n
+        return np.concatenate([self.values[start:], self.values[:start]])
+
+
+class _Stage:
+    """Context manager recording its wall time into a stage ring."""
+
+    __slots__ = ("ring", "start")
+
+    def __init__(self, ring):
+        self.ring = ring
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.ring.push(time.perf_counter() - self.start)
+
+
+class Instrumentation:
+    """
+    Rolling per-stage timings, fps and gauges.
+
+    Args:
+        capacity (int): Samples kept per stage, i.e. the rolling window in frames.
+        enabled (bool): When False every call is a no-op.
+        report_every (int): Print a report every N frames (None: never).
+        quantiles (tuple): Percentiles reported for every stage.
+    """
+
+    def __init__(self, capacity=1024, enabled=True, report_every=None, quantiles=(50, 90, 99)):
+        self.capacity = capacity
+        self.enabled = enabled
+        self.report_every = report_every
+        self.quantiles = tuple(quantiles)
+        self.frames = 0
+        self._stages = {}
+        self._gauges = {}
+        self._frame_times = _Ring(capacity)
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+
+    def _ring(self, name):
+        ring = self._stages.get(name)
+        if ring is None:
+            # Stages are created from several pipeline threads
+            with self._lock:
+                ring = self._stages.setdefault(name, _Ring(self.capacity))
+        return ring
+
+    def stage(self, name):
+        """Returns a context manager timing one execution of stage `name`."""
+        if not self.enabled:
+            return _DISABLED
+        return _Stage(self._ring(name))
+
+    def record(self, name, seconds):
+        """Records an already measured duration for stage `name`."""
+        if self.enabled:
+            self._ring(name).push(seconds)
+
+    def gauge(self, name, value):
+        """Sets an instantaneous value, e.g. the number of active tracks."""
+        if self.enabled:
+            self._gauges[name] = value
+
+    def frame_done(self):
+        """Marks the end of a frame; prints a report every `report_every` frames."""
+        if not self.enabled:
+            return
+        self._frame_times.push(time.perf_counter())
+        self.frames += 1
+        if self.report_every and self.frames % self.report_every == 0:
+            print(self.report())
+
+    def fps(self):
+        """Frames per second over the frames in the rolling window."""
+        times = self._frame_times.recent()
+        if len(times) < 2 or times[-1] <= times[0]:
+            return 0.
+        return (len(times) - 1) / (times[-1] - times[0])
+
+    def percentiles(self, name):
+        """Returns {quantile: seconds} for stage `name` over the rolling window."""
+        samples = self._stages[name].recent() if name in self._stages else np.zeros(0)
+        if len(samples) == 0:
+            return {q: 0. for q in self.quantiles}
+        return dict(zip(self.quantiles, np.percentile(samples, self.quantiles).tolist()))
+
+    def snapshot(self):
+        """Returns every statistic as a JSON-ready dict."""
+        stages = {}
+        for name in list(self._stages):
+            ring = self._stages[name]
+            samples = ring.recent()
+            stages[name] = {
+                "count": ring.count,
+                "total": ring.total,
+                "mean": float(samples.mean()) if len(samples) else 0.,
+                "quantiles": {str(q): v for q, v in self.percentiles(name).items()},
+            }
+        return {
+            "frames": self.frames,
+            "uptime": time.perf_counter() - self._started,
+            "fps": self.fps(),
+            "stages": stages,
+            "gauges": dict(self._gauges),
+        }
+
+    def report(self):
+        """Formats the snapshot as a few human readable lines (times in ms)."""
+        snap = self.snapshot()
+        lines = [f"frames {snap['frames']}  fps {snap['fps']:.1f}  " +
+                 "  ".join(f"{name} {value}" for name, value in snap["gauges"].items())]
+        for name, stage in snap["stages"].items():
+            quantiles = "  ".join(f"p{q} {v * 1e3:7.2f}" for q, v in stage["quantiles"].items())
+            lines.append(f"  {name:12s} mean {stage['mean'] * 1e3:7.2f}  {quantiles}")
+        return "\n".join(lines)
+
+    def to_prometheus(self, prefix="football_tracker"):
+        """Formats the snapshot in the Prometheus text exposition format (seconds)."""
+        snap = self.snapshot()
+        lines = [f"# HELP {prefix}_stage_seconds Per-frame wall time of each processing stage.",
+                 f"# TYPE {prefix}_stage_seconds summary"]
+        for name, stage in snap["stages"].items():
+            for q, v in stage["quantiles"].items():
+                lines.append(f'{prefix}_stage_seconds{{stage="{name}",quantile="{float(q) / 100:g}"}} {v:.9f}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {stage["total"]:.9f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {stage["count"]}')
+        lines += [f"# TYPE {prefix}_fps gauge", f"{prefix}_fps {snap['fps']:.3f}",
+                  f"# TYPE {prefix}_frames_total counter", f"{prefix}_frames_total {snap['frames']}"]
+        for name, value in snap["gauges"].items():
+            lines += [f"# TYPE {prefix}_{name} gauge", f"{prefix}_{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+    def dump_json(self, path):
+        _write_atomic(path, json.dumps(self.snapshot(), indent=2))
+
+    def dump_prometheus(self, path, prefix="football_tracker"):
+        _write_atomic(path, self.to_prometheus(prefix))
+
+
+def _write_atomic(path, text):
+    """Writes via a temporary file so scrapers never read a half written file."""
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
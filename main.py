@@ -1,105 +1,579 @@
 # main.py main file
-from ultralytics import YOLO
-import cv2
+import argparse
+import os
+import time
+from functools import partial
+
 import numpy as np
-from Distance_calculation import update_distances, save_to_csv
-from sort import Sort
-from heatmap import FootballHeatmap
-import pandas as pd
+from Distance_calculation import KinematicsSession, compute_match_metrics, save_metrics_csv
+from batch_sort import BatchedSort
+from heatmap import FootballHeatmap, HeatmapAccumulator
+from detection_cache import DetectionCache
+from pipeline import PipelineRunner
+from detectors import ReplayDetector, YoloDetector
+from tracking_log import TrackingLog, TrackingLogReader
+from chunked import replay_kinematics, track_video_chunked
+from instrumentation import Instrumentation
+from cadence import CadenceTracker, DetectionScheduler
+from realtime import DROP_POLICIES, RealtimeRunner
+from calibration import load_calibration
+from tiling import pitch_mask, pitch_mask_from_calibration, tiled_detector
+from frame_ring import SharedMemoryPipeline
+from overlay import OverlayWriter, draw_overlay
+from checkpoint import Checkpointer, load_checkpoint
+from tracking_index import build_index
+
+VIDEO_PATH = "Test_2.mp4"
+MODEL_PATH = "yolo11n.pt"
+CONF_THRESHOLD = 0.5
+PLAYER_CLASSES = (0,)  # Class 0 for players
+FRAME_SIZE = (640, 480)
+PIXEL_TO_METER = 0.05  # Example: 1 pixel = 0.05 meters, used when there is no pitch calibration
+CALIBRATION_PATH = "calibration.json"  # Pitch homography written by calibration.py
+TRACKING_LOG_PATH = "tracking_log"
+LIVE_HEATMAP_MINUTES = 5  # Window of the live heatmaps saved with the "h" key
+# Tracks lost for more than a second go dormant until a detection shows up near them
+TRACKER_PARAMS = dict(max_age=1000, min_hits=8, iou_threshold=0.00125, gated=True, dormant_after=30)
+CHUNK_MINUTES = 5  # Length of a chunk when the video is split across processes
+CHUNK_OVERLAP_SECONDS = 2
+STATS_EVERY = 500  # Frames between stage timing reports
+STATS_JSON = "pipeline_stats.json"
+STATS_PROMETHEUS = "pipeline_stats.prom"
+OVERLAY_PATH = "overlay"  # Sidecar of boxes and IDs that overlay.py renders clips from
+CHECKPOINT_PATH = "checkpoint"
+CHECKPOINT_SECONDS = 10  # Seconds of video between checkpoints
+
+
+def track_frame(Tracker, kinematics, live_heatmap, tracking_log, frame_index, detections, stats, frame=None,
+                overlay=None):
+    """
+    Updates the tracker and the metrics with one frame's detections and returns the tracks.
+    `detections` is None on frames the detector skipped; the tracks are then predicted.
+    """
+    with stats.stage("track"):
+        resultsTracker = Tracker.step(frame_index, detections, frame)
+    stats.gauge("tracks_active", Tracker.tracker.active_count)
+    stats.gauge("tracks_dormant", Tracker.tracker.dormant_count)
+    with stats.stage("kinematics"):
+        kinematics.update(resultsTracker)
+    if live_heatmap is not None:
+        with stats.stage("live_heatmap"):
+            live_heatmap.update(resultsTracker)
+
+    # Store tracking data for heatmap
+    with stats.stage("log"):
+        tracking_log.append(frame_index, resultsTracker, Tracker.last_scores, Tracker.detected)
+        if overlay is not None:
+            overlay.append(frame_index, detections, resultsTracker)
+    return resultsTracker
+
+
+def frame_done(stats, output_dir="."):
+    """Closes a frame's timings and refreshes the stats files every `STATS_EVERY` frames."""
+    stats.frame_done()
+    if stats.enabled and stats.frames % STATS_EVERY == 0:
+        stats.dump_json(os.path.join(output_dir, STATS_JSON))
+        stats.dump_prometheus(os.path.join(output_dir, STATS_PROMETHEUS))
+
+
+def draw_frame(frame, detections, resultsTracker):
+    """Draws the detections (if any) and track IDs onto `frame` in place."""
+    boxes = detections[:, :4] if detections is not None else np.empty((0, 4))
+    draw_overlay(frame, boxes, "Player", resultsTracker)
+
+
+def parse_args(argv=None):
+    """Parse input arguments."""
+    parser = argparse.ArgumentParser(description='Player detection, tracking and match analytics')
+    parser.add_argument("--input", help="Video to analyse.", type=str, default=VIDEO_PATH)
+    parser.add_argument("--model", help="YOLO weights.", type=str, default=MODEL_PATH)
+    parser.add_argument("--conf_threshold", help="Minimum detection confidence.", type=float, default=CONF_THRESHOLD)
+    parser.add_argument("--classes", help="Detector class ids to keep.", type=int, nargs="+",
+                        default=list(PLAYER_CLASSES))
+    parser.add_argument("--frame_size", help="Width and height frames are resized to; 0 0 keeps the native size.",
+                        type=int, nargs=2, default=list(FRAME_SIZE))
+    parser.add_argument("--max_age",
+                        help="Maximum number of frames to keep alive a track without associated detections.",
+                        type=int, default=TRACKER_PARAMS["max_age"])
+    parser.add_argument("--min_hits",
+                        help="Minimum number of associated detections before track is initialised.",
+                        type=int, default=TRACKER_PARAMS["min_hits"])
+    parser.add_argument("--iou_threshold", help="Minimum IOU for match.", type=float,
+                        default=TRACKER_PARAMS["iou_threshold"])
+    parser.add_argument("--dormant_after", help="Frames without a match before a track goes dormant (0: never).",
+                        type=int, default=TRACKER_PARAMS["dormant_after"])
+    parser.add_argument("--gated", dest="gated", help="Only score overlapping detection/track pairs [default].",
+                        action="store_true", default=True)
+    parser.add_argument("--dense", dest="gated", help="Use dense instead of gated association.",
+                        action="store_false")
+    parser.add_argument("--detect_every", help="Largest gap in frames between detector runs (1: every frame).",
+                        type=int, default=1)
+    parser.add_argument("--fixed_cadence", help="Always detect every --detect_every frames instead of adapting.",
+                        action="store_true")
+    parser.add_argument("--flow", help="Refine predicted boxes between detections with optical flow.",
+                        action="store_true")
+    parser.add_argument("--realtime", help="Live mode: keep up with the source within --latency_budget.",
+                        action="store_true")
+    parser.add_argument("--latency_budget", help="Seconds allowed from capture to output in live mode.",
+                        type=float, default=0.5)
+    parser.add_argument("--drop_policy", help="What live mode does with late frames.",
+                        choices=DROP_POLICIES, default="drop_oldest")
+    parser.add_argument("--no_pace", dest="pace", help="In live mode, read a file as fast as possible "
+                        "instead of at its native fps.", action="store_false")
+    parser.add_argument("--tiled", help="Detect on full resolution tiles covering the pitch instead of "
+                        "resizing frames to --frame_size (high resolution footage).", action="store_true")
+    parser.add_argument("--tile_size", help="Largest tile side, normally the detector input size.", type=int,
+                        default=640)
+    parser.add_argument("--tile_budget", help="Detector input per frame in --tiled mode, relative to the frame "
+                        "downscaled to --tile_size (1: same compute); tiles far from the camera keep the most "
+                        "resolution. 0 runs every tile at full resolution.", type=float, default=1.)
+    parser.add_argument("--tile_refresh", help="Frames between pitch mask updates in --tiled mode (0: never, "
+                        "for fixed cameras).", type=int, default=0)
+    parser.add_argument("--pixel_to_meter", help="Meters per pixel, without a pitch calibration.", type=float,
+                        default=PIXEL_TO_METER)
+    parser.add_argument("--calibration", help="Pitch calibration file (see calibration.py); positions and "
+                        "distances are measured on the pitch when it exists.", type=str, default=CALIBRATION_PATH)
+    parser.add_argument("--calibration_lut", help="Precompute the pixel to pitch lookup table (fixed camera).",
+                        action="store_true")
+    parser.add_argument("--render", help="Draw and encode no frame, every Nth frame or every frame; "
+                        "overlay.py renders clips from the sidecar on demand.",
+                        choices=("off", "every", "full"), default="off")
+    parser.add_argument("--render_every", help="N of --render every.", type=int, default=25)
+    parser.add_argument("--no_display", dest="display", help="Do not show rendered frames in a window.",
+                        action="store_false")
+    parser.add_argument("--output_video", help="Annotated video; empty to skip encoding.", type=str,
+                        default="output.mp4")
+    parser.add_argument("--output_dir", help="Directory of the tracking log, metrics, CSVs and heatmaps.",
+                        type=str, default=".")
+    parser.add_argument("--no_reports", dest="reports", help="Skip the metrics, CSVs and heatmaps.",
+                        action="store_false")
+    parser.add_argument("--no_cache", dest="use_cache", help="Do not read or write the detection cache.",
+                        action="store_false")
+    parser.add_argument("--batch_size", help="Frames per detector call.", type=int, default=8)
+    parser.add_argument("--queue_depth", help="Capacity of each pipeline queue.", type=int, default=16)
+    parser.add_argument("--processes", help="Run decode, inference and encoding in separate processes sharing "
+                        "frames through shared memory (detect_every 1, not live).", action="store_true")
+    parser.add_argument("--workers", help="Processes for chunked analytics-only tracking (1: single process).",
+                        type=int, default=1)
+    parser.add_argument("--no_stats", dest="stats", help="Disable the stage timing instrumentation.",
+                        action="store_false")
+    parser.add_argument("--checkpoint_every", help="Seconds of video between checkpoints of a video file run "
+                        "(0: never).", type=float, default=CHECKPOINT_SECONDS)
+    parser.add_argument("--resume", help="Continue from the checkpoint in --output_dir, with the same track "
+                        "IDs, instead of starting over (video files, not with --realtime or --workers).",
+                        action="store_true")
+    return parser.parse_args(argv)
+
+
+def tracker_params(args):
+    return dict(max_age=args.max_age, min_hits=args.min_hits, iou_threshold=args.iou_threshold,
+                gated=args.gated, dormant_after=args.dormant_after or None)
+
+
+def open_capture(source):
+    """Opens a video file, a stream URL or a camera given by its index."""
+    import cv2
+    return cv2.VideoCapture(int(source) if source.isdigit() else source)
+
+
+def resized_reader(cap, frame_size):
+    """`cap.read` returning frames resized to `frame_size`, for the live capture thread."""
+    if not frame_size:
+        return cap.read
+
+    import cv2
+
+    def read():
+        ret, frame = cap.read()
+        return ret, cv2.resize(frame, frame_size) if ret else frame
+    return read
+
+
+def open_calibration(args, frame_size):
+    """The pitch calibration of a run, rescaled to `frame_size`, or None."""
+    calibration = load_calibration(args.calibration, frame_size, lut=args.calibration_lut)
+    if calibration is not None:
+        print(f"Measuring on the pitch with {args.calibration} "
+              f"(reprojection error {calibration.reprojection_error():.2f} m)")
+    return calibration
+
+
+def open_pitch_mask(args, calibration, frame_size):
+    """
+    The fixed pitch mask of a --tiled run: the calibrated outline, else the grass of the video's first frame,
+    so resumed runs and chunk workers tile like a run from the start. None refreshes it as the camera moves.
+    """
+    if calibration is not None:
+        return pitch_mask_from_calibration(calibration, frame_size)
+    if args.tile_refresh or not os.path.isfile(args.input):
+        return None
+    cap = open_capture(args.input)
+    ret, frame = cap.read()
+    cap.release()
+    return pitch_mask(frame) if ret else None
+
+
+def open_checkpoint(args, frame_size):
+    """The checkpoint a `--resume` run continues from, or None to start from the first frame."""
+    if not args.resume or args.realtime:
+        if args.resume:
+            print("--resume is ignored with --realtime")
+        return None
+    checkpoint = load_checkpoint(os.path.join(args.output_dir, CHECKPOINT_PATH))
+    if checkpoint is None:
+        print("No checkpoint to resume from, starting from the first frame")
+        return None
+    if checkpoint.meta != checkpoint_meta(args, frame_size):
+        print(f"Error: the checkpoint in {args.output_dir} belongs to another video or frame size.")
+        exit()
+    print(f"Resuming from frame {checkpoint.next_frame}")
+    return checkpoint
+
+
+def checkpoint_meta(args, frame_size):
+    """What a checkpoint must match to be resumed."""
+    return {"video": os.path.abspath(args.input), "frame_size": list(frame_size) if frame_size else None}
+
+
+def open_checkpointer(args, frame_size, fps, resume=None):
+    """Saves checkpoints of video file runs; live sources cannot be resumed."""
+    if args.realtime or not os.path.isfile(args.input):
+        return None
+    return Checkpointer(os.path.join(args.output_dir, CHECKPOINT_PATH), int(args.checkpoint_every * fps),
+                        checkpoint_meta(args, frame_size), resume)
+
+
+def model_key(args):
+    """The detector's name in the detection cache; tiled detections are cached apart."""
+    return f"{args.model}+tiles{args.tile_size}x{args.tile_budget:g}" if args.tiled else args.model
+
+
+def make_tracker(args):
+    """The tracker of a run, detecting on the keyframes chosen by the cadence scheduler."""
+    scheduler = DetectionScheduler(max_interval=args.detect_every, adaptive=not args.fixed_cadence)
+    return CadenceTracker(BatchedSort(**tracker_params(args)), scheduler, flow=args.flow)
+
 
-def main():
-    model = YOLO("yolo11n.pt")
-    video_path = "Test_2.mp4"
-    cap = cv2.VideoCapture(video_path)
+def main(args=None, stats=None):
+    import cv2
+    if args is None:
+        args = parse_args([])
+    if stats is None:
+        stats = Instrumentation(report_every=STATS_EVERY, enabled=args.stats)
+    os.makedirs(args.output_dir, exist_ok=True)
+    video_path = args.input
+    # Tiled detection runs on the native frames
+    frame_size = tuple(args.frame_size) if all(args.frame_size) and not args.tiled else None
+    classes = tuple(args.classes)
+    if args.workers > 1:
+        main_chunked(args, frame_size)
+        return
+    Tracker = make_tracker(args)
+    keyframe = Tracker.scheduler.is_keyframe
+    calibration = open_calibration(args, frame_size)
+    resume = open_checkpoint(args, frame_size)
+    first_frame = resume.next_frame if resume is not None else 0
 
-    pixel_to_meter = 0.05  # Example: 1 pixel = 0.05 meters
-    Tracker = Sort(max_age=1000, min_hits=8, iou_threshold=0.00125)
+    # Initialize tracking data storage; a resumed log drops the rows written after the checkpoint
+    tracking_log = TrackingLog(os.path.join(args.output_dir, TRACKING_LOG_PATH), calibration=calibration,
+                               append=resume is not None, rows=resume.log_rows if resume is not None else None)
+
+    # Live feeds are neither replayed from nor recorded to the cache
+    cache = DetectionCache() if args.use_cache and not args.realtime else None
+    store = cache.lookup(video_path, model_key(args), args.conf_threshold, classes, frame_size) if cache else None
+    if store is not None and args.render == "off":
+        # Detections are already cached: replay them without decoding or inference
+        print(f"Replaying cached detections from {store.path}")
+        kinematics = KinematicsSession(args.pixel_to_meter, store.fps, calibration=calibration)
+        if resume is not None:
+            resume.restore(Tracker, kinematics)
+        overlay = open_overlay(args, frame_size, store.fps, resume)
+        checkpointer = open_checkpointer(args, frame_size, store.fps, resume)
+        start = time.perf_counter()
+        processed = 0
+        finished = False
+        try:
+            for frame_index in range(first_frame, len(store)):
+                detections = store.frame(frame_index) if keyframe(frame_index) else None
+                track_frame(Tracker, kinematics, None, tracking_log, frame_index, detections, stats,
+                            overlay=overlay)
+                save_checkpoint(checkpointer, frame_index, Tracker, kinematics, tracking_log, overlay, stats)
+                frame_done(stats, args.output_dir)
+                processed += 1
+            finished = True
+        finally:
+            report_throughput(processed, time.perf_counter() - start, "replay")
+            finish(args, tracking_log, kinematics, stats, overlay, checkpointer, finished)
+        return
+
+    cap = open_capture(video_path)
 
     if not cap.isOpened():
         print("Error: Could not open video file.")
         exit()
+    if first_frame:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, first_frame)
 
-    output_path = "output.mp4"
-    fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-    fps = int(cap.get(cv2.CAP_PROP_FPS))
+    fps = int(cap.get(cv2.CAP_PROP_FPS)) or 25
     frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    out = cv2.VideoWriter(output_path, fourcc, fps, (640, 480))
+    output_size = frame_size or (frame_width, frame_height)
+    # Separate processes need the whole video through one detector, so they skip cadence, live mode and replay
+    shared = args.processes and store is None and not args.realtime and args.detect_every == 1
+    if args.processes and not shared:
+        print("--processes is ignored with cached detections, --realtime or --detect_every > 1")
+    if store is not None:
+        # Frames are decoded for rendering only, detections come from the cache
+        print(f"Rendering with cached detections from {store.path}")
+        detector = ReplayDetector((store.frame(index) for index in range(first_frame, len(store))),
+                                  return_class=True)
+        recorder = None
+    else:
+        detector_factory = partial(YoloDetector, args.model, classes, args.conf_threshold, return_class=True)
+        if args.tiled:
+            mask = open_pitch_mask(args, calibration, output_size)
+            detector_factory = partial(tiled_detector, detector_factory, tile_size=args.tile_size, mask=mask,
+                                       refresh_every=args.tile_refresh, budget=args.tile_budget or None)
+        # The model of a multi-process run is loaded by its inference process
+        detector = detector_factory() if not shared else None
+        # The cache holds the detections of every frame, so runs that skip or resume frames do not record
+        recorder = cache.recorder(video_path, model_key(args), args.conf_threshold, classes, frame_size, fps) \
+            if cache and args.detect_every == 1 and not first_frame else None
 
-    # Initialize tracking data storage
-    tracking_data = []
+    # Analytics-only runs open no writer and never touch the frames after detection
+    render_every = {"off": 0, "every": max(1, args.render_every), "full": 1}[args.render]
+    out = None
+    output_video = args.output_video
+    if output_video and first_frame:
+        # The annotated video of the frames before the checkpoint is kept
+        root, ext = os.path.splitext(output_video)
+        output_video = f"{root}_from_{first_frame}{ext}"
+    if render_every and output_video and not shared:
+        fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+        out = cv2.VideoWriter(output_video, fourcc, max(1., fps / render_every), output_size)
+    display = bool(render_every) and args.display
+    kinematics = KinematicsSession(args.pixel_to_meter, fps, calibration=calibration)
+    if resume is not None:
+        resume.restore(Tracker, kinematics)
+    live_heatmap = HeatmapAccumulator(output_size, window=LIVE_HEATMAP_MINUTES * 60 * fps,
+                                      calibration=calibration) if display else None
+    overlay = open_overlay(args, output_size, fps, resume)
+    checkpointer = open_checkpointer(args, frame_size, fps, resume)
+    finished = False
+    last_index = [first_frame - 1]
 
-    try:
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-                
-            frame = cv2.resize(frame, (640, 480))
-            results = model(frame)
-            detections = np.empty((0, 5))
-
-            for result in results:
-                for box in result.boxes:
-                    if int(box.cls) == 0:  # Class 0 for players
-                        x1, y1, x2, y2 = map(int, box.xyxy[0][:4])
-                        conf = float(box.conf[0])
-                        if conf > 0.5:
-                            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 4)
-                            cv2.putText(frame, "Player", (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 4)
-                            current_array = np.array([[x1, y1, x2, y2, conf]])
-                            detections = np.vstack((detections, current_array))
-
-            resultsTracker = Tracker.update(detections)
-            update_distances(resultsTracker, pixel_to_meter)
-            
-            # Store tracking data for heatmap
-            for result in resultsTracker:
-                x1, y1, x2, y2, track_id = map(int, result)
-                center_x = (x1 + x2) // 2
-                center_y = (y1 + y2) // 2
-                
-                tracking_data.append({
-                    'player_id': track_id,
-                    'x': center_x,
-                    'y': center_y,
-                    'frame': len(tracking_data)
-                })
-                
-                cv2.putText(frame, f"ID: {track_id}", (x1, y1 - 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 4)
-
-            out.write(frame)
+    def process(index, frame, detections):
+        if recorder is not None:
+            recorder.append(detections)
+        # Frames dropped in live mode are tracked on prediction, so the log and kinematics stay per frame
+        for skipped in range(last_index[0] + 1, index):
+            track_frame(Tracker, kinematics, live_heatmap, tracking_log, skipped, None, stats, overlay=overlay)
+        last_index[0] = index
+        if store is not None and not keyframe(index):
+            # Cached detections exist for every frame; the scheduler still decides which are used
+            detections = None
+
+        resultsTracker = track_frame(Tracker, kinematics, live_heatmap, tracking_log, index, detections, stats,
+                                     frame if args.flow else None, overlay)
+        save_checkpoint(checkpointer, index, Tracker, kinematics, tracking_log, overlay, stats)
+        if not render_every or index % render_every:
+            frame_done(stats, args.output_dir)
+            return None
+
+        with stats.stage("draw"):
+            draw_frame(frame, detections, resultsTracker)
+        if not display:
+            frame_done(stats, args.output_dir)
+            return frame
+
+        with stats.stage("display"):
             cv2.imshow("YOLO Detection", frame)
-            
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
+            key = cv2.waitKey(1) & 0xFF
+        frame_done(stats, args.output_dir)
+        if key == ord('q'):
+            return False
+        if key == ord('h'):
+            # Heatmaps of the last few minutes, without stopping the run
+            live_heatmap.save(workers=0)
+        return frame
+
+    if shared:
+        runner = SharedMemoryPipeline(detector_factory, video_path, frame_size, args.batch_size,
+                                      instrumentation=stats)
+    elif args.realtime:
+        runner = RealtimeRunner(detector.detect, args.latency_budget, args.drop_policy,
+                                instrumentation=stats, schedule=keyframe)
+    else:
+        # Decode, batched inference, tracking and encoding run as overlapping stages
+        runner = PipelineRunner(
+            detector,
+            batch_size=args.batch_size,
+            queue_depth=args.queue_depth,
+            preprocess=(lambda frame: cv2.resize(frame, frame_size)) if frame_size else None,
+            instrumentation=stats,
+            # Replayed detections must be consumed in order, so they are filtered in process()
+            schedule=keyframe if store is None else None,
+            # An adaptive gap is chosen by the tracker, so keyframes are picked in step with it
+            lockstep=Tracker.scheduler.adaptive,
+        )
+
+    start = time.perf_counter()
+    processed = 0
+    try:
+        write = out.write if out is not None else None
+        if shared:
+            output = (output_video, max(1., fps / render_every), output_size) \
+                if render_every and output_video else None
+            processed = runner.run(process, output, start=first_frame)
+        elif args.realtime:
+            paced = args.pace and os.path.isfile(video_path)
+            processed = runner.run(resized_reader(cap, frame_size), process, write,
+                                   source_fps=fps if paced else None)
+        else:
+            processed = runner.run(cap.read, process, write, start=first_frame)
+        finished = runner.completed
 
     finally:
-        # Save tracking data and metrics
-        save_to_csv(fps, pixel_to_meter, "player_tracking_data.csv")
-        
-        # Convert tracking data to DataFrame and save
-        df_tracking = pd.DataFrame(tracking_data)
-        df_tracking.to_csv("heatmap_tracking_data.csv", index=False)
-        
-        # Generate heatmaps
-        print("Generating heatmaps...")
-        heatmap_gen = FootballHeatmap()
-        
-        # Generate team heatmap
-        heatmap_gen.generate_heatmap(df_tracking, 'team_heatmap.png')
-        
-        # Generate individual player heatmaps
-        for player_id in df_tracking['player_id'].unique():
-            heatmap_gen.generate_heatmap(
-                df_tracking,
-                f'player_{player_id}_heatmap.png',
-                player_id=player_id
-            )
-        
+        mode = f"render={args.render}" + (", processes" if shared else "")
+        if args.realtime:
+            counts = runner.counts
+            mode += (f", live {args.drop_policy}: {counts['dropped']} dropped, {counts['skipped']} "
+                     f"undetected, {counts['degraded']} degraded, {counts['overflow']} overflowed")
+        report_throughput(processed, time.perf_counter() - start, mode)
+        # Only a run that reached the end of the video is kept in the cache
+        if recorder is not None:
+            recorder.close(complete=finished)
+        finish(args, tracking_log, kinematics, stats, overlay, checkpointer, finished)
+
         cap.release()
-        out.release()
-        cv2.destroyAllWindows()
+        if out is not None:
+            out.release()
+        if display:
+            cv2.destroyAllWindows()
+
+
+def main_chunked(args, frame_size):
+    """Tracks the video in overlapping chunks on `args.workers` processes, without rendering."""
+    import cv2
+    cap = cv2.VideoCapture(args.input)
+    if not cap.isOpened():
+        print("Error: Could not open video file.")
+        exit()
+    fps = int(cap.get(cv2.CAP_PROP_FPS)) or 25
+    n_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.release()
+
+    detector_factory = partial(YoloDetector, args.model, tuple(args.classes), args.conf_threshold)
+    calibration = open_calibration(args, frame_size)
+    if args.tiled:
+        mask = open_pitch_mask(args, calibration, (width, height))
+        detector_factory = partial(tiled_detector, detector_factory, tile_size=args.tile_size, mask=mask,
+                                   refresh_every=args.tile_refresh, budget=args.tile_budget or None)
+    start = time.perf_counter()
+    tracking_log = track_video_chunked(
+        n_frames, detector_factory, tracker_params(args), video_path=args.input, frame_size=frame_size,
+        chunk_frames=CHUNK_MINUTES * 60 * fps, overlap=CHUNK_OVERLAP_SECONDS * fps,
+        workers=args.workers, log_path=os.path.join(args.output_dir, TRACKING_LOG_PATH),
+        batch_size=args.batch_size, meta={"fps": fps}, calibration=calibration,
+    )
+    report_throughput(n_frames, time.perf_counter() - start, f"chunked, {args.workers} workers")
+    kinematics = replay_kinematics(tracking_log.reader(), n_frames, args.pixel_to_meter, fps, calibration)
+    if args.reports:
+        save_outputs(tracking_log, kinematics, args.output_dir)
+    else:
+        tracking_log.close()
+
+
+def report_throughput(frames, elapsed, mode):
+    if frames and elapsed > 0:
+        print(f"Processed {frames} frames in {elapsed:.1f}s ({frames / elapsed:.1f} fps, {mode})")
+
+
+def open_overlay(args, frame_size, fps, resume=None):
+    """The overlay sidecar of a video file run; live sources have nothing to seek in later."""
+    if not os.path.isfile(args.input):
+        return None
+    return OverlayWriter(os.path.join(args.output_dir, OVERLAY_PATH), args.input, frame_size, fps,
+                         append=resume is not None, rows=resume.overlay_rows if resume is not None else None)
+
+
+def save_checkpoint(checkpointer, frame_index, Tracker, kinematics, tracking_log, overlay, stats):
+    """Saves a checkpoint when one is due after `frame_index`."""
+    if checkpointer is not None and checkpointer.due(frame_index):
+        with stats.stage("checkpoint"):
+            checkpointer.save(frame_index + 1, Tracker, kinematics, tracking_log, overlay)
+
+
+def finish(args, tracking_log, kinematics, stats, overlay=None, checkpointer=None, finished=False):
+    """
+    Closes the log and the overlay sidecar and writes the reports and stage
+    timings. The checkpoint is deleted once the whole video was processed and
+    kept otherwise, for `--resume`.
+    """
+    if checkpointer is not None:
+        if finished:
+            checkpointer.remove()
+        else:
+            checkpointer.close()
+            if checkpointer.saved is not None:
+                print(f"Checkpoint at frame {checkpointer.saved} saved to {checkpointer.path}; continue with --resume")
+    if overlay is not None:
+        overlay.close()
+        print(f"Overlays saved to {overlay.path}; render clips with overlay.py")
+    if args.reports:
+        save_outputs(tracking_log, kinematics, args.output_dir)
+    else:
+        tracking_log.close()
+    save_stats(stats, args.output_dir)
+
+
+def save_stats(stats, output_dir="."):
+    """Prints the final stage timings and writes them for the dashboards."""
+    if not stats.enabled or stats.frames == 0:
+        return
+    print(stats.report())
+    json_path = os.path.join(output_dir, STATS_JSON)
+    prometheus_path = os.path.join(output_dir, STATS_PROMETHEUS)
+    stats.dump_json(json_path)
+    stats.dump_prometheus(prometheus_path)
+    print(f"Pipeline stats saved to {json_path} and {prometheus_path}")
+
+
+def save_outputs(tracking_log, kinematics, output_dir="."):
+    """Writes the player metrics, the tracking data and the heatmaps."""
+    path = partial(os.path.join, output_dir)
+    tracking_log.close()
+    tracking = TrackingLogReader(tracking_log.path)
+
+    # Smoothed aggregate metrics over the whole match, on the pitch when calibrated
+    centers = tracking.pitch if tracking.calibrated else tracking.centers()
+    metrics = compute_match_metrics(tracking.frame, tracking.track_id, centers,
+                                    kinematics.fps, kinematics.pixel_to_meter)
+    save_metrics_csv(metrics, path("player_metrics.csv"))
+
+    # Save player summaries and trajectories, plus a human readable summary
+    kinematics.export(path("player_tracking_data.npz"), metrics)
+    kinematics.save_to_csv(path("player_tracking_data.csv"), positional_points=False)
+
+    # Human readable copy of the tracking log
+    columns = ['player_id', 'x', 'y', 'frame'] + (['pitch_x', 'pitch_y'] if tracking.calibrated else [])
+    tracking.to_dataframe()[columns].to_csv(path("heatmap_tracking_data.csv"), index=False)
+    if len(tracking) == 0:
+        return
+
+    # Time range, track and area queries without scanning the log (see tracking_index.py)
+    index = build_index(tracking_log.path)
+    print(f"Tracking index saved to {index.path}")
+
+    # Generate heatmaps
+    print("Generating heatmaps...")
+    heatmap_gen = FootballHeatmap()
+
+    # Generate team and individual player heatmaps in one pass
+    heatmap_gen.generate_heatmaps(tracking, path('player_{}_heatmap.png'), path('team_heatmap.png'))
+
 
 if __name__ == "__main__":
-    main()
+    main(parse_args())
@@ -0,0 +1,306 @@
+"""
+Overlay sidecar and on-demand clip rendering.
+
+The analysis run does not need to draw into and re-encode every frame to
+produce annotated footage. It writes a compact overlay sidecar instead: one
+row per drawn box (int32 frame, int32 track ID or -1 for a raw detection,
+int16 bbox and a uint8 label), 17 bytes per row in a columnar table (see
+`columnar.py`). `ClipRenderer` later decodes only the frames asked for, a
+time range or the frames a player appears in, and draws the overlays from the
+sidecar:
+
+* seeking goes to the start of a fixed-length segment and decodes forward,
+  so every frame index is exact, and consecutive segments are decoded
+  without seeking again,
+* decoded segments are kept in an LRU cache bounded in bytes, so pulling
+  several clips around the same moment decodes it once.
+
+Render ten seconds from 1:20, or every appearance of player 7:
+
+    python overlay.py --start 80 --duration 10 --output clip.mp4
+    python overlay.py --player 7 --output player_7.mp4
+"""
+import argparse
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from columnar import ColumnWriter, open_columns
+
+OVERLAY_COLUMNS = {
+    "frame": np.int32,
+    "track_id": np.int32,
+    "bbox": (np.int16, 4),
+    "label": np.uint8,
+}
+DETECTION_ID = -1  # track_id of raw detection rows
+TRACK_LABEL = 255  # label of track rows
+DEFAULT_LABELS = {0: "Player"}
+
+
+def draw_overlay(frame, boxes, labels, tracks, scale=1., highlight=None):
+    """
+    Draws detection boxes with their labels and track IDs onto `frame` in place.
+
+    Args:
+        boxes (np.ndarray): (N, 4+) detection boxes.
+        labels: One label per box, or a single label for all.
+        tracks (np.ndarray): (M, 5) tracks [x1, y1, x2, y2, track_id].
+        scale (float): Factor from the box coordinates to the frame's pixels.
+        highlight (int): Track ID drawn in another colour.
+    """
+    import cv2
+    thickness = max(1, int(round(4 * scale)))
+    if isinstance(labels, str):
+        labels = [labels] * len(boxes)
+    for (x1, y1, x2, y2), label in zip((np.asarray(boxes)[:, :4] * scale).astype(int).tolist(), labels):
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), thickness)
+        cv2.putText(frame, label, (x1, y1 - int(10 * scale)), cv2.FONT_HERSHEY_SIMPLEX, scale, (0, 255, 0),
+                    thickness)
+    for result in np.asarray(tracks).reshape(-1, 5).tolist():
+        x1, y1, x2, y2 = (int(v * scale) for v in result[:4])
+        track_id = int(result[4])
+        color = (0, 0, 255) if track_id == highlight else (255, 0, 0)
+        if track_id == highlight:
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color, thickness)
+        cv2.putText(frame, f"ID: {track_id}", (x1, y1 - int(30 * scale)), cv2.FONT_HERSHEY_SIMPLEX, scale, color,
+                    thickness)
+
+
+class OverlayWriter:
+    """
+    Writes the overlay sidecar of an analysis run.
+
+    Args:
+        path (str): Directory of the sidecar table.
+        video_path (str): Video the overlays belong to.
+        frame_size (tuple): (width, height) of the frames the boxes refer to;
+            None when they are in native video pixels.
+        fps (float): Frame rate of the video.
+        labels (dict): Detector class id -> label text.
+        append (bool): Continue an existing sidecar instead of truncating it.
+        rows (int): With `append`, rows to keep, e.g. those covered by a checkpoint.
+    """
+
+    def __init__(self, path="overlay", video_path=None, frame_size=None, fps=None, labels=None,
+                 chunk_rows=65536, append=False, rows=None):
+        self.path = path
+        meta = {
+            "video": os.path.abspath(video_path) if video_path else None,
+            "frame_size": list(frame_size) if frame_size else None,
+            "fps": fps,
+            "labels": {str(cls): text for cls, text in (labels or DEFAULT_LABELS).items()},
+        }
+        self._writer = ColumnWriter(path, OVERLAY_COLUMNS, chunk_rows=chunk_rows, meta=meta, append=append,
+                                    rows=rows)
+
+    def __len__(self):
+        return len(self._writer)
+
+    def append(self, frame, detections, tracks):
+        """
+        Appends one frame's overlays.
+
+        Args:
+            detections (np.ndarray): (N, 5+) detections, with the class id in
+                column 5 when present; None on frames without detection.
+            tracks (np.ndarray): (M, 5) tracks [x1, y1, x2, y2, track_id].
+        """
+        tracks = np.asarray(tracks).reshape(-1, 5)
+        if detections is None:
+            detections = np.empty((0, 5))
+        n = len(detections)
+        if n + len(tracks) == 0:
+            return
+        bbox = np.concatenate([detections[:, :4], tracks[:, :4]])
+        labels = detections[:, 5] if detections.shape[1] > 5 else np.zeros(n)
+        self._writer.append(
+            frame=frame,
+            track_id=np.concatenate([np.full(n, DETECTION_ID), tracks[:, 4]]),
+            bbox=np.clip(np.round(bbox), -32768, 32767),
+            label=np.concatenate([labels, np.full(len(tracks), TRACK_LABEL)]),
+        )
+
+    def flush(self):
+        self._writer.flush()
+
+    def close(self):
+        self._writer.close()
+
+
+class OverlayReader:
+    """Memory-mapped view of an overlay sidecar; rows are in frame order."""
+
+    def __init__(self, path="overlay"):
+        self.path = path
+        columns, self.meta = open_columns(path)
+        self.frame = columns["frame"]
+        self.track_id = columns["track_id"]
+        self.bbox = columns["bbox"]
+        self.label = columns["label"]
+        self.labels = {int(cls): text for cls, text in self.meta.get("labels", {}).items()}
+
+    def __len__(self):
+        return len(self.frame)
+
+    def at(self, index):
+        """Returns the (N, 4) detection boxes, their N label texts and the (M, 5) tracks of frame `index`."""
+        lo, hi = np.searchsorted(self.frame, [index, index + 1])
+        track_id = self.track_id[lo:hi]
+        bbox = self.bbox[lo:hi].astype(np.float32)
+        is_detection = track_id == DETECTION_ID
+        labels = [self.labels.get(int(cls), "") for cls in self.label[lo:hi][is_detection]]
+        tracks = np.concatenate([bbox[~is_detection], track_id[~is_detection, None]], axis=1)
+        return bbox[is_detection], labels, tracks
+
+    def track_frames(self, track_id):
+        """Returns the frames where `track_id` is drawn."""
+        return np.unique(self.frame[self.track_id == track_id])
+
+
+class ClipRenderer:
+    """
+    Renders annotated frames and clips from a video and its overlay sidecar.
+
+    Args:
+        overlay_path (str): Directory of the sidecar.
+        video_path (str): Video to decode; defaults to the one recorded in the sidecar.
+        segment_frames (int): Frames decoded per seek; defaults to two seconds.
+        cache_mb (float): Memory for decoded segments.
+    """
+
+    def __init__(self, overlay_path="overlay", video_path=None, segment_frames=None, cache_mb=512):
+        import cv2
+        self.overlay = OverlayReader(overlay_path)
+        self.video_path = video_path or self.overlay.meta["video"]
+        self._cap = cv2.VideoCapture(self.video_path)
+        if not self._cap.isOpened():
+            raise IOError(f"Could not open {self.video_path}")
+        self.fps = self._cap.get(cv2.CAP_PROP_FPS) or self.overlay.meta.get("fps") or 25
+        self.n_frames = int(self._cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.frame_size = (int(self._cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                           int(self._cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        analysed = self.overlay.meta.get("frame_size") or self.frame_size
+        # Boxes were recorded on the analysed frames, possibly resized; text is scaled with the boxes
+        self.scale = self.frame_size[0] / analysed[0]
+        self.segment_frames = segment_frames or max(1, int(round(2 * self.fps)))
+        self.cache_bytes = int(cache_mb * 2 ** 20)
+        self._segments = OrderedDict()
+        self._cached = 0
+        self._position = 0
+        self.decoded = 0
+
+    def _decode(self, segment):
+        import cv2
+        start = segment * self.segment_frames
+        stop = min(start + self.segment_frames, self.n_frames) if self.n_frames > 0 else start + self.segment_frames
+        if self._position != start:
+            # The backend seeks to the keyframe before `start` and decodes forward to it
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        frames = []
+        for _ in range(start, stop):
+            ret, frame = self._cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+        self._position = start + len(frames)
+        self.decoded += len(frames)
+        return frames
+
+    def _segment(self, segment):
+        frames = self._segments.get(segment)
+        if frames is not None:
+            self._segments.move_to_end(segment)
+            return frames
+        frames = self._decode(segment)
+        self._segments[segment] = frames
+        self._cached += sum(frame.nbytes for frame in frames)
+        while self._cached > self.cache_bytes and len(self._segments) > 1:
+            _, evicted = self._segments.popitem(last=False)
+            self._cached -= sum(frame.nbytes for frame in evicted)
+        return frames
+
+    def frame(self, index):
+        """Returns the decoded frame `index` (shared with the cache, do not draw on it), or None past the end."""
+        frames = self._segment(index // self.segment_frames)
+        offset = index % self.segment_frames
+        return frames[offset] if offset < len(frames) else None
+
+    def render_frame(self, index, highlight=None):
+        """Returns a copy of frame `index` with its overlays drawn."""
+        frame = self.frame(index)
+        if frame is None:
+            return None
+        frame = frame.copy()
+        boxes, labels, tracks = self.overlay.at(index)
+        draw_overlay(frame, boxes, labels, tracks, self.scale, highlight)
+        return frame
+
+    def render(self, start, stop, output="clip.mp4", highlight=None):
+        """Writes frames [start, stop) with their overlays to `output` and returns the number written."""
+        import cv2
+        if os.path.abspath(output) == os.path.abspath(self.video_path):
+            raise ValueError(f"{output} is the source video")
+        writer = cv2.VideoWriter(output, cv2.VideoWriter_fourcc(*"mp4v"), self.fps, self.frame_size)
+        written = 0
+        try:
+            for index in range(max(start, 0), stop):
+                frame = self.render_frame(index, highlight)
+                if frame is None:
+                    break
+                writer.write(frame)
+                written += 1
+        finally:
+            writer.release()
+        return written
+
+    def player_range(self, track_id, padding=0):
+        """Returns the [start, stop) frames from the first to the last appearance of a player, padded."""
+        frames = self.overlay.track_frames(track_id)
+        if len(frames) == 0:
+            raise KeyError(f"Track {track_id} is not in the overlay")
+        return max(int(frames[0]) - padding, 0), int(frames[-1]) + 1 + padding
+
+    def render_player(self, track_id, output=None, padding=None, max_frames=None):
+        """Writes the clip of one player, highlighted, and returns the number of frames written."""
+        padding = int(self.fps) if padding is None else padding
+        start, stop = self.player_range(track_id, padding)
+        if max_frames is not None:
+            stop = min(stop, start + max_frames)
+        return self.render(start, stop, output or f"player_{track_id}.mp4", highlight=track_id)
+
+    def close(self):
+        self._cap.release()
+        self._segments.clear()
+        self._cached = 0
+
+
+def parse_args():
+    """Parse input arguments."""
+    parser = argparse.ArgumentParser(description='Render annotated clips from an overlay sidecar')
+    parser.add_argument("--overlay", help="Overlay sidecar directory.", type=str, default="overlay")
+    parser.add_argument("--video", help="Video; defaults to the one the overlay was recorded from.", type=str)
+    parser.add_argument("--start", help="Clip start in seconds.", type=float, default=0.)
+    parser.add_argument("--duration", help="Clip length in seconds.", type=float, default=10.)
+    parser.add_argument("--player", help="Render the appearances of this track ID instead of a time range.",
+                        type=int)
+    parser.add_argument("--max_duration", help="Longest player clip in seconds.", type=float)
+    parser.add_argument("--output", type=str, default="clip.mp4")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    import time
+
+    args = parse_args()
+    renderer = ClipRenderer(args.overlay, args.video)
+    start_time = time.perf_counter()
+    if args.player is not None:
+        max_frames = int(args.max_duration * renderer.fps) if args.max_duration else None
+        written = renderer.render_player(args.player, args.output, max_frames=max_frames)
+    else:
+        start = int(round(args.start * renderer.fps))
+        written = renderer.render(start, start + int(round(args.duration * renderer.fps)), args.output)
+    renderer.close()
+    print(f"Wrote {written} frames to {args.output} in {time.perf_counter() - start_time:.1f}s")
@@ -0,0 +1,217 @@
+"""
+Threaded decode -> batched inference -> track -> encode pipeline.
+
+The serial loop in `main.py` leaves the CPU idle while the detector runs and
+while frames are encoded. `PipelineRunner` overlaps the stages with bounded
+queues:
+
+    decoder thread  ->  inference thread (N frames per call)  ->
+    tracking stage (caller thread, strictly in frame order)  ->  writer thread
+
+Frames keep their order through every stage, so the outputs are identical to
+the serial loop. The detector is any callable that maps a list of frames to a
+list of `(N, 6)` `[x1, y1, x2, y2, conf, cls]` arrays, which makes the runner
+easy to drive with a stub instead of `ultralytics.YOLO`.
+"""
+import queue
+import threading
+import time
+
+from instrumentation import Instrumentation
+
+_END = object()
+
+
+class PipelineStopped(Exception):
+    """Raised inside a stage when the pipeline is shutting down."""
+
+
+class PipelineRunner:
+    """
+    Runs a video through the pipeline.
+
+    Args:
+        detect (callable): Batched detector, `detect(frames) -> [dets, ...]`.
+        batch_size (int): Frames per detector call.
+        queue_depth (int): Capacity of each inter-stage queue.
+        preprocess (callable): Optional per-frame transform run by the decoder
+            (e.g. resizing), before the frame reaches the detector.
+        instrumentation (Instrumentation): Records the decode, preprocess,
+            detect (per frame), wait and write stage times.
+        schedule (callable): Optional `schedule(index) -> bool`; frames it
+            rejects skip the detector and reach `process` with None detections
+            (e.g. `cadence.DetectionScheduler.is_keyframe`).
+        lockstep (bool): `schedule` depends on the tracking of the frames it
+            accepted (an adaptive `DetectionScheduler`): it is only called once
+            `process` has handled the last accepted frame, so it picks the same
+            frames as the serial loop. A batch then holds one detected frame.
+    """
+
+    def __init__(self, detect, batch_size=8, queue_depth=16, preprocess=None, instrumentation=None,
+                 schedule=None, lockstep=False):
+        self.detect = detect
+        self.batch_size = max(1, int(batch_size))
+        self.queue_depth = max(1, int(queue_depth))
+        self.preprocess = preprocess
+        self.stats = instrumentation if instrumentation is not None else Instrumentation(enabled=False)
+        self.schedule = schedule
+        self.lockstep = lockstep
+        self.completed = False
+        self._stop = threading.Event()
+        self._errors = []
+        # Last frame handed to `process` and last frame `schedule` accepted, for lockstep
+        self._tracked = threading.Condition()
+        self._processed = -1
+        self._scheduled = None
+
+    def _put(self, q, item):
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+        raise PipelineStopped()
+
+    def _get(self, q):
+        while True:
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                if self._stop.is_set():
+                    raise PipelineStopped()
+
+    def _stage(self, target, *args):
+        def run():
+            try:
+                target(*args)
+            except PipelineStopped:
+                pass
+            except BaseException as e:
+                self._errors.append(e)
+                self._stop.set()
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def _decode(self, read, frames_q, start):
+        index = start
+        while not self._stop.is_set():
+            with self.stats.stage("decode"):
+                ret, frame = read()
+            if not ret:
+                break
+            if self.preprocess is not None:
+                with self.stats.stage("preprocess"):
+                    frame = self.preprocess(frame)
+            self._put(frames_q, (index, frame))
+            index += 1
+        self._put(frames_q, _END)
+
+    def _keyframe(self, index):
+        if self.schedule is None:
+            return True
+        if self.lockstep and self._scheduled is not None:
+            with self._tracked:
+                while self._processed < self._scheduled:
+                    if self._stop.is_set():
+                        raise PipelineStopped()
+                    self._tracked.wait(0.1)
+        if not self.schedule(index):
+            return False
+        self._scheduled = index
+        return True
+
+    def _infer(self, frames_q, dets_q):
+        done = False
+        while not done:
+            batch = []
+            keyframe = False
+            # Wait for batch_size frames or the end of the stream; in lockstep a keyframe
+            # closes the batch early, as the next decision waits for its tracking
+            while len(batch) < self.batch_size and not (keyframe and self.lockstep):
+                item = self._get(frames_q)
+                if item is _END:
+                    done = True
+                    break
+                keyframe = self._keyframe(item[0])
+                batch.append(item + (keyframe,))
+            selected = [frame for _, frame, detect in batch if detect]
+            found = iter(())
+            if selected:
+                started = time.perf_counter()
+                found = iter(self.detect(selected))
+                self.stats.record("detect", (time.perf_counter() - started) / len(selected))
+            for index, frame, detect in batch:
+                self._put(dets_q, (index, frame, next(found) if detect else None))
+        self._put(dets_q, _END)
+
+    def _write(self, write, out_q):
+        while True:
+            frame = self._get(out_q)
+            if frame is _END:
+                break
+            with self.stats.stage("write"):
+                write(frame)
+
+    def run(self, read, process, write=None, start=0):
+        """
+        Runs the pipeline until the source is exhausted or `process` asks to stop.
+
+        Args:
+            read (callable): Frame source with the `cv2.VideoCapture.read`
+                signature, returning `(ret, frame)`.
+            process (callable): `process(index, frame, detections)` called in
+                frame order on the caller thread; detections are None for
+                frames skipped by `schedule`. Returns the frame to encode,
+                None to encode nothing, or False to stop the run.
+            write (callable): Optional encoder, e.g. `cv2.VideoWriter.write`.
+            start (int): Index of the first frame `read` returns, when the
+                source was seeked, e.g. to resume from a checkpoint.
+
+        Returns:
+            int: Number of frames processed. `completed` tells whether the
+            source was exhausted rather than stopped by `process`.
+        """
+        self.completed = False
+        self._stop.clear()
+        self._errors = []
+        self._processed, self._scheduled = start - 1, None
+        frames_q = queue.Queue(self.queue_depth)
+        dets_q = queue.Queue(self.queue_depth)
+        out_q = queue.Queue(self.queue_depth)
+        threads = [self._stage(self._decode, read, frames_q, start),
+                   self._stage(self._infer, frames_q, dets_q)]
+        if write is not None:
+            threads.append(self._stage(self._write, write, out_q))
+
+        processed = 0
+        try:
+            while True:
+                # Time the tracking stage spends starved by decode/inference
+                with self.stats.stage("wait"):
+                    item = self._get(dets_q)
+                if item is _END:
+                    self.completed = True
+                    break
+                result = process(*item)
+                processed += 1
+                with self._tracked:
+                    self._processed = item[0]
+                    self._tracked.notify()
+                if result is False:
+                    break
+                if result is not None and write is not None:
+                    self._put(out_q, result)
+            if write is not None:
+                self._put(out_q, _END)
+                threads[-1].join()
+        except PipelineStopped:
+            pass
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+        if self._errors:
+            raise self._errors[0]
+        return processed
@@ -0,0 +1,190 @@
+"""
+Real-time ingestion for live feeds.
+
+A capture thread reads the source as fast as it produces frames and keeps
+only the newest `queue_depth` of them, so a slow consumer can never make the
+source back up. Every frame carries its source index and capture time; the
+tracking loop measures each frame's latency from capture to output and, when
+a frame is older than the latency budget on arrival, applies a drop policy:
+
+    drop_oldest          discard late frames while fresher ones are queued
+    skip_detection       track the late frame on prediction only
+    degrade_resolution   run the detector on a downscaled frame, stepping the
+                         scale down while frames are late and back up once
+                         latency is below half the budget
+
+Skipped source frames are never hidden from the tracker: frames reach
+`process` with their source index, and `cadence.CadenceTracker` passes the
+gap since the last detection to `BatchedSort.update(steps=...)`, so the
+Kalman prediction covers the frames that were dropped.
+
+A local file can stand in for a live feed: `source_fps` paces the reads at the
+file's native rate, the way a camera would deliver them.
+"""
+import collections
+import threading
+import time
+
+import numpy as np
+
+from instrumentation import Instrumentation
+
+DROP_POLICIES = ("drop_oldest", "skip_detection", "degrade_resolution")
+
+
+class RealtimeRunner:
+    """
+    Runs a live source through detection and tracking within a latency budget.
+
+    Args:
+        detect (callable): Detector, `detect(frame) -> (N, 5+) array` in frame coordinates.
+        latency_budget (float): Allowed seconds from capture to output.
+        policy (str): One of `DROP_POLICIES`.
+        queue_depth (int): Frames buffered between capture and tracking; the
+            oldest is discarded when a new frame arrives on a full queue.
+        scales (tuple): Detector input scales used by `degrade_resolution`.
+        instrumentation (Instrumentation): Records latency, detect and the
+            dropped / skipped / degraded counts.
+        schedule (callable): Optional `schedule(index) -> bool` choosing the
+            frames to detect (e.g. `cadence.DetectionScheduler.is_keyframe`).
+    """
+
+    def __init__(self, detect, latency_budget=0.2, policy="drop_oldest", queue_depth=4,
+                 scales=(1.0, 0.75, 0.5), instrumentation=None, schedule=None):
+        if policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy {policy!r}, expected one of {DROP_POLICIES}")
+        self.detect = detect
+        self.latency_budget = latency_budget
+        self.policy = policy
+        self.queue_depth = max(1, int(queue_depth))
+        self.scales = tuple(scales)
+        self.stats = instrumentation if instrumentation is not None else Instrumentation(enabled=False)
+        self.schedule = schedule
+        self.completed = False
+        self.counts = collections.Counter()
+        self._scale_level = 0
+        self._last_latency = 0.
+        self._queue = collections.deque()
+        self._ready = threading.Condition()
+        self._stop = threading.Event()
+        self._done = False
+        self._error = None
+
+    def _capture(self, read, source_fps):
+        try:
+            index = 0
+            start = time.perf_counter()
+            while not self._stop.is_set():
+                if source_fps:
+                    # A live source delivers frame i at i / fps, whatever the consumer does
+                    delay = start + index / source_fps - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                ret, frame = read()
+                if not ret:
+                    break
+                with self._ready:
+                    if len(self._queue) >= self.queue_depth:
+                        self._queue.popleft()
+                        self.counts["overflow"] += 1
+                    self._queue.append((index, time.perf_counter(), frame))
+                    self._ready.notify()
+                index += 1
+        except BaseException as e:
+            self._error = e
+        finally:
+            with self._ready:
+                self._done = True
+                self._ready.notify()
+
+    def _next(self):
+        """Returns the next queued (index, captured, frame, backlog) or None at the end."""
+        with self._ready:
+            while not self._queue and not self._done:
+                self._ready.wait(0.1)
+            if not self._queue:
+                return None
+            index, captured, frame = self._queue.popleft()
+            return index, captured, frame, len(self._queue)
+
+    def _detect(self, frame, late):
+        if self.policy == "degrade_resolution":
+            if late:
+                self._scale_level = min(self._scale_level + 1, len(self.scales) - 1)
+            elif self._last_latency < self.latency_budget / 2:
+                self._scale_level = max(self._scale_level - 1, 0)
+            scale = self.scales[self._scale_level]
+            if scale != 1.0:
+                import cv2
+                self.counts["degraded"] += 1
+                small = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+                detections = np.array(self.detect(small), dtype=np.float32, copy=True)
+                detections[:, :4] /= scale
+                return detections
+        return self.detect(frame)
+
+    def run(self, read, process, write=None, source_fps=None):
+        """
+        Runs until the source ends or `process` returns False.
+
+        Args:
+            read (callable): `read() -> (ret, frame)`, e.g. `cv2.VideoCapture.read`.
+            process (callable): `process(index, frame, detections)` with the
+                source frame index; detections are None when detection was
+                skipped. Returns the frame to write, None or False to stop.
+            write (callable): Optional output, e.g. `cv2.VideoWriter.write`.
+            source_fps (float): Pace the reads at this rate (file replay).
+
+        Returns:
+            int: Number of frames processed; `counts` holds the dropped,
+            skipped, degraded and overflow counts.
+        """
+        self.completed = False
+        self.counts = collections.Counter()
+        self._queue.clear()
+        self._stop.clear()
+        self._done = False
+        self._error = None
+        self._last_latency = 0.
+        capture = threading.Thread(target=self._capture, args=(read, source_fps), daemon=True)
+        capture.start()
+
+        processed = 0
+        try:
+            while True:
+                with self.stats.stage("wait"):
+                    item = self._next()
+                if item is None:
+                    self.completed = self._error is None
+                    break
+                index, captured, frame, backlog = item
+                late = time.perf_counter() - captured > self.latency_budget
+                if late and self.policy == "drop_oldest" and backlog:
+                    self.counts["dropped"] += 1
+                    continue
+
+                detections = None
+                if self.schedule is None or self.schedule(index):
+                    if late and self.policy == "skip_detection":
+                        self.counts["skipped"] += 1
+                    else:
+                        with self.stats.stage("detect"):
+                            detections = self._detect(frame, late)
+
+                result = process(index, frame, detections)
+                if result is not None and result is not False and write is not None:
+                    with self.stats.stage("write"):
+                        write(result)
+                self._last_latency = time.perf_counter() - captured
+                self.stats.record("latency", self._last_latency)
+                for name in ("dropped", "skipped", "degraded", "overflow"):
+                    self.stats.gauge(f"frames_{name}", self.counts[name])
+                processed += 1
+                if result is False:
+                    break
+        finally:
+            self._stop.set()
+            capture.join()
+        if self._error is not None:
+            raise self._error
+        return processed
@@ -19,16 +19,10 @@ from __future__ import print_function
 
 import os
 import numpy as np
-import matplotlib
-matplotlib.use('TkAgg')
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-from skimage import io
 
 import glob
 import time
 import argparse
-from filterpy.kalman import KalmanFilter
 
 np.random.seed(0)
 
@@ -100,6 +94,8 @@ class KalmanBoxTracker(object):
     """
     Initialises a tracker using initial bounding box.
     """
+    # filterpy (and scipy behind it) is only needed by this per-track reference implementation
+    from filterpy.kalman import KalmanFilter
     #define constant velocity model
     self.kf = KalmanFilter(dim_x=7, dim_z=4) 
     self.kf.F = np.array([[1,0,0,0,1,0,0],[0,1,0,0,0,1,0],[0,0,1,0,0,0,1],[0,0,0,1,0,0,0],  [0,0,0,0,1,0,0],[0,0,0,0,0,1,0],[0,0,0,0,0,0,1]])
@@ -171,29 +167,133 @@ def associate_detections_to_trackers(detections,trackers,iou_threshold = 0.3):
   else:
     matched_indices = np.empty(shape=(0,2))
 
-  unmatched_detections = []
-  for d, det in enumerate(detections):
-    if(d not in matched_indices[:,0]):
-      unmatched_detections.append(d)
-  unmatched_trackers = []
-  for t, trk in enumerate(trackers):
-    if(t not in matched_indices[:,1]):
-      unmatched_trackers.append(t)
+  matched_indices = matched_indices.astype(int)
+  det_matched = np.zeros(len(detections), dtype=bool)
+  det_matched[matched_indices[:,0]] = True
+  trk_matched = np.zeros(len(trackers), dtype=bool)
+  trk_matched[matched_indices[:,1]] = True
 
   #filter out matched with low IOU
-  matches = []
-  for m in matched_indices:
-    if(iou_matrix[m[0], m[1]]<iou_threshold):
-      unmatched_detections.append(m[0])
-      unmatched_trackers.append(m[1])
-    else:
-      matches.append(m.reshape(1,2))
-  if(len(matches)==0):
-    matches = np.empty((0,2),dtype=int)
-  else:
-    matches = np.concatenate(matches,axis=0)
+  low = iou_matrix[matched_indices[:,0], matched_indices[:,1]] < iou_threshold
+  unmatched_detections = np.concatenate((np.flatnonzero(~det_matched), matched_indices[low,0]))
+  unmatched_trackers = np.concatenate((np.flatnonzero(~trk_matched), matched_indices[low,1]))
+  matches = matched_indices[~low].reshape(-1,2)
+
+  return matches, unmatched_detections, unmatched_trackers
+
+
+def iou_pairs(bb_test, bb_gt):
+  """
+  Computes IOU between matching rows of two arrays of bboxes in the form [x1,y1,x2,y2],
+  with exactly the same arithmetic as iou_batch
+  """
+  xx1 = np.maximum(bb_test[..., 0], bb_gt[..., 0])
+  yy1 = np.maximum(bb_test[..., 1], bb_gt[..., 1])
+  xx2 = np.minimum(bb_test[..., 2], bb_gt[..., 2])
+  yy2 = np.minimum(bb_test[..., 3], bb_gt[..., 3])
+  w = np.maximum(0., xx2 - xx1)
+  h = np.maximum(0., yy2 - yy1)
+  wh = w * h
+  o = wh / ((bb_test[..., 2] - bb_test[..., 0]) * (bb_test[..., 3] - bb_test[..., 1])
+    + (bb_gt[..., 2] - bb_gt[..., 0]) * (bb_gt[..., 3] - bb_gt[..., 1]) - wh)
+  return(o)
+
+
+def candidate_pairs(detections, trackers):
+  """
+  Finds the detection/tracker pairs with a positive IOU without building the dense IOU matrix.
+
+  Trackers sorted by x1 act as an interval index: a detection can only overlap trackers whose
+  x1 lies in [det_x1 - max_tracker_width, det_x2). Returns (det_idx, trk_idx, iou) with iou > 0.
+  """
+  empty = (np.empty(0, dtype=int), np.empty(0, dtype=int), np.empty(0))
+  if len(detections) == 0 or len(trackers) == 0:
+    return empty
+  order = np.argsort(trackers[:,0], kind='stable')
+  x1 = trackers[order,0]
+  max_w = np.max(trackers[:,2] - trackers[:,0])
+  lo = np.searchsorted(x1, detections[:,0] - max_w, 'left')
+  hi = np.searchsorted(x1, detections[:,2], 'left')
+  counts = np.maximum(hi - lo, 0)
+  total = counts.sum()
+  if total == 0:
+    return empty
+  det_idx = np.repeat(np.arange(len(detections)), counts)
+  first = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+  trk_idx = order[first + np.arange(total)]
+  iou = iou_pairs(detections[det_idx], trackers[trk_idx])
+  keep = iou > 0
+  return det_idx[keep], trk_idx[keep], iou[keep]
+
+
+def associate_detections_to_trackers_gated(detections,trackers,iou_threshold = 0.3):
+  """
+  Same assignment as associate_detections_to_trackers, computed on the sparse graph of
+  overlapping detection/tracker pairs only.
+
+  Pairs that do not overlap have an IOU of 0, so maximising the total IOU decomposes over the
+  connected components of the overlap graph: each component is solved on its own with a small
+  dense assignment. Matches and unmatched sets are the same as the dense path (up to ties
+  between equally good assignments), which needs iou_threshold > 0: at 0 the dense path also
+  keeps pairs that do not overlap.
+
+  Unmatched detections come in the order of the dense path, so new tracks are numbered alike:
+  ascending whenever the assignment covers every detection. With more detections than
+  trackers the dense assignment leaves some out and lists them first, which depends on how it
+  breaks ties between non-overlapping pairs, so such frames are handed to the dense path. The
+  trackers are then fewer than the detections, which keeps its matrix small.
+  """
+  if iou_threshold <= 0:
+    raise ValueError("gated association needs iou_threshold > 0")
+  if(len(trackers)==0):
+    return np.empty((0,2),dtype=int), np.arange(len(detections)), np.empty((0,5),dtype=int)
 
-  return matches, np.array(unmatched_detections), np.array(unmatched_trackers)
+  det_idx, trk_idx, iou = candidate_pairs(detections, trackers)
+  above = iou > iou_threshold
+  # One candidate above the threshold per detection and tracker: the dense path skips the assignment too
+  unique = above.any() and np.bincount(det_idx[above]).max() == 1 and np.bincount(trk_idx[above]).max() == 1
+  if not unique and len(detections) > len(trackers):
+    return associate_detections_to_trackers(detections, trackers, iou_threshold)
+  matches = np.empty((0,2),dtype=int)
+  # Like the dense path, pairs at exactly the threshold only match through the assignment
+  if (iou >= iou_threshold).any():
+    if unique:
+      matches = np.stack((det_idx[above], trk_idx[above]), axis=1)
+    else:
+      from scipy.sparse import coo_matrix
+      from scipy.sparse.csgraph import connected_components
+      n_det = len(detections)
+      n = n_det + len(trackers)
+      graph = coo_matrix((np.ones(len(iou)), (det_idx, n_det + trk_idx)), shape=(n, n))
+      _, labels = connected_components(graph, directed=False)
+      component = labels[det_idx]
+      order = np.argsort(component, kind='stable')
+      bounds = np.flatnonzero(np.diff(component[order])) + 1
+      groups = np.split(order, bounds)
+      found = []
+      for group in groups:
+        if len(group) == 1:
+          found.append(group)
+          continue
+        dets, det_local = np.unique(det_idx[group], return_inverse=True)
+        trks, trk_local = np.unique(trk_idx[group], return_inverse=True)
+        sub = np.zeros((len(dets), len(trks)))
+        sub[det_local, trk_local] = iou[group]
+        assigned = linear_assignment(-sub)
+        pair_of = np.full((len(dets), len(trks)), -1)
+        pair_of[det_local, trk_local] = group
+        picked = pair_of[assigned[:,0], assigned[:,1]]
+        found.append(picked[picked >= 0])
+      found = np.concatenate(found)
+      found = found[iou[found] >= iou_threshold]
+      matches = np.stack((det_idx[found], trk_idx[found]), axis=1)
+    matches = matches[np.argsort(matches[:,0], kind='stable')]
+
+  det_matched = np.zeros(len(detections), dtype=bool)
+  det_matched[matches[:,0]] = True
+  trk_matched = np.zeros(len(trackers), dtype=bool)
+  trk_matched[matches[:,1]] = True
+  return matches, np.flatnonzero(~det_matched), np.flatnonzero(~trk_matched)
 
 
 class Sort(object):
@@ -277,6 +377,12 @@ if __name__ == '__main__':
   total_frames = 0
   colours = np.random.rand(32, 3) #used only for display
   if(display):
+    # The display dependencies are loaded only for the demo, the tracker itself needs NumPy alone
+    import matplotlib
+    matplotlib.use('TkAgg')
+    import matplotlib.pyplot as plt
+    import matplotlib.patches as patches
+    from skimage import io
     if not os.path.exists('mot_benchmark'):
       print('\n\tERROR: mot_benchmark link not found!\n\n    Create a symbolic link to the MOT benchmark\n    (https://motchallenge.net/data/2D_MOT_2015/#download). E.g.:\n\n    $ ln -s /path/to/MOT2015_challenge/2DMOT2015 mot_benchmark\n\n')
       exit()
@@ -0,0 +1,482 @@
+"""
+Pitch-mask tiled inference for high-resolution footage.
+
+Downscaling a 1080p or 4K broadcast frame to the detector input shrinks
+distant players to a few pixels, while much of the input is stands and sky.
+`TiledDetector` instead builds a pitch mask once (from the grass colour or a
+pitch calibration) and refreshes it rarely, cuts the full resolution frame
+into detector-sized tiles covering only the pitch, runs all tiles of a batch
+of frames through the wrapped detector in one call and merges the per-tile
+boxes back into frame coordinates:
+
+* boxes touching a tile edge inside the frame are partial; the overlapping
+  neighbour tile sees the player whole, so partial boxes rank below whole ones
+  and are suppressed by intersection over the smaller box,
+* the rest is greedy non-maximum suppression, evaluated on the whole overlap
+  matrix at once (see `nms`).
+
+Full resolution tiles cost several times the detector input of the
+downscaled frame. With a `budget` the tiles are downscaled band by band to fit
+a fixed number of detector input pixels (see `plan_scaled_tiles`): the pitch
+narrows with distance as the players shrink, so the far bands keep the most
+resolution and the near ones, whose players are large, give it up.
+
+Running this module compares full-frame and tiled detection on rendered
+synthetic frames with the `detectors.BlobDetector` stub:
+
+    python tiling.py --frames 200 --frame_size 1920 1080
+"""
+import argparse
+import time
+
+import numpy as np
+
+from detectors import Detector
+
+
+def _head_room(mask, pixels):
+    """Extends `mask` upwards by `pixels`, for players on the far lines whose heads leave the pitch."""
+    pixels = int(pixels)
+    if pixels <= 0:
+        return mask
+    # A pixel is kept when any of the `pixels` rows below it is on the pitch
+    below = np.zeros((mask.shape[0] + 1, mask.shape[1]), dtype=np.int32)
+    np.cumsum(mask, axis=0, out=below[1:])
+    rows = np.arange(mask.shape[0])
+    last = np.minimum(rows + pixels + 1, mask.shape[0])
+    return below[last] - below[rows] > 0
+
+
+def pitch_mask(frame, hue=(35, 85), min_saturation=40, min_value=40, scale=0.25, margin=32, head_room=64):
+    """
+    Returns the boolean pitch mask of a BGR frame: the largest grass-coloured
+    region, with the players and lines on it filled in.
+
+    Args:
+        hue (tuple): OpenCV hue range of the grass.
+        scale (float): The mask is computed on the frame downscaled by `scale`.
+        margin (int): Pixels added around the pitch, and the size of the gaps closed.
+        head_room (int): Pixels added above the pitch for the players' heads.
+    """
+    import cv2
+    height, width = frame.shape[:2]
+    small = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+    green = cv2.inRange(hsv, (hue[0], min_saturation, min_value), (hue[1], 255, 255))
+    kernel = np.ones((max(3, int(2 * margin * scale) | 1),) * 2, dtype=np.uint8)
+    green = cv2.morphologyEx(green, cv2.MORPH_CLOSE, kernel)
+    n, labels, stats, _ = cv2.connectedComponentsWithStats(green)
+    if n <= 1:
+        # No grass found: detect everywhere
+        return np.ones((height, width), dtype=bool)
+    largest = 1 + int(np.argmax(stats[1:, cv2.CC_STAT_AREA]))
+    mask = cv2.dilate((labels == largest).astype(np.uint8), kernel)
+    mask = cv2.resize(mask, (width, height), interpolation=cv2.INTER_NEAREST).astype(bool)
+    return _head_room(mask, head_room)
+
+
+def pitch_mask_from_calibration(calibration, frame_size, margin=3., head_room=64):
+    """
+    Returns the boolean mask of the pitch outline projected into a frame of
+    `frame_size` (width, height) through a `calibration.PitchCalibration`.
+
+    Args:
+        margin (float): Metres added around the pitch.
+        head_room (int): Pixels added above the pitch for the players' heads.
+    """
+    import cv2
+    from calibration import apply_homography
+    width, height = frame_size
+    length, field_width = calibration.field_length, calibration.field_width
+    corners = np.array([[-margin, -margin], [length + margin, -margin],
+                        [length + margin, field_width + margin], [-margin, field_width + margin]])
+    outline = apply_homography(np.linalg.inv(calibration.resized(frame_size).homography), corners)
+    mask = np.zeros((height, width), dtype=np.uint8)
+    cv2.fillPoly(mask, [np.round(outline).astype(np.int32)], 1)
+    return _head_room(mask.astype(bool), head_room)
+
+
+def _spans(lo, hi, size, overlap):
+    """
+    Returns the starts and the common length of the fewest spans of at most
+    `size` covering [lo, hi) with neighbours overlapping by at least `overlap`.
+    """
+    length = hi - lo
+    if length <= size:
+        return np.array([lo], dtype=np.int64), length
+    n = int(np.ceil((length - overlap) / (size - overlap)))
+    span = int(np.ceil((length + (n - 1) * overlap) / n))
+    return lo + np.round(np.linspace(0, length - span, n)).astype(np.int64), span
+
+
+def plan_tiles(mask, tile_size=640, overlap=96, min_coverage=0.02):
+    """
+    Returns the (T, 4) [x1, y1, x2, y2] tiles covering the pitch mask.
+
+    The rows holding the pitch are split into bands and each band's pitch
+    columns into tiles, all no larger than `tile_size` (so the detector never
+    downscales them) and overlapping by at least `overlap` pixels; tiles are
+    evenly sized, so the overlap is no larger than needed. Tiles with less
+    than `min_coverage` of their area on the pitch are dropped, their
+    coverage read from one integral image.
+    """
+    height, width = mask.shape
+    rows = np.flatnonzero(mask.any(axis=1))
+    if len(rows) == 0:
+        return np.zeros((0, 4), dtype=np.int64)
+    tiles = []
+    ys, tile_h = _spans(rows[0], rows[-1] + 1, tile_size, overlap)
+    for y in ys.tolist():
+        cols = np.flatnonzero(mask[y:y + tile_h].any(axis=0))
+        xs, tile_w = _spans(cols[0], cols[-1] + 1, tile_size, overlap)
+        tiles.extend([x, y, x + tile_w, y + tile_h] for x in xs.tolist())
+    tiles = np.array(tiles, dtype=np.int64)
+    return tiles[_covered(mask, tiles, min_coverage)]
+
+
+def _covered(mask, tiles, min_coverage):
+    """True for the tiles with at least `min_coverage` of their area on the pitch, read from one integral image."""
+    height, width = mask.shape
+    integral = np.zeros((height + 1, width + 1), dtype=np.int64)
+    np.cumsum(np.cumsum(mask, axis=0, dtype=np.int64), axis=1, out=integral[1:, 1:])
+    x1, y1, x2, y2 = tiles.T
+    covered = integral[y2, x2] - integral[y1, x2] - integral[y2, x1] + integral[y1, x1]
+    return covered >= min_coverage * (x2 - x1) * (y2 - y1)
+
+
+def tile_pixels(tiles, scales=1.):
+    """Detector input pixels of `tiles` downscaled by `scales`."""
+    return float((((tiles[:, 2] - tiles[:, 0]) * (tiles[:, 3] - tiles[:, 1])) * np.square(scales)).sum())
+
+
+def plan_scaled_tiles(mask, max_pixels, tile_size=640, overlap=96, min_coverage=0.02, bands=2):
+    """
+    Returns the (T, 4) tiles covering the pitch mask and the (T,) scales they
+    are resized by, within `max_pixels` detector input pixels in all.
+
+    The pitch rows are cut into `bands` bands, overlapping by `overlap`, from
+    the far side down. A band is scaled by `c / pitch width` at its middle row,
+    at most 1, and its columns are split into tiles overlapping by `overlap`
+    frame pixels, each filling at most a `tile_size` input. `c` is the largest
+    value that fits the budget, found by bisection. A budget above the full
+    resolution plan returns the `plan_tiles` layout at scale 1.
+    """
+    full = plan_tiles(mask, tile_size, overlap, min_coverage)
+    if tile_pixels(full) <= max_pixels:
+        return full, np.ones(len(full))
+    rows = np.flatnonzero(mask.any(axis=1))
+    # The pitch widens towards the camera; the running maximum evens out ragged edges
+    widths = np.maximum.accumulate(mask[rows[0]:rows[-1] + 1].sum(axis=1))
+    band_h = min(tile_size, int(np.ceil((len(widths) + (bands - 1) * overlap) / bands)))
+    ys, band_h = _spans(rows[0], rows[-1] + 1, band_h, overlap)
+    ys = ys.tolist()
+    band_cols = [np.flatnonzero(mask[y:y + band_h].any(axis=0)) for y in ys]
+
+    def plan(c):
+        planned, scales = [], []
+        for y, cols in zip(ys, band_cols):
+            scale = min(1., c / widths[min(y + band_h // 2, rows[-1]) - rows[0]])
+            xs, tile_w = _spans(cols[0], cols[-1] + 1, int(tile_size / scale), overlap)
+            planned.extend([x, y, x + tile_w, y + band_h] for x in xs.tolist())
+            scales.extend([scale] * len(xs))
+        return np.array(planned, dtype=np.int64), np.array(scales)
+
+    lo, hi = 0., float(widths[-1])
+    best = plan(1.)
+    for _ in range(30):
+        c = (lo + hi) / 2
+        planned, scales = plan(c)
+        if tile_pixels(planned, scales) <= max_pixels:
+            lo, best = c, (planned, scales)
+        else:
+            hi = c
+    keep = _covered(mask, best[0], min_coverage)
+    return best[0][keep], best[1][keep]
+
+
+def box_overlaps(boxes):
+    """Returns the (N, N) pairwise intersection areas and the (N,) areas of [x1, y1, x2, y2] boxes."""
+    top_left = np.maximum(boxes[:, None, :2], boxes[None, :, :2])
+    bottom_right = np.minimum(boxes[:, None, 2:4], boxes[None, :, 2:4])
+    wh = np.clip(bottom_right - top_left, 0, None)
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return wh[..., 0] * wh[..., 1], area
+
+
+def nms(boxes, scores, iou_threshold=0.5, partial=None, ios_threshold=0.6):
+    """
+    Greedy non-maximum suppression without a per-box loop.
+
+    Boxes are ranked by score, `partial` boxes after all whole ones. The
+    greedy result is the fixed point of "a box is kept when no kept box ranked
+    above it overlaps it"; each pass evaluates that rule for every box on the
+    whole overlap matrix, and it settles in as many passes as the longest
+    suppression chain, usually two or three. Pairs involving a partial box
+    are compared by intersection over the smaller area against
+    `ios_threshold`, so the piece of a player cut by a tile edge is
+    suppressed by the whole box from the neighbouring tile.
+
+    Returns:
+        np.ndarray: Indices of the kept boxes, in rank order.
+    """
+    n = len(boxes)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    partial = np.zeros(n, dtype=bool) if partial is None else np.asarray(partial, dtype=bool)
+    order = np.lexsort((-np.asarray(scores), partial))
+    inter, area = box_overlaps(np.asarray(boxes, dtype=float)[order])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        suppress = inter / (area[:, None] + area[None, :] - inter) > iou_threshold
+        if partial.any():
+            ranked = partial[order]
+            either = ranked[:, None] | ranked[None, :]
+            suppress |= either & (inter / np.minimum(area[:, None], area[None, :]) > ios_threshold)
+    suppress = np.triu(suppress, 1)
+    keep = np.ones(n, dtype=bool)
+    while True:
+        kept = ~(suppress & keep[:, None]).any(axis=0)
+        if (kept == keep).all():
+            return order[keep]
+        keep = kept
+
+
+def merge_tiles(detections, tiles, frame_size, iou_threshold=0.5, ios_threshold=0.6, edge_margin=2.,
+                scales=None):
+    """
+    Merges per-tile detections into one frame's detections.
+
+    Args:
+        detections (list): One (N, 5+) array per tile, in tile coordinates.
+        tiles (np.ndarray): (T, 4) tiles the detections come from.
+        frame_size (tuple): (width, height) of the frame.
+        edge_margin (float): Boxes within this many pixels of a tile edge
+            inside the frame are partial.
+        scales (np.ndarray): (T,) scales the tiles were resized by, if any.
+    """
+    width, height = frame_size
+    scales = np.ones(len(tiles)) if scales is None else scales
+    merged, partial = [], []
+    for dets, (x1, y1, x2, y2), scale in zip(detections, tiles, scales):
+        dets = np.array(dets, dtype=np.float32, copy=True)
+        dets[:, :4] /= scale
+        dets[:, [0, 2]] += x1
+        dets[:, [1, 3]] += y1
+        merged.append(dets)
+        partial.append(((dets[:, 0] <= x1 + edge_margin) & (x1 > 0))
+                       | ((dets[:, 1] <= y1 + edge_margin) & (y1 > 0))
+                       | ((dets[:, 2] >= x2 - edge_margin) & (x2 < width))
+                       | ((dets[:, 3] >= y2 - edge_margin) & (y2 < height)))
+    merged = np.concatenate(merged)
+    keep = nms(merged[:, :4], merged[:, 4], iou_threshold, np.concatenate(partial), ios_threshold)
+    return merged[keep]
+
+
+class TiledDetector(Detector):
+    """
+    Runs a detector on full resolution tiles covering the pitch.
+
+    Args:
+        detector (Detector): Detector run on the tiles, e.g. a `YoloDetector`.
+        tile_size (int): Tile side in pixels, ideally the detector input size
+            so tiles are not rescaled.
+        overlap (int): Minimum overlap of neighbouring tiles; should exceed
+            the height of the tallest player.
+        min_coverage (float): Fraction of a tile on the pitch for it to be run.
+        iou_threshold (float): NMS threshold of the merge.
+        mask (np.ndarray): Fixed boolean pitch mask (e.g. from
+            `pitch_mask_from_calibration`); by default it is computed from the
+            grass colour of the first frame.
+        refresh_every (int): Frames between pitch mask updates for moving
+            cameras; 0 keeps the first mask.
+        full_frame (bool): Also run the detector on the whole frame, for
+            players close to the camera that are larger than a tile.
+        budget (float): Detector input pixels per frame, relative to the
+            whole frame downscaled to `tile_size` (1 costs as much as the
+            untiled pass); tiles are downscaled to fit, see
+            `plan_scaled_tiles`. None runs them at full resolution.
+        bands (int): Bands of rows scaled apart under a `budget`; every
+            band adds an overlap, so few bands leave the most for the far one.
+    """
+
+    def __init__(self, detector, tile_size=640, overlap=96, min_coverage=0.02, iou_threshold=0.5,
+                 mask=None, refresh_every=0, full_frame=False, budget=None, bands=2):
+        super().__init__(detector.return_class)
+        self.detector = detector
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.min_coverage = min_coverage
+        self.iou_threshold = iou_threshold
+        self.refresh_every = refresh_every
+        self.full_frame = full_frame
+        self.budget = budget
+        self.bands = bands
+        self.fixed_mask = mask
+        self.mask = None
+        self.tiles = None
+        self.scales = None
+        self._since_refresh = 0
+
+    def update_mask(self, frame):
+        """Rebuilds the pitch mask and the tile plan for `frame`."""
+        height, width = frame.shape[:2]
+        if self.fixed_mask is None:
+            self.mask = pitch_mask(frame)
+        elif self.fixed_mask.shape != (height, width):
+            import cv2
+            self.mask = cv2.resize(self.fixed_mask.astype(np.uint8), (width, height),
+                                   interpolation=cv2.INTER_NEAREST).astype(bool)
+        else:
+            self.mask = self.fixed_mask
+        frame_scale = min(1., self.tile_size / max(width, height))
+        if self.budget is None:
+            tiles = plan_tiles(self.mask, self.tile_size, self.overlap, self.min_coverage)
+            scales = np.ones(len(tiles))
+        else:
+            max_pixels = self.budget * width * height * frame_scale ** 2
+            if self.full_frame:
+                max_pixels -= width * height * frame_scale ** 2
+            tiles, scales = plan_scaled_tiles(self.mask, max_pixels, self.tile_size, self.overlap,
+                                              self.min_coverage, self.bands)
+        if self.full_frame:
+            tiles = np.concatenate([tiles, [[0, 0, width, height]]])
+            scales = np.append(scales, frame_scale)
+        self.tiles, self.scales = tiles, scales
+        self._since_refresh = 0
+        return tiles
+
+    def _plan(self, frame):
+        stale = self.refresh_every and self._since_refresh >= self.refresh_every
+        if self.tiles is None or stale or self.mask.shape != frame.shape[:2]:
+            self.update_mask(frame)
+        self._since_refresh += 1
+        return self.tiles, self.scales
+
+    @staticmethod
+    def _crop(frame, tile, scale):
+        x1, y1, x2, y2 = tile
+        crop = frame[y1:y2, x1:x2]
+        if scale < 1.:
+            import cv2
+            size = (max(1, round((x2 - x1) * scale)), max(1, round((y2 - y1) * scale)))
+            return cv2.resize(crop, size, interpolation=cv2.INTER_AREA)
+        return np.ascontiguousarray(crop)
+
+    def detect_batch(self, frames):
+        if len(frames) == 0:
+            return []
+        plans, crops = [], []
+        for frame in frames:
+            tiles, scales = self._plan(frame)
+            plans.append((tiles, scales))
+            crops.extend(self._crop(frame, tile, scale) for tile, scale in zip(tiles.tolist(), scales.tolist()))
+        # Every tile of the batch goes to the detector in one call
+        results = self.detector.detect_batch(crops) if crops else []
+        out, start = [], 0
+        for frame, (tiles, scales) in zip(frames, plans):
+            if len(tiles) == 0:
+                out.append(self.empty())
+                continue
+            out.append(merge_tiles(results[start:start + len(tiles)], tiles, (frame.shape[1], frame.shape[0]),
+                                   self.iou_threshold, scales=scales))
+            start += len(tiles)
+        return out
+
+
+def tiled_detector(detector_factory, **kwargs):
+    """Builds a `TiledDetector` around `detector_factory()`; picklable through `functools.partial`."""
+    return TiledDetector(detector_factory(), **kwargs)
+
+
+def _pitch_half_width(rows, frame_size, horizon, far=0.55):
+    """Half width in pixels of a perspective pitch at image `rows`: `far` of the frame at the horizon, all of it at the bottom."""
+    width, height = frame_size
+    depth = np.clip((rows - horizon) / max(height - horizon, 1), 0, 1)
+    return width / 2 * (far + (1 - far) * depth)
+
+
+def render_frame(players, frame_size, horizon, seed=0):
+    """
+    Draws a broadcast-like frame: a grass pitch narrowing towards `horizon`,
+    textured stands around it and the (N, 4) `players` boxes as dark figures.
+    """
+    width, height = frame_size
+    frame = np.random.default_rng(seed).integers(90, 230, (height, width, 1), dtype=np.uint8).repeat(3, axis=2)
+    rows = np.arange(height)[:, None]
+    half = _pitch_half_width(rows, frame_size, horizon)
+    frame[(rows >= horizon) & (np.abs(np.arange(width) - width / 2) <= half)] = (50, 140, 60)
+    for x1, y1, x2, y2 in np.round(players).astype(np.int64).tolist():
+        frame[max(y1, 0):max(y2, 0), max(x1, 0):max(x2, 0)] = 20
+    return frame
+
+
+def parse_args():
+    """Parse input arguments."""
+    parser = argparse.ArgumentParser(description='Tiled versus full-frame detection on synthetic frames')
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--frame_size", type=int, nargs=2, default=[1920, 1080])
+    parser.add_argument("--players", type=int, default=22)
+    parser.add_argument("--box_size", type=int, nargs=2, default=[16, 36],
+                        help="Size of the nearest players; the farthest are a third of it.")
+    parser.add_argument("--tile_size", type=int, default=640)
+    parser.add_argument("--budget", type=float, default=1.,
+                        help="Detector input of the budgeted tiles, relative to the downscaled full frame.")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    from detectors import BlobDetector, SyntheticDetector
+    from sort import iou_batch, linear_assignment
+
+    args = parse_args()
+    frame_size = width, height = tuple(args.frame_size)
+    horizon = height // 3
+    simulation = SyntheticDetector(n_players=args.players, frame_size=(width, height - horizon),
+                                   box_size=(0, 0), seed=args.seed)
+    background = render_frame(np.zeros((0, 4)), frame_size, horizon, args.seed)
+    box_size = np.asarray(args.box_size, dtype=float)
+
+    def players_at(t):
+        """Simulated foot points seen in perspective: farther players are closer to the centre and smaller."""
+        feet = simulation.ground_truth(t)[:, :2]
+        depth = feet[:, 1] / (height - horizon)
+        x = width / 2 + (feet[:, 0] - width / 2) * _pitch_half_width(feet[:, 1] + horizon, frame_size, horizon) \
+            / (width / 2)
+        y = feet[:, 1] + horizon
+        size = box_size * (1 / 3 + 2 / 3 * depth)[:, None]
+        return np.stack([x - size[:, 0] / 2, y - size[:, 1], x + size[:, 0] / 2, y], axis=1)
+
+    def frame_at(t):
+        frame = background.copy()
+        for x1, y1, x2, y2 in np.round(players_at(t)).astype(np.int64).tolist():
+            frame[y1:y2, x1:x2] = 20
+        return frame
+
+    setups = (("full frame, downscaled", BlobDetector(args.tile_size)),
+              ("full frame, native", BlobDetector(max(frame_size))),
+              ("tiles, whole frame", TiledDetector(BlobDetector(args.tile_size), args.tile_size,
+                                                   mask=np.ones((height, width), dtype=bool))),
+              ("tiles, pitch mask", TiledDetector(BlobDetector(args.tile_size), args.tile_size)),
+              (f"tiles, budget {args.budget:g}", TiledDetector(BlobDetector(args.tile_size), args.tile_size,
+                                                              budget=args.budget)))
+    for name, detector in setups:
+        found = false_positives = 0
+        elapsed = 0.
+        for t in range(args.frames):
+            frame = frame_at(t)
+            start = time.perf_counter()
+            detections = detector.detect(frame)
+            elapsed += time.perf_counter() - start
+            iou = iou_batch(detections[:, :4], players_at(t))
+            pairs = np.asarray(linear_assignment(-iou), dtype=np.int64).reshape(-1, 2)
+            matched = int((iou[pairs[:, 0], pairs[:, 1]] >= 0.3).sum()) if len(pairs) else 0
+            found += matched
+            false_positives += len(detections) - matched
+        if isinstance(detector, TiledDetector):
+            pixels = tile_pixels(detector.tiles, detector.scales)
+        else:
+            scale = min(1., detector.input_size / max(frame_size))
+            pixels = width * height * scale ** 2
+        print(f"{name:24s} recall {found / (args.frames * args.players):6.1%}  "
+              f"false positives/frame {false_positives / args.frames:5.2f}  "
+              f"detector input {pixels / 1e6:5.2f} MP/frame  {elapsed / args.frames * 1e3:6.1f} ms/frame")
@@ -0,0 +1,305 @@
+"""
+Spatio-temporal index over a tracking log.
+
+Built once after a run, it answers time range, track, rectangle and radius
+queries without scanning the log. It is a directory of columnar tables (see
+`columnar.py`), memory-mapped on open, so several analysis processes share
+the same pages:
+
+* `frames`: row offset of every frame in the log, which is in frame order,
+* `tracks` / `track_rows`: per track ID its run of log rows sorted by frame,
+* `grid` / `grid_offsets`: the rows sorted by time bucket, grid cell row and
+  cell column, with their positions, so the cells a rectangle covers in a
+  bucket are one contiguous slice per cell row.
+
+Positions are the players' foot points on the pitch in metres when the log is
+calibrated (see `calibration.py`), otherwise box centres in pixels; `space`
+tells which. Queries return log row indices in frame order, to index the
+`TrackingLogReader` columns with, e.g.
+
+    index = open_index("tracking_log")
+    rows = index.radius(52.5, 34., 5., start=3000)    # within 5 m of the centre spot at frame 3000
+    rows = index.rectangle(0, 13.84, 16.5, 54.16, 3000, 4500)   # in the left penalty box
+    frames, positions = index.trajectory(7, 3000, 4500)
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from columnar import ColumnWriter, open_columns, read_meta, remove_table
+from tracking_log import TrackingLogReader
+
+INDEX_PATH = "tracking_index"
+BUCKET_FRAMES = 250  # Frames per time bucket of the grid, 10 s at 25 fps
+CELL_SIZES = {"pitch": 5., "pixels": 32.}  # Grid cell side in the units of each space
+PITCH_MARGIN = 10.  # Metres of grid around the pitch; positions further out share the border cells
+PIXEL_QUANTILES = (0.1, 99.9)  # Percentiles of the box centres the grid spans in pixel space
+
+
+def _write_table(path, columns, **values):
+    with ColumnWriter(path, columns, chunk_rows=1 << 20) as writer:
+        n = len(next(iter(values.values())))
+        for start in range(0, n, writer.chunk_rows):
+            writer.append(**{name: value[start:start + writer.chunk_rows] for name, value in values.items()})
+
+
+def _open_table(path, name):
+    return open_columns(os.path.join(path, name))
+
+
+def log_positions(log):
+    """Returns the (n, 2) positions of a log and their space: pitch metres when calibrated, else pixels."""
+    if log.calibrated:
+        return np.asarray(log.pitch, dtype=np.float32), "pitch"
+    return np.asarray(log.centers(), dtype=np.float32), "pixels"
+
+
+def grid_bounds(log, positions, space):
+    """
+    Returns the (origin, extent) of the grid: the pitch of the log's calibration
+    plus `PITCH_MARGIN`, or in pixels the bulk of the `positions`, so a few
+    outliers (e.g. a point projected far off by the homography) do not blow up
+    the grid. Positions outside are clamped into the border cells.
+    """
+    if space == "pitch":
+        calibration = log.meta["calibration"]
+        size = np.array([calibration.get("field_length", 105.), calibration.get("field_width", 68.)])
+        return np.full(2, -PITCH_MARGIN), size + PITCH_MARGIN
+    if len(positions) == 0:
+        return np.zeros(2), np.zeros(2)
+    return np.percentile(positions, PIXEL_QUANTILES, axis=0)
+
+
+def build_index(log_path="tracking_log", path=None, bucket_frames=BUCKET_FRAMES, cell=None):
+    """
+    Builds the index of the tracking log at `log_path` and returns it opened.
+
+    Args:
+        path (str): Index directory; defaults to `tracking_index` next to the log.
+        bucket_frames (int): Frames per time bucket of the grid.
+        cell (float): Grid cell side; defaults to 5 m on the pitch or 32 pixels.
+    """
+    path = path or os.path.join(os.path.dirname(os.path.abspath(log_path)), INDEX_PATH)
+    log = TrackingLogReader(log_path)
+    frame = np.asarray(log.frame)
+    track_id = np.asarray(log.track_id)
+    positions, space = log_positions(log)
+    cell = float(cell or CELL_SIZES[space])
+    n_frames = int(frame[-1]) + 1 if len(frame) else 0
+    remove_table(path)
+    os.makedirs(path)
+
+    # Frame -> row offsets; the log is in frame order
+    _write_table(os.path.join(path, "frames"), {"offset": np.int64},
+                 offset=np.searchsorted(frame, np.arange(n_frames + 1)))
+
+    # Per track runs, frame order kept by the stable sort
+    track_rows = np.argsort(track_id, kind="stable")
+    ids, starts = np.unique(track_id[track_rows], return_index=True)
+    stops = np.append(starts[1:], len(track_rows))[:len(ids)]
+    _write_table(os.path.join(path, "track_rows"), {"row": np.int64}, row=track_rows)
+    _write_table(os.path.join(path, "tracks"),
+                 {"track_id": np.int32, "start": np.int64, "stop": np.int64, "first_frame": np.int32,
+                  "last_frame": np.int32},
+                 track_id=ids, start=starts, stop=stops, first_frame=frame[track_rows[starts]],
+                 last_frame=frame[track_rows[stops - 1]] if len(ids) else np.zeros(0, np.int32))
+
+    # Uniform grid per time bucket over the pitch or the frame; rows without a position are left out
+    placed = np.flatnonzero(np.isfinite(positions).all(axis=1))
+    origin, extent = grid_bounds(log, positions[placed], space)
+    shape = np.floor((extent - origin) / cell).astype(np.int64) + 1
+    cells = np.clip(np.floor((positions[placed] - origin) / cell).astype(np.int64), 0, shape - 1)
+    n_buckets = n_frames // bucket_frames + 1
+    key = (frame[placed] // bucket_frames * shape[1] + cells[:, 1]) * shape[0] + cells[:, 0]
+    order = np.argsort(key, kind="stable")
+    grid_rows = placed[order]
+    _write_table(os.path.join(path, "grid"), {"row": np.int64, "frame": np.int32, "position": (np.float32, 2)},
+                 row=grid_rows, frame=frame[grid_rows], position=positions[grid_rows])
+    meta = {"log": os.path.abspath(log_path), "log_rows": len(log), "n_frames": n_frames, "space": space,
+            "bucket_frames": int(bucket_frames), "cell": cell, "origin": origin.tolist(), "shape": shape.tolist()}
+    with ColumnWriter(os.path.join(path, "grid_offsets"), {"offset": np.int64}, meta=meta) as writer:
+        writer.append(offset=np.searchsorted(key[order], np.arange(n_buckets * shape[0] * shape[1] + 1)))
+    return TrackingIndex(path, log)
+
+
+def open_index(log_path="tracking_log", path=None, **kwargs):
+    """Opens the index of the log at `log_path`, (re)building it when missing or older than the log."""
+    path = path or os.path.join(os.path.dirname(os.path.abspath(log_path)), INDEX_PATH)
+    try:
+        meta = read_meta(os.path.join(path, "grid_offsets"))
+    except (OSError, ValueError):
+        meta = None
+    if meta is None or meta["log_rows"] != read_meta(log_path)["rows"]:
+        return build_index(log_path, path, **kwargs)
+    return TrackingIndex(path)
+
+
+class TrackingIndex:
+    """
+    Memory-mapped index built by `build_index`.
+
+    Args:
+        path (str): Index directory.
+        log (TrackingLogReader): The indexed log; opened from the path
+            recorded in the index when None.
+    """
+
+    def __init__(self, path=INDEX_PATH, log=None):
+        self.path = path
+        offsets, self.meta = _open_table(path, "grid_offsets")
+        self.log = log if log is not None else TrackingLogReader(self.meta["log"])
+        self.space = self.meta["space"]
+        self.bucket_frames = self.meta["bucket_frames"]
+        self.cell = self.meta["cell"]
+        self.origin = np.array(self.meta["origin"])
+        self.shape = tuple(self.meta["shape"])
+        self.n_frames = self.meta["n_frames"]
+        self._grid_offsets = offsets["offset"]
+        grid = _open_table(path, "grid")[0]
+        self._grid_rows, self._grid_frame, self._grid_position = grid["row"], grid["frame"], grid["position"]
+        self._frame_offsets = _open_table(path, "frames")[0]["offset"]
+        self._track_rows = _open_table(path, "track_rows")[0]["row"]
+        tracks = _open_table(path, "tracks")[0]
+        self.track_ids = tracks["track_id"]
+        self._track_start, self._track_stop = tracks["start"], tracks["stop"]
+        self.first_frame, self.last_frame = tracks["first_frame"], tracks["last_frame"]
+
+    def positions(self, rows):
+        """Returns the (n, 2) positions of log `rows`, in the index's space."""
+        if self.space == "pitch":
+            return np.asarray(self.log.pitch[rows], dtype=float)
+        bbox = self.log.bbox[rows]
+        return (bbox[:, :2] + bbox[:, 2:]) / 2.
+
+    def time_range(self, start, stop):
+        """Returns the slice of log rows of frames [start, stop)."""
+        start = min(max(int(start), 0), self.n_frames)
+        stop = min(max(int(stop), start), self.n_frames)
+        return slice(int(self._frame_offsets[start]), int(self._frame_offsets[stop]))
+
+    def frame(self, index):
+        """Returns the slice of log rows of frame `index`."""
+        return self.time_range(index, index + 1)
+
+    def track(self, track_id, start=None, stop=None):
+        """Returns the log rows of `track_id` in frames [start, stop), in frame order."""
+        i = np.searchsorted(self.track_ids, track_id)
+        if i == len(self.track_ids) or self.track_ids[i] != track_id:
+            return np.zeros(0, dtype=np.int64)
+        rows = self._track_rows[self._track_start[i]:self._track_stop[i]]
+        if start is not None or stop is not None:
+            frames = self.log.frame[rows]
+            lo, hi = np.searchsorted(frames, [start if start is not None else 0,
+                                              stop if stop is not None else self.n_frames])
+            rows = rows[lo:hi]
+        return np.asarray(rows)
+
+    def trajectory(self, track_id, start=None, stop=None):
+        """Returns the frames and (n, 2) positions of `track_id` in frames [start, stop)."""
+        rows = self.track(track_id, start, stop)
+        return np.asarray(self.log.frame[rows]), self.positions(rows)
+
+    def rectangle(self, x0, y0, x1, y1, start, stop=None):
+        """Returns the log rows positioned inside [x0, x1] x [y0, y1] in frames [start, stop) (one frame by default)."""
+        stop = start + 1 if stop is None else stop
+        if x0 > x1 or y0 > y1 or stop <= start:
+            return np.zeros(0, dtype=np.int64)
+        # The border cells also hold the positions clamped from outside the grid
+        last = np.array(self.shape) - 1
+        lo = np.clip(np.floor((np.array([x0, y0]) - self.origin) / self.cell).astype(np.int64), 0, last)
+        hi = np.clip(np.floor((np.array([x1, y1]) - self.origin) / self.cell).astype(np.int64), 0, last)
+        # One contiguous key range per (bucket, cell row)
+        buckets = np.arange(max(start, 0) // self.bucket_frames,
+                            min(stop - 1, self.n_frames - 1) // self.bucket_frames + 1)
+        cell_rows = np.arange(lo[1], hi[1] + 1)
+        base = ((buckets[:, None] * self.shape[1] + cell_rows[None, :]) * self.shape[0]).ravel()
+        first, last = self._grid_offsets[base + lo[0]], self._grid_offsets[base + hi[0] + 1]
+        candidates = np.concatenate([np.arange(a, b) for a, b in zip(first.tolist(), last.tolist()) if b > a]
+                                    or [np.zeros(0, dtype=np.int64)])
+        frames = self._grid_frame[candidates]
+        position = self._grid_position[candidates]
+        keep = (frames >= start) & (frames < stop) & (position[:, 0] >= x0) & (position[:, 0] <= x1) & \
+            (position[:, 1] >= y0) & (position[:, 1] <= y1)
+        return np.sort(self._grid_rows[candidates[keep]])
+
+    def radius(self, x, y, r, start, stop=None):
+        """Returns the log rows positioned within `r` of (x, y) in frames [start, stop) (one frame by default)."""
+        rows = self.rectangle(x - r, y - r, x + r, y + r, start, stop)
+        position = self.positions(rows)
+        return rows[np.hypot(position[:, 0] - x, position[:, 1] - y) <= r]
+
+    def neighbours(self, track_id, frame, r):
+        """Returns the log rows of the other players within `r` of `track_id` at `frame`."""
+        rows = self.track(track_id, frame, frame + 1)
+        if len(rows) == 0:
+            return rows
+        x, y = self.positions(rows)[0]
+        if not np.isfinite([x, y]).all():
+            return np.zeros(0, dtype=np.int64)
+        rows = self.radius(x, y, r, frame)
+        return rows[self.log.track_id[rows] != track_id]
+
+
+def synthetic_log(path, minutes=90, fps=25, players=22, seed=0):
+    """Writes a calibrated log of `players` random walks on a 105 x 68 m pitch, for the benchmark."""
+    from calibration import PitchCalibration
+    from tracking_log import TrackingLog
+    rng = np.random.default_rng(seed)
+    n_frames = int(minutes * 60 * fps)
+    log = TrackingLog(path, meta={"fps": fps}, calibration=PitchCalibration.from_scale(0.1, (1050, 680)))
+    position = rng.uniform([0, 0], [105, 68], (players, 2))
+    velocity = np.zeros((players, 2))
+    ids = np.arange(1, players + 1)
+    pixels = np.empty((players, 4))
+    for t in range(n_frames):
+        velocity = 0.95 * velocity + rng.normal(0, 0.02, (players, 2))
+        position = np.clip(position + velocity, [0, 0], [105, 68])
+        # Foot point of a 1 m x 2 m box at `position` with 10 pixels per metre
+        pixels[:, 0], pixels[:, 2] = position[:, 0] * 10 - 5, position[:, 0] * 10 + 5
+        pixels[:, 1], pixels[:, 3] = position[:, 1] * 10 - 20, position[:, 1] * 10
+        log.append(t, np.column_stack([pixels, ids]))
+    log.close()
+
+
+def parse_args():
+    """Parse input arguments."""
+    parser = argparse.ArgumentParser(description='Build a tracking log index and time its queries')
+    parser.add_argument("--log", type=str, default="tracking_log")
+    parser.add_argument("--index", type=str, default=None, help="Index directory; next to the log by default.")
+    parser.add_argument("--synthetic_minutes", type=float, default=0,
+                        help="Write a synthetic calibrated match of this length to --log first.")
+    parser.add_argument("--queries", type=int, default=200)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.synthetic_minutes:
+        synthetic_log(args.log, args.synthetic_minutes)
+    start = time.perf_counter()
+    index = build_index(args.log, args.index)
+    print(f"Indexed {len(index.log)} rows, {index.n_frames} frames, {len(index.track_ids)} tracks "
+          f"in {time.perf_counter() - start:.2f}s ({index.space})")
+
+    rng = np.random.default_rng(0)
+    frames = rng.integers(0, max(index.n_frames - 1500, 1), args.queries)
+    track_ids = rng.choice(np.asarray(index.track_ids), args.queries)
+    centre = index.origin + np.array(index.shape) * index.cell / 2
+    span = 5 * index.cell
+    queries = {
+        "track 1500 frames": lambda i: index.trajectory(track_ids[i], frames[i], frames[i] + 1500),
+        "radius, one frame": lambda i: index.radius(centre[0], centre[1], span, frames[i]),
+        "rectangle, 1500 frames": lambda i: index.rectangle(centre[0] - span, centre[1] - span,
+                                                            centre[0] + span, centre[1] + span,
+                                                            frames[i], frames[i] + 1500),
+        "neighbours": lambda i: index.neighbours(track_ids[i], frames[i], span),
+    }
+    for name, query in queries.items():
+        latency = np.empty(args.queries)
+        for i in range(args.queries):
+            t = time.perf_counter()
+            query(i)
+            latency[i] = time.perf_counter() - t
+        print(f"{name:24s} p50 {np.percentile(latency, 50) * 1e3:7.3f} ms  p99 {np.percentile(latency, 99) * 1e3:7.3f} ms")
@@ -0,0 +1,160 @@
+"""
+Append-only, typed tracking log.
+
+One row per tracked box: int32 frame, int32 track ID, float32 bbox, float32
+detection score, a uint8 flag telling whether the box comes from a detector
+update or was predicted between keyframes (see `cadence.py`) and the float32
+pitch position in metres of the player's foot point, NaN when no pitch
+calibration was given (see `calibration.py`). Rows are buffered in
+preallocated chunks and full chunks are flushed to a memory-mappable columnar
+table (see `columnar.py`), so a full match costs 37 bytes per row on disk and a constant amount of RAM while it is
+being written. `TrackingLogReader` maps the table back without copying and can
+be passed directly to `FootballHeatmap.bin_players` and the kinematics code.
+"""
+import numpy as np
+
+from columnar import ColumnWriter, open_columns
+
+TRACKING_COLUMNS = {
+    "frame": np.int32,
+    "track_id": np.int32,
+    "bbox": (np.float32, 4),
+    "conf": np.float32,
+    "detected": np.uint8,
+    "pitch": (np.float32, 2),
+}
+
+
+class TrackingLog:
+    """
+    Writes tracker output frame by frame.
+
+    Args:
+        path (str): Directory of the log table.
+        chunk_rows (int): Rows kept in memory before a chunk is flushed.
+        meta (dict): Extra metadata stored with the log, e.g. fps.
+        append (bool): Continue an existing log instead of truncating it.
+        rows (int): With `append`, rows to keep, e.g. those covered by a checkpoint.
+        calibration (PitchCalibration): Projects every box to pitch metres;
+            stored in the metadata.
+    """
+
+    def __init__(self, path="tracking_log", chunk_rows=65536, meta=None, append=False, calibration=None,
+                 rows=None):
+        self.path = path
+        self.calibration = calibration
+        if calibration is not None:
+            meta = dict(meta or {}, calibration=calibration.to_dict())
+        self._writer = ColumnWriter(path, TRACKING_COLUMNS, chunk_rows=chunk_rows,
+                                    meta=meta, append=append, rows=rows)
+
+    def __len__(self):
+        return len(self._writer)
+
+    def append(self, frame, resultsTracker, scores=None, detected=True):
+        """
+        Appends one frame of tracker output.
+
+        Args:
+            frame (int): Video frame index.
+            resultsTracker (np.ndarray): (N, 5) array [x1, y1, x2, y2, track_id].
+            scores (np.ndarray): Optional (N,) detection scores, NaN when missing.
+            detected (bool): False when the frame's boxes were predicted, not detected.
+        """
+        results = np.asarray(resultsTracker).reshape(-1, 5)
+        if len(results) == 0:
+            return
+        if scores is None:
+            scores = np.full(len(results), np.nan)
+        pitch = self.calibration.project_boxes(results[:, :4]) if self.calibration is not None else np.nan
+        self._writer.append(frame=frame, track_id=results[:, 4], bbox=results[:, :4], conf=scores,
+                            detected=detected, pitch=pitch)
+
+    def extend(self, frame, track_id, bbox, conf, detected=True, pitch=np.nan):
+        """Appends a block of rows spanning any number of frames, e.g. copied from another log."""
+        if len(track_id) == 0:
+            return
+        self._writer.append(frame=frame, track_id=track_id, bbox=bbox, conf=conf, detected=detected,
+                            pitch=pitch)
+
+    def flush(self):
+        """Writes buffered rows so readers can see them."""
+        self._writer.flush()
+
+    def close(self):
+        self._writer.close()
+
+    def reader(self):
+        """Flushes and returns a `TrackingLogReader` over everything written so far."""
+        self.flush()
+        return TrackingLogReader(self.path)
+
+
+class TrackingLogReader:
+    """
+    Zero-copy view of a tracking log.
+
+    Columns are `np.memmap` arrays. Indexing with 'frame', 'track_id' (or
+    'player_id'), 'x' or 'y' returns a column, with x and y the box centre, so
+    the reader can stand in for the old tracking DataFrame; 'pitch_x' and
+    'pitch_y' are the pitch position in metres. Logs written before the
+    `detected` and `pitch` columns existed read as all detected and
+    uncalibrated.
+    """
+
+    def __init__(self, path="tracking_log"):
+        self.path = path
+        columns, self.meta = open_columns(path)
+        self.frame = columns["frame"]
+        self.track_id = columns["track_id"]
+        self.bbox = columns["bbox"]
+        self.conf = columns["conf"]
+        self.detected = columns["detected"] if "detected" in columns else np.ones(len(self.frame), dtype=np.uint8)
+        self.pitch = columns["pitch"] if "pitch" in columns else np.full((len(self.frame), 2), np.nan, np.float32)
+        self.calibrated = "calibration" in self.meta
+
+    def __len__(self):
+        return len(self.frame)
+
+    def centers(self):
+        """Returns the (n, 2) float32 box centres."""
+        return (self.bbox[:, :2] + self.bbox[:, 2:]) / 2
+
+    def __getitem__(self, key):
+        if key == "frame":
+            return self.frame
+        if key in ("track_id", "player_id"):
+            return self.track_id
+        if key == "x":
+            return (self.bbox[:, 0] + self.bbox[:, 2]) / 2
+        if key == "y":
+            return (self.bbox[:, 1] + self.bbox[:, 3]) / 2
+        if key == "conf":
+            return self.conf
+        if key == "detected":
+            return self.detected
+        if key == "pitch_x":
+            return self.pitch[:, 0]
+        if key == "pitch_y":
+            return self.pitch[:, 1]
+        raise KeyError(key)
+
+    def frame_range(self, start, stop):
+        """Returns the row slice covering frames [start, stop); rows are in frame order."""
+        lo, hi = np.searchsorted(self.frame, [start, stop])
+        return slice(int(lo), int(hi))
+
+    def to_dataframe(self):
+        """Loads the log into a pandas DataFrame with the legacy column names."""
+        import pandas as pd
+        return pd.DataFrame({
+            "player_id": np.asarray(self.track_id),
+            "x": self["x"],
+            "y": self["y"],
+            "frame": np.asarray(self.frame),
+            "x1": self.bbox[:, 0], "y1": self.bbox[:, 1],
+            "x2": self.bbox[:, 2], "y2": self.bbox[:, 3],
+            "conf": np.asarray(self.conf),
+            "detected": np.asarray(self.detected, dtype=bool),
+            "pitch_x": self.pitch[:, 0], "pitch_y": self.pitch[:, 1],
+        })